@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Department, Position, Employee, Attendance, LeaveRequest, SalaryRecord
+from .models import Department, Position, Employee, Attendance, LeaveRequest, SalaryRecord, HolidayCalendar, ExportJob, EmploymentEvent
 
 
 @admin.register(Department)
@@ -52,3 +52,31 @@ class SalaryRecordAdmin(admin.ModelAdmin):
     list_filter = ['year', 'month', 'employee__department']
     search_fields = ['employee__name', 'employee__employee_id']
     ordering = ['-year', '-month', 'employee']
+
+
+@admin.register(HolidayCalendar)
+class HolidayCalendarAdmin(admin.ModelAdmin):
+    list_display = ['date', 'day_type', 'name', 'source', 'updated_at']
+    list_filter = ['day_type', 'source']
+    search_fields = ['name']
+    ordering = ['-date']
+    date_hierarchy = 'date'
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'kind', 'dataset', 'export_format', 'status', 'progress', 'total', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind', 'dataset']
+    search_fields = ['user__username', 'spec_hash']
+    ordering = ['-created_at']
+    readonly_fields = ['spec_hash', 'file_path', 'file_size', 'error', 'created_at', 'started_at', 'finished_at', 'expires_at']
+
+
+@admin.register(EmploymentEvent)
+class EmploymentEventAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'event_type', 'event_date', 'department_id', 'from_department_id', 'note', 'created_by', 'created_at']
+    list_filter = ['event_type']
+    search_fields = ['employee__name', 'employee__employee_id', 'note']
+    ordering = ['-event_date', '-id']
+    date_hierarchy = 'event_date'
+    readonly_fields = ['created_by', 'created_at']
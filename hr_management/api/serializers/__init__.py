@@ -54,6 +54,9 @@ from .optimized import (
     BulkApproveSerializer,
 )
 
+# 预加载规划
+from .prefetch import PrefetchPlan, get_prefetch_plan, plan_queryset
+
 __all__ = [
     # Read
     'DepartmentSerializer',
@@ -102,4 +105,8 @@ __all__ = [
     'TravelExpenseListSerializer',
     'BulkIdSerializer',
     'BulkApproveSerializer',
+    # Prefetch planning
+    'PrefetchPlan',
+    'get_prefetch_plan',
+    'plan_queryset',
 ]
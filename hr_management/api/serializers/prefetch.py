@@ -0,0 +1,123 @@
+"""
+序列化器预加载规划 - 按读取序列化器的嵌套结构生成 select_related / prefetch_related / annotate
+
+遍历序列化器字段树：
+- 单值关联（外键、一对一）的嵌套序列化器与点号 source（如 'employee.department.name'）：select_related 连表
+- 多值关联（多对多、反向外键）的嵌套序列化器与 many=True 的关联字段：prefetch_related
+- 方法字段用到的关联由序列化器类属性声明：select_related_fields / prefetch_related_fields
+- 声明了 annotated_fields 的嵌套序列化器（如部门的子部门数）改为 Prefetch(queryset=...annotate(...))，
+  其下级关联放进该 Prefetch 的查询集
+
+规划结果按序列化器类缓存。列表接口的查询数只与序列化器结构有关，与每页条数无关。
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField
+
+
+class PrefetchPlan:
+    def __init__(self, model):
+        self.model = model
+        self.select_related: List[str] = []
+        self.prefetch_related: List[str] = []
+        self.annotations: Dict[str, Any] = {}
+        self.nested: List[Tuple[str, 'PrefetchPlan']] = []  # (关联路径, 子查询集规划)
+
+    def _add(self, items: List[str], path: str) -> None:
+        if path not in items:
+            items.append(path)
+
+    def apply(self, queryset):
+        """应用到查询集（查询集原有的 select_related 会被规划结果替换）"""
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        # 已 select_related 的关联不会再被 Prefetch 覆盖，这里以规划结果为准
+        queryset = queryset.select_related(None)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        lookups = list(self.prefetch_related) + [
+            Prefetch(path, queryset=plan.apply(plan.model._default_manager.all()))
+            for path, plan in self.nested
+        ]
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+    def describe(self) -> Dict[str, Any]:
+        """规划结果（调试用）"""
+        return {
+            'select_related': list(self.select_related),
+            'prefetch_related': list(self.prefetch_related),
+            'annotations': sorted(self.annotations),
+            'nested': {path: plan.describe() for path, plan in self.nested},
+        }
+
+
+def _relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _walk(serializer, model, prefix: str, plan: PrefetchPlan) -> None:
+    serializer_class = type(serializer)
+    for path in getattr(serializer_class, 'select_related_fields', ()):
+        plan._add(plan.select_related, prefix + path)
+    for path in getattr(serializer_class, 'prefetch_related_fields', ()):
+        plan._add(plan.prefetch_related, prefix + path)
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        child = field.child if isinstance(field, serializers.ListSerializer) else field
+        source_attrs = field.source.split('.')
+
+        relation = _relation(model, source_attrs[0])
+        if relation is None:
+            continue
+        path = prefix + source_attrs[0]
+        many = relation.many_to_many or relation.one_to_many
+
+        if isinstance(child, serializers.ModelSerializer) and len(source_attrs) == 1:
+            if many or getattr(type(child), 'annotated_fields', None):
+                nested = PrefetchPlan(relation.related_model)
+                nested.annotations.update(getattr(type(child), 'annotated_fields', {}))
+                _walk(child, relation.related_model, '', nested)
+                if not any(existing == path for existing, _ in plan.nested):
+                    plan.nested.append((path, nested))
+            else:
+                plan._add(plan.select_related, path)
+                _walk(child, relation.related_model, path + '__', plan)
+        elif isinstance(field, ManyRelatedField) or many:
+            plan._add(plan.prefetch_related, path)
+        elif len(source_attrs) > 1:
+            # 点号 source：沿单值关联连表，直到遇到非关联字段
+            related_model = relation.related_model
+            plan._add(plan.select_related, path)
+            for attr in source_attrs[1:]:
+                relation = _relation(related_model, attr)
+                if relation is None or relation.many_to_many or relation.one_to_many:
+                    break
+                path = f'{path}__{attr}'
+                related_model = relation.related_model
+                plan._add(plan.select_related, path)
+
+
+@lru_cache(maxsize=None)
+def get_prefetch_plan(serializer_class) -> PrefetchPlan:
+    model = serializer_class.Meta.model
+    plan = PrefetchPlan(model)
+    plan.annotations.update(getattr(serializer_class, 'annotated_fields', {}))
+    _walk(serializer_class(), model, '', plan)
+    return plan
+
+
+def plan_queryset(queryset, serializer_class):
+    """按读取序列化器的结构为查询集补齐预加载"""
+    return get_prefetch_plan(serializer_class).apply(queryset)
@@ -17,7 +17,7 @@ from .attendance import (
     AttendanceCheckAPIView, attendance_today, attendance_my,
     attendance_supplement_list, attendance_supplement_pending, attendance_supplement_approve,
     attendance_workday,
-    CheckInLocationListCreateAPIView, CheckInLocationDetailAPIView, checkin_locations_active,
+    CheckInLocationListCreateAPIView, CheckInLocationDetailAPIView, checkin_locations_active, checkin_locations_validate,
     attendance_alerts
 )
 from .leaves import (
@@ -40,9 +40,12 @@ from .system import (
     SystemLogListAPIView, system_log_clear,
     CompanyDocumentListCreateAPIView, CompanyDocumentDetailAPIView,
     backups_list, backup_create, backup_clean, backup_restore,
-    health_check, health_report, system_metrics, apm_overview
+    health_check, health_report, system_metrics, apm_overview, apm_prometheus
+)
+from .export import (
+    export_employees, export_salaries, export_attendance, export_leaves, export_my_salary_slip, export_salary_template,
+    export_jobs_list, export_job_detail, export_job_download
 )
-from .export import export_employees, export_salaries, export_attendance, export_leaves, export_my_salary_slip, export_salary_template
 from .import_data import (
     EmployeeImportAPIView, AttendanceImportAPIView, SalaryImportAPIView,
     ImportTemplateAPIView
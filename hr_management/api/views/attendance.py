@@ -1,71 +1,42 @@
 """考勤管理 API 视图"""
-import math
 from rest_framework import generics, permissions, views
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 
 from .base import LoggingMixin
 from ...models import Employee, Attendance, AttendanceSupplement, CheckInLocation
+from ...geofence import geofence_index, haversine
+from ...checkin import CHECKIN_EMPLOYEE_FIELDS, get_checkin_employee, get_day_context, serialize_checkin
+from ...tasks import log_user_action
 from ...permissions import IsStaffOrOwnRelated, get_managed_department_ids, HasRBACPermission
 from ...rbac import Permissions
+from ...pagination import KeysetPagination, paginate_rows
 from ...utils import (
     log_event, api_success, api_error, get_client_ip,
-    is_workday, get_attendance_cutoff_times, strip_auto_absent_note,
+    strip_auto_absent_note,
+)
+from ..serializers import (
+    AttendanceSerializer, AttendanceWriteSerializer, CheckInLocationSerializer, CheckInLocationWriteSerializer,
+    plan_queryset,
 )
-from ..serializers import AttendanceSerializer, AttendanceWriteSerializer, CheckInLocationSerializer, CheckInLocationWriteSerializer
 
 
 def calculate_distance(lat1, lng1, lat2, lng2):
     """使用 Haversine 公式计算两点间距离（米）"""
-    R = 6371000  # 地球半径（米）
-
-    lat1_rad = math.radians(float(lat1))
-    lat2_rad = math.radians(float(lat2))
-    delta_lat = math.radians(float(lat2) - float(lat1))
-    delta_lng = math.radians(float(lng2) - float(lng1))
-
-    a = math.sin(delta_lat / 2) ** 2 + \
-        math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    return R * c
+    return haversine(float(lat1), float(lng1), float(lat2), float(lng2))
 
 
 def check_location_in_range(latitude, longitude, employee=None):
     """
-    检查给定位置是否在签到地点范围内
+    检查给定位置是否在签到地点范围内（进程内网格索引，不查询数据库）
     如果员工关联了考勤地点，则只检查关联的地点
     否则检查所有启用的签到地点
     返回: (是否在范围内, 最近的签到点, 距离)
     """
-    # 判断使用哪些签到地点
-    if employee and employee.checkin_locations.exists():
-        # 员工有关联的考勤地点，只检查关联的且启用的地点
-        active_locations = employee.checkin_locations.filter(is_active=True)
-    else:
-        # 没有关联，使用所有启用的签到地点
-        active_locations = CheckInLocation.objects.filter(is_active=True)
-
-    if not active_locations.exists():
-        # 没有设置签到地点，允许任何位置签到
-        return True, None, 0
-
-    min_distance = float('inf')
-    nearest_location = None
-
-    for loc in active_locations:
-        distance = calculate_distance(latitude, longitude, loc.latitude, loc.longitude)
-        if distance < min_distance:
-            min_distance = distance
-            nearest_location = loc
-
-        # 如果在任一签到点范围内，返回成功
-        if distance <= loc.radius:
-            return True, loc, distance
-
-    return False, nearest_location, min_distance
+    return geofence_index.locate(float(latitude), float(longitude), employee.id if employee else None)
 
 
 class AttendanceListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
@@ -78,6 +49,8 @@ class AttendanceListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
     """
     serializer_class = AttendanceSerializer
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date', '-id')
     log_model_name = '考勤'
 
     # RBAC 权限
@@ -87,7 +60,7 @@ class AttendanceListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
         return [Permissions.ATTENDANCE_VIEW]
 
     def get_queryset(self):
-        qs = Attendance.objects.select_related('employee', 'employee__department').all().order_by('-date')
+        qs = plan_queryset(Attendance.objects.all(), AttendanceSerializer).order_by('-date')
         user = self.request.user
 
         # 管理员/人事可看所有
@@ -175,12 +148,15 @@ class AttendanceDetailAPIView(LoggingMixin, generics.RetrieveUpdateDestroyAPIVie
 
 
 class AttendanceCheckAPIView(views.APIView):
-    """签到/签退接口"""
+    """签到/签退接口
+
+    早高峰快速路径：员工信息与当日上下文来自热缓存（checkin 模块），位置校验走进程内
+    地理围栏索引，首次签到直接 INSERT（已存在记录时回退为读取 + 更新），审计日志异步写入。
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        from django.db import IntegrityError
-        import datetime
+        import logging
 
         action = request.data.get('action')
         if action not in ['check_in', 'check_out', 'update_check_out']:
@@ -189,31 +165,25 @@ class AttendanceCheckAPIView(views.APIView):
         notes = request.data.get('notes') or ''
         employee_id = request.data.get('employee_id') if request.user.is_staff else None
 
-        # 先获取员工信息
-        try:
-            if employee_id and request.user.is_staff:
-                emp = Employee.objects.prefetch_related('checkin_locations').get(id=employee_id)
-            else:
-                emp = Employee.objects.prefetch_related('checkin_locations').get(user=request.user)
-        except Employee.DoesNotExist:
+        # 先获取员工信息（本人签到走按天缓存）
+        if employee_id:
+            emp = Employee.objects.filter(id=employee_id).values(*CHECKIN_EMPLOYEE_FIELDS).first()
+        else:
+            emp = get_checkin_employee(request.user.id)
+        if emp is None:
             return Response(api_error('当前账户未关联员工', code='no_employee'), status=400)
 
         # 检查入职状态：待入职员工不能签到
-        if emp.onboard_status != 'onboarded':
-            status_text = {'pending': '待入职', 'resigned': '已离职'}.get(emp.onboard_status, '未知')
+        if emp['onboard_status'] != 'onboarded':
+            status_text = {'pending': '待入职', 'resigned': '已离职'}.get(emp['onboard_status'], '未知')
             return Response(api_error(f'您当前状态为"{status_text}"，暂不能签到', code='not_onboarded'), status=403)
 
         # 获取位置信息
         latitude = request.data.get('latitude')
         longitude = request.data.get('longitude')
 
-        # 判断需要检查的签到地点
-        if emp.checkin_locations.exists():
-            # 员工有关联的考勤地点
-            need_location_check = emp.checkin_locations.filter(is_active=True).exists()
-        else:
-            # 没有关联，使用全局设置
-            need_location_check = CheckInLocation.objects.filter(is_active=True).exists()
+        # 判断需要检查的签到地点（员工有关联时只看关联地点，否则使用全局设置）
+        need_location_check = geofence_index.requires_location(emp['id'])
 
         if need_location_check:
             # 需要检查位置，必须提供位置信息
@@ -228,130 +198,138 @@ class AttendanceCheckAPIView(views.APIView):
 
             # 位置为 0,0 表示 HTTP 环境无法获取精确位置，跳过位置检查但记录日志
             if latitude == 0 and longitude == 0:
-                import logging
                 logger = logging.getLogger('hr_management')
-                logger.warning(f'员工 {emp.name}({emp.employee_id}) 使用默认位置(0,0)签到，可能是HTTP环境')
+                logger.warning(f'员工 {emp["name"]}({emp["employee_id"]}) 使用默认位置(0,0)签到，可能是HTTP环境')
             else:
                 # 检查是否在签到范围内
-                in_range, nearest_loc, distance = check_location_in_range(latitude, longitude, employee=emp)
+                in_range, nearest_loc, distance = geofence_index.locate(latitude, longitude, emp['id'])
                 if not in_range:
                     return Response(api_error(
                         f'您当前位置不在签到范围内。距离最近的签到点"{nearest_loc.name}"还有{int(distance)}米，允许范围{nearest_loc.radius}米',
                         code='out_of_range',
                         extra={'distance': int(distance), 'location': nearest_loc.name, 'radius': nearest_loc.radius}
                 ), status=400)
-        today = timezone.localdate()
-        local_now = timezone.localtime()
-        current_time = local_now.time()
-        cutoff_times = get_attendance_cutoff_times()
-        late_cutoff = cutoff_times['check_in_deadline']
-        early_leave_cutoff = cutoff_times['check_out_deadline']
 
+        today = timezone.localdate()
+        current_time = timezone.localtime().time()
         # 判断今天是否为工作日（休息日加班不判断迟到/早退）
-        is_today_workday = is_workday(today)
+        day = get_day_context(today)
+        is_today_workday = day.is_workday
 
         try:
-            rec = Attendance.objects.filter(employee=emp, date=today).first()
-
             if action == 'check_in':
-                if not rec:
-                    # 工作日9点后需要填写迟到原因，休息日加班不需要
-                    is_late = is_today_workday and current_time > late_cutoff
-                    if is_late and not notes.strip():
-                        return Response(api_error('签到已超过 09:00，请填写迟到原因', code='reason_required'), status=400)
-                    att_type = 'late' if is_late else 'check_in'
-                    # 迟到时添加标签
-                    formatted_notes = f'迟到原因：{notes}' if (is_late and notes) else (notes or ('加班' if not is_today_workday else ''))
-                    rec = Attendance(employee=emp, date=today, attendance_type=att_type, check_in_time=current_time, notes=formatted_notes)
-                    rec.save()
-                    action_text = '加班签到' if not is_today_workday else '签到'
-                    log_event(user=request.user, action=action_text, detail=f'{emp.employee_id} {today}', ip=get_client_ip(request))
-                else:
-                    if rec.check_in_time:
-                        return Response(api_error('已签到，不能重复签到', code='already_checked_in'), status=400)
-                    is_late = is_today_workday and current_time > late_cutoff
-                    if is_late and not notes.strip():
-                        return Response(api_error('签到已超过 09:00，请填写迟到原因', code='reason_required'), status=400)
-                    rec.check_in_time = current_time
-                    if rec.attendance_type in ('check_in', 'absent'):
-                        rec.attendance_type = 'late' if is_late else 'check_in'
-
-                    clean_notes = strip_auto_absent_note(rec.notes)
-                    note_parts = [clean_notes] if clean_notes else []
-                    if notes:
-                        note_parts.append(f'迟到原因：{notes}' if is_late else notes)
-                    elif not is_today_workday and not clean_notes:
-                        note_parts.append('加班')
-                    rec.notes = '\n'.join(part for part in note_parts if part).strip()
-                    rec.save(update_fields=['check_in_time', 'attendance_type', 'notes'])
-                    log_event(user=request.user, action='补签/更新签到', detail=f'{emp.employee_id} {today}', ip=get_client_ip(request))
-
+                rec, log, error = self._check_in(emp, today, current_time, notes, day)
             elif action == 'check_out':
-                if not rec or not rec.check_in_time:
-                    return Response(api_error('尚未签到，不能签退', code='no_record'), status=400)
-
-                is_update = rec.check_out_time is not None
-                # 休息日加班不判断早退
-                is_early_leave = is_today_workday and current_time < early_leave_cutoff
-
-                # 首次签退且早退需要填写原因
-                if not is_update and is_early_leave and not notes.strip():
-                    return Response(api_error('签退时间早于 18:00，请填写早退原因', code='reason_required'), status=400)
-
-                rec.check_out_time = current_time
-                # 若当天已标记迟到，则不覆盖为早退/签退
-                if rec.attendance_type != 'late':
-                    if is_early_leave:
-                        rec.attendance_type = 'early_leave'
-                    elif rec.attendance_type == 'check_in':
-                        rec.attendance_type = 'check_out'
-                # 追加早退原因，不覆盖之前的迟到原因
-                if notes:
-                    formatted_note = f'早退原因：{notes}' if is_early_leave else notes
-                    if rec.notes:
-                        rec.notes = rec.notes + '\n' + formatted_note
-                    else:
-                        rec.notes = formatted_note
-                rec.save(update_fields=['check_out_time', 'attendance_type', 'notes'])
-                action_text = '更新签退' if is_update else '签退'
-                log_event(user=request.user, action=action_text, detail=f'{emp.employee_id} {today}', ip=get_client_ip(request))
-
-            elif action == 'update_check_out':
-                if not rec or not rec.check_in_time:
-                    return Response(api_error('尚未签到，无法更新签退时间', code='no_record'), status=400)
-                if not rec.check_out_time:
-                    return Response(api_error('尚未签退，请先签退', code='not_checked_out'), status=400)
-                old_time = rec.check_out_time
-                rec.check_out_time = current_time
-
-                # 如果更新时间在18:00后且之前是早退，改为正常签退并清除早退原因
-                if current_time >= early_leave_cutoff and rec.attendance_type == 'early_leave':
-                    rec.attendance_type = 'check_out'
-                    # 清除早退原因
-                    if rec.notes:
-                        # 移除早退原因部分，保留其他备注（如迟到原因）
-                        lines = rec.notes.split('\n')
-                        filtered = [line for line in lines if not line.startswith('早退原因：')]
-                        rec.notes = '\n'.join(filtered).strip() or ''
-
-                # 追加备注，不覆盖之前的原因
-                if notes:
-                    if rec.notes:
-                        rec.notes = rec.notes + ' | ' + notes
-                    else:
-                        rec.notes = notes
-                rec.save(update_fields=['check_out_time', 'attendance_type', 'notes'])
-                log_event(user=request.user, action='更新签退时间', detail=f'{emp.employee_id} {today} {old_time}->{current_time}', ip=get_client_ip(request))
-
+                rec, log, error = self._check_out(emp, today, current_time, notes, day)
+            else:
+                rec, log, error = self._update_check_out(emp, today, current_time, notes, day)
         except IntegrityError:
-            rec = Attendance.objects.filter(employee=emp, date=today).first()
-            if rec:
-                return Response(api_error('已签到，不能重复签到', code='already_checked_in'), status=400)
             return Response(api_error('操作失败，请重试', code='db_error'), status=500)
         except Exception as e:
             return Response(api_error(f'操作失败: {str(e)}', code='error'), status=500)
 
-        return Response(api_success(AttendanceSerializer(rec).data))
+        if error:
+            return Response(api_error(error[0], code=error[1]), status=400)
+
+        # 审计日志交给后台线程，不阻塞签到响应
+        action_text, extra = log
+        detail = f'{emp["employee_id"]} {today} {extra}'.strip()
+        log_user_action(request.user.id, action_text, detail, get_client_ip(request))
+        return Response(api_success(serialize_checkin(rec, emp, is_today_workday)))
+
+    def _check_in(self, emp, today, current_time, notes, day):
+        # 工作日9点后需要填写迟到原因，休息日加班不需要
+        is_late = day.is_workday and current_time > day.check_in_deadline
+        if is_late and not notes.strip():
+            return None, None, ('签到已超过 09:00，请填写迟到原因', 'reason_required')
+
+        # 绝大多数情况下当天尚无记录：直接插入，唯一约束冲突时再走更新
+        att_type = 'late' if is_late else 'check_in'
+        formatted_notes = f'迟到原因：{notes}' if (is_late and notes) else (notes or ('加班' if not day.is_workday else ''))
+        rec = Attendance(employee_id=emp['id'], date=today, attendance_type=att_type,
+                         check_in_time=current_time, notes=formatted_notes)
+        try:
+            with transaction.atomic():
+                rec.save(force_insert=True)
+            return rec, ('加班签到' if not day.is_workday else '签到', ''), None
+        except IntegrityError:
+            pass
+
+        # 已有记录（如自动缺勤标记、补签）：仅在尚未签到时更新
+        rec = Attendance.objects.filter(employee_id=emp['id'], date=today).first()
+        if rec is None or rec.check_in_time:
+            return None, None, ('已签到，不能重复签到', 'already_checked_in')
+        rec.check_in_time = current_time
+        if rec.attendance_type in ('check_in', 'absent'):
+            rec.attendance_type = att_type
+
+        clean_notes = strip_auto_absent_note(rec.notes)
+        note_parts = [clean_notes] if clean_notes else []
+        if notes:
+            note_parts.append(f'迟到原因：{notes}' if is_late else notes)
+        elif not day.is_workday and not clean_notes:
+            note_parts.append('加班')
+        rec.notes = '\n'.join(part for part in note_parts if part).strip()
+        rec.save(update_fields=['check_in_time', 'attendance_type', 'notes'])
+        return rec, ('补签/更新签到', ''), None
+
+    def _check_out(self, emp, today, current_time, notes, day):
+        rec = Attendance.objects.filter(employee_id=emp['id'], date=today).first()
+        if not rec or not rec.check_in_time:
+            return None, None, ('尚未签到，不能签退', 'no_record')
+
+        is_update = rec.check_out_time is not None
+        # 休息日加班不判断早退
+        is_early_leave = day.is_workday and current_time < day.check_out_deadline
+
+        # 首次签退且早退需要填写原因
+        if not is_update and is_early_leave and not notes.strip():
+            return None, None, ('签退时间早于 18:00，请填写早退原因', 'reason_required')
+
+        rec.check_out_time = current_time
+        # 若当天已标记迟到，则不覆盖为早退/签退
+        if rec.attendance_type != 'late':
+            if is_early_leave:
+                rec.attendance_type = 'early_leave'
+            elif rec.attendance_type == 'check_in':
+                rec.attendance_type = 'check_out'
+        # 追加早退原因，不覆盖之前的迟到原因
+        if notes:
+            formatted_note = f'早退原因：{notes}' if is_early_leave else notes
+            if rec.notes:
+                rec.notes = rec.notes + '\n' + formatted_note
+            else:
+                rec.notes = formatted_note
+        rec.save(update_fields=['check_out_time', 'attendance_type', 'notes'])
+        return rec, ('更新签退' if is_update else '签退', ''), None
+
+    def _update_check_out(self, emp, today, current_time, notes, day):
+        rec = Attendance.objects.filter(employee_id=emp['id'], date=today).first()
+        if not rec or not rec.check_in_time:
+            return None, None, ('尚未签到，无法更新签退时间', 'no_record')
+        if not rec.check_out_time:
+            return None, None, ('尚未签退，请先签退', 'not_checked_out')
+        old_time = rec.check_out_time
+        rec.check_out_time = current_time
+
+        # 如果更新时间在18:00后且之前是早退，改为正常签退并清除早退原因
+        if current_time >= day.check_out_deadline and rec.attendance_type == 'early_leave':
+            rec.attendance_type = 'check_out'
+            # 清除早退原因
+            if rec.notes:
+                # 移除早退原因部分，保留其他备注（如迟到原因）
+                lines = rec.notes.split('\n')
+                filtered = [line for line in lines if not line.startswith('早退原因：')]
+                rec.notes = '\n'.join(filtered).strip() or ''
+
+        # 追加备注，不覆盖之前的原因
+        if notes:
+            if rec.notes:
+                rec.notes = rec.notes + ' | ' + notes
+            else:
+                rec.notes = notes
+        rec.save(update_fields=['check_out_time', 'attendance_type', 'notes'])
+        return rec, ('更新签退时间', f'{old_time}->{current_time}'), None
 
 
 @api_view(['GET'])
@@ -390,7 +368,7 @@ def attendance_workday(request):
         if holiday_info.get('type') == 1:
             holiday_name = '周末'
         elif holiday_info.get('type') == 2:
-            holiday_name = holiday_info.get('name', '节假日')
+            holiday_name = holiday_info.get('holiday_name') or '节假日'
 
     return Response(api_success({
         'date': str(today),
@@ -408,7 +386,7 @@ def attendance_my(request):
     except Employee.DoesNotExist:
         return Response(api_error('当前账户未关联员工', code='no_employee'), status=400)
 
-    qs = Attendance.objects.filter(employee=emp).select_related('employee', 'employee__department').order_by('-date')
+    qs = plan_queryset(Attendance.objects.filter(employee=emp), AttendanceSerializer).order_by('-date')
 
     # 支持日期筛选
     date_from = request.query_params.get('date_from')
@@ -434,10 +412,8 @@ def attendance_supplement_list(request):
         return Response(api_error('当前账户未关联员工', code='no_employee'), status=400)
 
     if request.method == 'GET':
-        qs = AttendanceSupplement.objects.filter(employee=emp).order_by('-created_at')
-        data = []
-        for item in qs:
-            data.append({
+        def serialize(item):
+            return {
                 'id': item.id,
                 'date': str(item.date),
                 'time': item.time.strftime('%H:%M:%S') if item.time else '',
@@ -447,8 +423,14 @@ def attendance_supplement_list(request):
                 'comments': item.comments,
                 'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else '',
                 'approved_at': item.approved_at.strftime('%Y-%m-%d %H:%M:%S') if item.approved_at else None,
-            })
-        return Response(api_success(data))
+            }
+
+        qs = AttendanceSupplement.objects.filter(employee=emp)
+        # 带 cursor/page 参数时分页，否则返回全部（兼容旧前端）
+        page = paginate_rows(request, qs, ('-created_at', '-id'), serialize)
+        if page is not None:
+            return Response(api_success(page))
+        return Response(api_success([serialize(item) for item in qs.order_by('-created_at')]))
 
     elif request.method == 'POST':
         date_str = request.data.get('date')
@@ -518,13 +500,12 @@ def attendance_supplement_pending(request):
     status_filter = request.query_params.get('status', 'pending')
 
     if status_filter == 'all':
-        qs = AttendanceSupplement.objects.select_related('employee').order_by('-created_at')
+        qs = AttendanceSupplement.objects.select_related('employee')
     else:
-        qs = AttendanceSupplement.objects.filter(status=status_filter).select_related('employee').order_by('-created_at')
+        qs = AttendanceSupplement.objects.filter(status=status_filter).select_related('employee')
 
-    results = []
-    for item in qs:
-        results.append({
+    def serialize(item):
+        return {
             'id': item.id,
             'employee_id': item.employee.employee_id,
             'employee_name': item.employee.name,
@@ -534,7 +515,12 @@ def attendance_supplement_pending(request):
             'reason': item.reason,
             'status': item.status,
             'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else '',
-        })
+        }
+
+    page = paginate_rows(request, qs, ('-created_at', '-id'), serialize)
+    if page is not None:
+        return Response(api_success(page))
+    results = [serialize(item) for item in qs.order_by('-created_at')]
     return Response(api_success({'count': len(results), 'results': results}))
 
 
@@ -709,6 +695,50 @@ def checkin_locations_active(request):
     return Response(api_success(data))
 
 
+MAX_LOCATION_BATCH = 500
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def checkin_locations_validate(request):
+    """批量校验坐标是否在签到范围内（移动端离线签到同步前使用）
+
+    请求体: {"points": [{"latitude": .., "longitude": ..}, ...], "employee_id": 可选，仅管理员}
+    """
+    points = request.data.get('points')
+    if not isinstance(points, list) or not points:
+        return Response(api_error('points 必须为非空数组', code='invalid_points'), status=400)
+    if len(points) > MAX_LOCATION_BATCH:
+        return Response(api_error(f'单次最多校验 {MAX_LOCATION_BATCH} 个坐标', code='too_many_points'), status=400)
+
+    employee_id = request.data.get('employee_id') if request.user.is_staff else None
+    if employee_id is not None:
+        try:
+            employee_id = int(employee_id)
+        except (TypeError, ValueError):
+            return Response(api_error('employee_id 格式错误', code='invalid_employee'), status=400)
+    else:
+        employee_id = Employee.objects.filter(user=request.user).values_list('id', flat=True).first()
+
+    coords = []
+    for i, point in enumerate(points):
+        try:
+            coords.append((float(point['latitude']), float(point['longitude'])))
+        except (KeyError, TypeError, ValueError):
+            return Response(api_error(f'第 {i + 1} 个坐标格式错误', code='invalid_location'), status=400)
+
+    results = []
+    for (in_range, fence, distance) in geofence_index.locate_many(coords, employee_id):
+        results.append({
+            'in_range': in_range,
+            'location_id': fence.id if fence else None,
+            'location': fence.name if fence else None,
+            'radius': fence.radius if fence else None,
+            'distance': int(distance),
+        })
+    return Response(api_success(results))
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def attendance_alerts(request):
@@ -2,14 +2,18 @@
 from rest_framework import permissions, views
 from rest_framework.response import Response
 from django.utils import timezone
-from django.db.models import Sum, Count, Avg, Q, F, Value, CharField
-from django.db.models.functions import TruncMonth, TruncDate, ExtractWeekDay, Concat
-from datetime import timedelta, date, datetime
+from django.db.models import Sum, Count, Q, F, Value, CharField, Case, When, IntegerField
+from django.db.models.functions import TruncMonth, TruncDate, ExtractWeekDay, Concat, Coalesce
+from datetime import timedelta, datetime
 from decimal import Decimal
 
-from ...models import Employee, Department, Attendance, LeaveRequest, SalaryRecord
+from ...models import (
+    Employee, AttendanceDailyStat, HeadcountSnapshot, LeaveRequest, PayrollMonthlyStat, SalaryRecord,
+)
 from ...permissions import HasRBACPermission
+from ...rollup import DepartmentRollup
 from ...rbac import Permissions
+from ...utils import workdays_between, workday_mask
 
 
 class BIDepartmentCostAPIView(views.APIView):
@@ -17,12 +21,6 @@ class BIDepartmentCostAPIView(views.APIView):
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
     rbac_perms = [Permissions.BI_DEPARTMENT_COST]
 
-    def _get_all_descendant_ids(self, dept):
-        ids = [dept.id]
-        for child in dept.children.all():
-            ids.extend(self._get_all_descendant_ids(child))
-        return ids
-
     def get(self, request):
         today = timezone.now().date()
         # 默认统计上个月
@@ -30,46 +28,30 @@ class BIDepartmentCostAPIView(views.APIView):
         year = idx // 12
         month = (idx % 12) + 1
 
-        top_depts = Department.objects.filter(parent__isnull=True)
-        items = []
-        grand_total = Decimal('0')
-
-        for dept in top_depts:
-            dept_ids = self._get_all_descendant_ids(dept)
-            emp_ids = list(Employee.objects.filter(
-                is_active=True, department_id__in=dept_ids
-            ).values_list('id', flat=True))
-
-            stats = SalaryRecord.objects.filter(
-                year=year, month=month, employee_id__in=emp_ids
-            ).aggregate(total=Sum('net_salary'), cnt=Count('id'), avg=Avg('net_salary'))
-
-            total = stats['total'] or Decimal('0')
-            grand_total += total
-            items.append({
-                'department': dept.name,
-                'headcount': len(emp_ids),
-                'total_salary': float(total),
-                'avg_salary': float(stats['avg'] or 0),
-                'count': stats['cnt'] or 0,
-            })
+        # 在职人数一次分组查询，薪资读月度汇总，再沿部门树汇总到顶级部门
+        tree = DepartmentRollup()
+        headcounts = tree.aggregate(Employee.objects.filter(is_active=True), headcount=Count('id'))
+        salaries = tree.aggregate(
+            PayrollMonthlyStat.objects.filter(year=year, month=month),
+            total=Sum('total_net'), cnt=Sum('record_count'),
+        )
 
+        groups = [(name, headcounts.total(dept_id), salaries.total(dept_id)) for dept_id, name in tree.top_level()]
         # 未分配部门
-        no_dept_ids = list(Employee.objects.filter(
-            is_active=True, department__isnull=True
-        ).values_list('id', flat=True))
-        if no_dept_ids:
-            stats = SalaryRecord.objects.filter(
-                year=year, month=month, employee_id__in=no_dept_ids
-            ).aggregate(total=Sum('net_salary'), cnt=Count('id'), avg=Avg('net_salary'))
-            total = stats['total'] or Decimal('0')
+        if headcounts.unassigned['headcount']:
+            groups.append(('未分配部门', headcounts.unassigned, salaries.unassigned))
+
+        items = []
+        grand_total = Decimal('0')
+        for name, headcount, stats in groups:
+            total = Decimal(stats['total'])
             grand_total += total
             items.append({
-                'department': '未分配部门',
-                'headcount': len(no_dept_ids),
+                'department': name,
+                'headcount': headcount['headcount'],
                 'total_salary': float(total),
-                'avg_salary': float(stats['avg'] or 0),
-                'count': stats['cnt'] or 0,
+                'avg_salary': float(total / stats['cnt']) if stats['cnt'] else 0,
+                'count': stats['cnt'],
             })
 
         # 计算占比
@@ -96,8 +78,8 @@ class BIAttendanceHeatmapAPIView(views.APIView):
         today = timezone.now().date()
         start = today - timedelta(days=days - 1)
 
-        # 按星期×考勤类型
-        qs = Attendance.objects.filter(date__gte=start, date__lte=today)
+        # 按星期×考勤类型（读考勤日汇总，每天每种类型一行）
+        qs = AttendanceDailyStat.objects.filter(date__gte=start, date__lte=today)
 
         weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
         type_labels = {'normal': '正常', 'late': '迟到', 'early_leave': '早退', 'absent': '缺勤'}
@@ -106,13 +88,13 @@ class BIAttendanceHeatmapAPIView(views.APIView):
         # 初始化 7×4 矩阵
         matrix = [[0] * len(type_labels) for _ in range(7)]
 
-        for row in qs.values('date', 'attendance_type'):
+        type_keys = list(type_labels.keys())
+        for row in qs.values('date', 'attendance_type').annotate(cnt=Sum('count')).order_by():
             wd = row['date'].weekday()  # 0=Mon
             at = type_map.get(row['attendance_type'], row['attendance_type'])
-            type_keys = list(type_labels.keys())
             if at in type_keys:
                 col = type_keys.index(at)
-                matrix[wd][col] += 1
+                matrix[wd][col] += row['cnt']
 
         return Response({
             'days': days,
@@ -132,38 +114,28 @@ class BITurnoverAPIView(views.APIView):
         months = max(3, min(months, 24))
         today = timezone.now().date()
 
+        # 月度人数快照一次分组查询（入职含复职，离职按生效日期，在职为月末人数）
+        HeadcountSnapshot.ensure_current()
+        end_index = today.year * 12 + today.month - 1
+        start_index = end_index - months + 1
+        monthly = {
+            (row['year'], row['month']): row
+            for row in HeadcountSnapshot.objects.filter(
+                year__gte=start_index // 12, year__lte=end_index // 12,
+            ).values('year', 'month').annotate(
+                active=Sum('headcount'), hires=Sum('hires'),
+                reactivations=Sum('reactivations'), resignations=Sum('resignations'),
+            ).order_by()
+        }
+
         results = []
-        for i in range(months - 1, -1, -1):
-            idx = today.year * 12 + today.month - 1 - i
+        for idx in range(start_index, end_index + 1):
             y = idx // 12
             m = (idx % 12) + 1
-
-            # 月初月末
-            month_start = date(y, m, 1)
-            if m == 12:
-                month_end = date(y, 12, 31)
-            else:
-                month_end = date(y, m + 1, 1) - timedelta(days=1)
-            if month_end > today:
-                month_end = today
-
-            # 入职人数（hire_date 在本月）
-            joined = Employee.objects.filter(
-                hire_date__gte=month_start, hire_date__lte=month_end
-            ).count()
-
-            # 离职人数（离职请假已批准，结束日期在本月）
-            left = LeaveRequest.objects.filter(
-                leave_type='resignation',
-                status='approved',
-                end_date__gte=month_start,
-                end_date__lte=month_end,
-            ).count()
-
-            # 月末在职人数
-            active_end = Employee.objects.filter(
-                is_active=True, created_at__date__lte=month_end
-            ).count()
+            row = monthly.get((y, m)) or {}
+            joined = (row.get('hires') or 0) + (row.get('reactivations') or 0)
+            left = row.get('resignations') or 0
+            active_end = row.get('active') or 0
 
             results.append({
                 'label': f'{y}-{str(m).zfill(2)}',
@@ -196,8 +168,6 @@ class BISalaryRangeAPIView(views.APIView):
         year = idx // 12
         month = (idx % 12) + 1
 
-        records = list(SalaryRecord.objects.filter(year=year, month=month).values_list('net_salary', flat=True))
-
         ranges = [
             (0, 3000, '0-3K'),
             (3000, 5000, '3K-5K'),
@@ -210,14 +180,23 @@ class BISalaryRangeAPIView(views.APIView):
             (50000, float('inf'), '50K+'),
         ]
 
-        distribution = []
-        for lo, hi, label in ranges:
-            count = sum(1 for s in records if s is not None and lo <= float(s) < hi)
-            distribution.append({'label': label, 'count': count})
+        # 一次查询：CASE WHEN 把每条记录映射到区间序号，再按序号分组计数
+        bucket = Case(
+            When(net_salary__lt=0, then=Value(-1)),
+            *[When(net_salary__lt=hi, then=Value(i)) for i, (_, hi, _) in enumerate(ranges[:-1])],
+            default=Value(len(ranges) - 1),
+            output_field=IntegerField(),
+        )
+        counts = dict(
+            SalaryRecord.objects.filter(year=year, month=month)
+            .annotate(bucket=bucket).values('bucket').annotate(cnt=Count('id')).order_by()
+            .values_list('bucket', 'cnt')
+        )
+        distribution = [{'label': label, 'count': counts.get(i, 0)} for i, (_, _, label) in enumerate(ranges)]
 
         return Response({
             'period': f'{year}-{str(month).zfill(2)}',
-            'total': len(records),
+            'total': sum(counts.values()),
             'distribution': distribution,
             'labels': [d['label'] for d in distribution],
             'values': [d['count'] for d in distribution],
@@ -229,52 +208,43 @@ class BILeaveBalanceAPIView(views.APIView):
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
     rbac_perms = [Permissions.BI_LEAVE_BALANCE]
 
-    def _get_all_descendant_ids(self, dept):
-        ids = [dept.id]
-        for child in dept.children.all():
-            ids.extend(self._get_all_descendant_ids(child))
-        return ids
-
     def get(self, request):
         days = int(request.query_params.get('days', 90))
         days = max(7, min(days, 365))
         since = timezone.now() - timedelta(days=days)
-
-        # 按部门统计请假天数
-        top_depts = Department.objects.filter(parent__isnull=True)
+        today = timezone.localdate()
+        # 统计窗口内的应出勤工作日数（位图前缀和，O(1)）
+        workdays = workdays_between(today - timedelta(days=days - 1), today)
+
+        # 按部门统计请假天数：在职人数与请假记录各一次分组查询，沿部门树汇总到顶级部门
+        tree = DepartmentRollup()
+        headcounts = tree.aggregate(Employee.objects.filter(is_active=True), headcount=Count('id'))
+        leaves = tree.aggregate(
+            LeaveRequest.objects.filter(created_at__gte=since, status='approved'),
+            'employee__department_id',
+            total_days=Sum('days'), total_count=Count('id'),
+        )
         dept_stats = []
 
-        for dept in top_depts:
-            dept_ids = self._get_all_descendant_ids(dept)
-            emp_ids = list(Employee.objects.filter(
-                department_id__in=dept_ids
-            ).values_list('id', flat=True))
-            emp_count = Employee.objects.filter(
-                is_active=True, department_id__in=dept_ids
-            ).count()
-
-            leave_data = LeaveRequest.objects.filter(
-                employee_id__in=emp_ids,
-                created_at__gte=since,
-                status='approved'
-            ).aggregate(
-                total_days=Sum('days'),
-                total_count=Count('id')
-            )
-
-            total_days = float(leave_data['total_days'] or 0)
+        for dept_id, name in tree.top_level():
+            emp_count = headcounts.total(dept_id)['headcount']
+            leave_data = leaves.total(dept_id)
+            total_days = float(leave_data['total_days'])
             dept_stats.append({
-                'department': dept.name,
+                'department': name,
                 'headcount': emp_count,
-                'leave_count': leave_data['total_count'] or 0,
+                'leave_count': leave_data['total_count'],
                 'leave_days': total_days,
                 'avg_days': round(total_days / emp_count, 1) if emp_count else 0,
+                # 请假天数占应出勤人天的比例
+                'leave_rate': round(total_days / (emp_count * workdays) * 100, 2) if emp_count and workdays else 0,
             })
 
         dept_stats.sort(key=lambda x: x['leave_days'], reverse=True)
 
         return Response({
             'days': days,
+            'workdays': workdays,
             'dept_stats': dept_stats,
             'labels': [d['department'] for d in dept_stats],
             'values': [d['leave_days'] for d in dept_stats],
@@ -292,27 +262,31 @@ class BIDailyAttendanceAPIView(views.APIView):
         today = timezone.now().date()
         start = today - timedelta(days=days - 1)
 
-        # 每日出勤统计
-        daily = Attendance.objects.filter(
-            date__gte=start, date__lte=today
+        # 每日出勤统计（读考勤日汇总）
+        daily = AttendanceDailyStat.objects.filter(
+            date__gte=start, date__lte=today, count__gt=0
         ).values('date').annotate(
-            total=Count('id'),
-            present=Count('id', filter=Q(
+            total=Sum('count'),
+            present=Coalesce(Sum('count', filter=Q(
                 attendance_type__in=['check_in', 'check_out', 'late', 'early_leave']
-            )),
-            late=Count('id', filter=Q(attendance_type='late')),
-            absent=Count('id', filter=Q(attendance_type='absent')),
+            )), 0),
+            late=Coalesce(Sum('count', filter=Q(attendance_type='late')), 0),
+            absent=Coalesce(Sum('count', filter=Q(attendance_type='absent')), 0),
         ).order_by('date')
 
+        mask = workday_mask(start, today)
+
         labels = []
         rates = []
         presents = []
         lates = []
         absents = []
         totals = []
+        workdays = []
 
         for row in daily:
             labels.append(row['date'].strftime('%m-%d'))
+            workdays.append(bool(mask[(row['date'] - start).days]))
             rate = round(row['present'] / row['total'] * 100, 1) if row['total'] else 0
             rates.append(rate)
             presents.append(row['present'])
@@ -328,4 +302,5 @@ class BIDailyAttendanceAPIView(views.APIView):
             'lates': lates,
             'absents': absents,
             'totals': totals,
+            'workdays': workdays,
         })
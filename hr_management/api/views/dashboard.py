@@ -2,54 +2,56 @@
 from rest_framework import permissions, views
 from rest_framework.response import Response
 from django.core.cache import cache
+from django.db.models import Sum
 from django.utils import timezone
 
-from ...models import Employee, Department, Position, Attendance, LeaveRequest, SalaryRecord, SystemLog, RBACPermission, Role
+from ...models import Employee, Department, Position, Attendance, AttendanceDailyStat, LeaveRequest, SalaryRecord, SystemLog, RBACPermission, Role
 from ...services import CacheKeys
+from ... import snapshot_cache
+
+
+def build_system_summary_data():
+    emp_total = Employee.objects.count()
+    emp_active = Employee.objects.filter(is_active=True).count()
+    dept_count = Department.objects.count()
+    pos_count = Position.objects.count()
+
+    current_time = timezone.localtime()
+    today = timezone.localdate()
+    last7 = today - timezone.timedelta(days=6)
+    attendance_7d = AttendanceDailyStat.objects.filter(
+        date__gte=last7, date__lte=today
+    ).aggregate(total=Sum('count'))['total'] or 0
+    leave_pending = LeaveRequest.objects.filter(status='pending').count()
+    leave_recent = LeaveRequest.objects.filter(created_at__gte=current_time-timezone.timedelta(days=7)).count()
+
+    year = today.year
+    salary_records_year = SalaryRecord.objects.filter(year=year).count()
+    logs_24h = SystemLog.objects.filter(timestamp__gte=current_time-timezone.timedelta(hours=24)).count()
+    perm_count = RBACPermission.objects.count()
+    role_count = Role.objects.count()
+
+    return {
+        'detail': 'ok',
+        'timestamp': current_time.isoformat(),
+        'data': {
+            'employees': {'total': emp_total, 'active': emp_active, 'inactive': emp_total - emp_active},
+            'org': {'departments': dept_count, 'positions': pos_count},
+            'attendance': {'last7d': attendance_7d},
+            'leaves': {'pending': leave_pending, 'recent7d': leave_recent},
+            'salary': {'year': year, 'records': salary_records_year},
+            'logs': {'last24h': logs_24h},
+            'security': {'permissions': perm_count, 'roles': role_count}
+        }
+    }
 
 
 class SystemSummaryAPIView(views.APIView):
-    """系统概览统计（带缓存，60 秒 TTL）"""
+    """系统概览统计（stale-while-revalidate 快照缓存，见 snapshot_cache）"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        cached_data = cache.get(CacheKeys.DASHBOARD_SUMMARY)
-        if cached_data:
-            return Response(cached_data)
-
-        emp_total = Employee.objects.count()
-        emp_active = Employee.objects.filter(is_active=True).count()
-        dept_count = Department.objects.count()
-        pos_count = Position.objects.count()
-
-        current_time = timezone.localtime()
-        today = timezone.localdate()
-        last7 = today - timezone.timedelta(days=6)
-        attendance_7d = Attendance.objects.filter(date__gte=last7, date__lte=today).count()
-        leave_pending = LeaveRequest.objects.filter(status='pending').count()
-        leave_recent = LeaveRequest.objects.filter(created_at__gte=current_time-timezone.timedelta(days=7)).count()
-
-        year = today.year
-        salary_records_year = SalaryRecord.objects.filter(year=year).count()
-        logs_24h = SystemLog.objects.filter(timestamp__gte=current_time-timezone.timedelta(hours=24)).count()
-        perm_count = RBACPermission.objects.count()
-        role_count = Role.objects.count()
-
-        response_data = {
-            'detail': 'ok',
-            'timestamp': current_time.isoformat(),
-            'data': {
-                'employees': {'total': emp_total, 'active': emp_active, 'inactive': emp_total - emp_active},
-                'org': {'departments': dept_count, 'positions': pos_count},
-                'attendance': {'last7d': attendance_7d},
-                'leaves': {'pending': leave_pending, 'recent7d': leave_recent},
-                'salary': {'year': year, 'records': salary_records_year},
-                'logs': {'last24h': logs_24h},
-                'security': {'permissions': perm_count, 'roles': role_count}
-            }
-        }
-        cache.set(CacheKeys.DASHBOARD_SUMMARY, response_data, CacheKeys.TIMEOUT_SHORT)
-        return Response(response_data)
+        return Response(snapshot_cache.get_or_build(CacheKeys.DASHBOARD_SUMMARY, build_system_summary_data))
 
 
 class MyTodoSummaryAPIView(views.APIView):
@@ -2,14 +2,19 @@
 from io import BytesIO
 from datetime import datetime
 
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
 from rest_framework import permissions, views
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
 from django.utils import timezone
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
-from ...models import Employee, Attendance, LeaveRequest, SalaryRecord
+from ... import export_jobs
+from ...export_engine import DEFAULT_FORMAT, EXPORT_DATASETS, FORMATS, ExportTable, stream_export
+from ...models import Employee, ExportJob, SalaryRecord
+from ...utils import api_error, api_success
 
 
 def _previous_year_month(dt):
@@ -39,7 +44,7 @@ def style_header(ws, headers):
 
 
 def create_excel_response(wb, filename):
-    """创建 Excel 下载响应"""
+    """创建 Excel 下载响应（整本工作簿在内存中，仅用于模板等固定大小的文件；数据导出见 export_engine）"""
     buffer = BytesIO()
     wb.save(buffer)
     buffer.seek(0)
@@ -52,84 +57,33 @@ def create_excel_response(wb, filename):
     return response
 
 
+def _export_format(request):
+    """导出格式：?export_format=xlsx（默认）/csv/ndjson"""
+    fmt = (request.query_params.get('export_format') or DEFAULT_FORMAT).lower()
+    return fmt if fmt in FORMATS else None
+
+
+def _stream_dataset(request, dataset, filename_prefix):
+    fmt = _export_format(request)
+    if fmt is None:
+        return HttpResponse(f"export_format 仅支持 {', '.join(FORMATS)}", status=400)
+    table = EXPORT_DATASETS[dataset](request.query_params)
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return stream_export(table, filename, fmt)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def export_employees(request):
-    """导出员工列表 Excel"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "员工列表"
-    
-    headers = ['员工编号', '姓名', '性别', '部门', '职位', '手机号', '邮箱', '入职日期', '状态']
-    style_header(ws, headers)
-    
-    employees = Employee.objects.select_related('department', 'position').all()
-    
-    for row, emp in enumerate(employees, 2):
-        ws.cell(row=row, column=1, value=emp.employee_id)
-        ws.cell(row=row, column=2, value=emp.name)
-        ws.cell(row=row, column=3, value=dict(Employee.GENDER_CHOICES).get(emp.gender, ''))
-        ws.cell(row=row, column=4, value=emp.department.name if emp.department else '')
-        ws.cell(row=row, column=5, value=emp.position.name if emp.position else '')
-        ws.cell(row=row, column=6, value=emp.phone)
-        ws.cell(row=row, column=7, value=emp.email)
-        ws.cell(row=row, column=8, value=emp.hire_date.strftime('%Y-%m-%d') if emp.hire_date else '')
-        ws.cell(row=row, column=9, value='在职' if emp.is_active else '离职')
-    
-    # 调整列宽
-    for col in range(1, 10):
-        ws.column_dimensions[chr(64 + col)].width = 15
-    
-    filename = f"员工列表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return create_excel_response(wb, filename)
+    """导出员工列表（流式，默认 Excel）"""
+    return _stream_dataset(request, 'employees', '员工列表')
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def export_salaries(request):
-    """导出薪资记录 Excel"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "薪资记录"
-    
-    headers = ['员工编号', '姓名', '部门', '年份', '月份', '基本工资', '奖金', '津贴', '实发工资', '发放状态']
-    style_header(ws, headers)
-    
-    # 支持筛选参数
-    ids = request.query_params.get('ids')
-    year = request.query_params.get('year')
-    month = request.query_params.get('month')
-    
-    qs = SalaryRecord.objects.select_related('employee', 'employee__department').all()
-    
-    # 优先按 ids 筛选
-    if ids:
-        id_list = [int(i) for i in ids.split(',') if i.strip().isdigit()]
-        if id_list:
-            qs = qs.filter(id__in=id_list)
-    else:
-        if year:
-            qs = qs.filter(year=year)
-        if month:
-            qs = qs.filter(month=month)
-    
-    for row, sal in enumerate(qs, 2):
-        ws.cell(row=row, column=1, value=sal.employee.employee_id)
-        ws.cell(row=row, column=2, value=sal.employee.name)
-        ws.cell(row=row, column=3, value=sal.employee.department.name if sal.employee.department else '')
-        ws.cell(row=row, column=4, value=sal.year)
-        ws.cell(row=row, column=5, value=sal.month)
-        ws.cell(row=row, column=6, value=float(sal.basic_salary))
-        ws.cell(row=row, column=7, value=float(sal.bonus))
-        ws.cell(row=row, column=8, value=float(sal.allowance))
-        ws.cell(row=row, column=9, value=float(sal.net_salary))
-        ws.cell(row=row, column=10, value='已发放' if sal.paid else '未发放')
-    
-    for col in range(1, 11):
-        ws.column_dimensions[chr(64 + col)].width = 12
-    
-    filename = f"薪资记录_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return create_excel_response(wb, filename)
+    """导出薪资记录（流式，默认 Excel；支持 ids 或 year/month 筛选）"""
+    return _stream_dataset(request, 'salaries', '薪资记录')
 
 
 @api_view(['GET'])
@@ -165,104 +119,36 @@ def export_my_salary_slip(request):
     if not rec:
         return HttpResponse('未找到该月工资记录', status=404)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "工资条"
-
     headers = ['员工编号', '姓名', '部门', '年份', '月份', '基本工资', '奖金', '津贴', '实发工资', '发放状态', '发放时间']
-    style_header(ws, headers)
-
-    ws.cell(row=2, column=1, value=emp.employee_id)
-    ws.cell(row=2, column=2, value=emp.name)
-    ws.cell(row=2, column=3, value=emp.department.name if emp.department else '')
-    ws.cell(row=2, column=4, value=rec.year)
-    ws.cell(row=2, column=5, value=rec.month)
-    ws.cell(row=2, column=6, value=float(rec.basic_salary))
-    ws.cell(row=2, column=7, value=float(rec.bonus))
-    ws.cell(row=2, column=8, value=float(rec.allowance))
-    ws.cell(row=2, column=9, value=float(rec.net_salary))
-    ws.cell(row=2, column=10, value='已发放' if rec.paid else '未发放')
-    ws.cell(row=2, column=11, value=rec.paid_at.strftime('%Y-%m-%d %H:%M:%S') if rec.paid_at else '')
-
-    for col in range(1, 12):
-        ws.column_dimensions[chr(64 + col)].width = 14
-
-    filename = f"工资条_{emp.employee_id}_{year_i}{str(month_i).zfill(2)}.xlsx"
-    return create_excel_response(wb, filename)
+    row = [
+        emp.employee_id,
+        emp.name,
+        emp.department.name if emp.department else '',
+        rec.year,
+        rec.month,
+        float(rec.basic_salary),
+        float(rec.bonus),
+        float(rec.allowance),
+        float(rec.net_salary),
+        '已发放' if rec.paid else '未发放',
+        rec.paid_at.strftime('%Y-%m-%d %H:%M:%S') if rec.paid_at else '',
+    ]
+    table = ExportTable('工资条', [(header, 14) for header in headers], [row])
+    return stream_export(table, f"工资条_{emp.employee_id}_{year_i}{str(month_i).zfill(2)}")
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def export_attendance(request):
-    """导出考勤记录 Excel"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "考勤记录"
-    
-    headers = ['员工编号', '姓名', '部门', '日期', '上班时间', '下班时间', '考勤类型', '备注']
-    style_header(ws, headers)
-    
-    # 支持日期筛选
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-    
-    qs = Attendance.objects.select_related('employee', 'employee__department').all()
-    if start_date:
-        qs = qs.filter(date__gte=start_date)
-    if end_date:
-        qs = qs.filter(date__lte=end_date)
-    
-    type_map = dict(Attendance.ATTENDANCE_TYPE_CHOICES)
-    
-    for row, att in enumerate(qs, 2):
-        ws.cell(row=row, column=1, value=att.employee.employee_id)
-        ws.cell(row=row, column=2, value=att.employee.name)
-        ws.cell(row=row, column=3, value=att.employee.department.name if att.employee.department else '')
-        ws.cell(row=row, column=4, value=att.date.strftime('%Y-%m-%d'))
-        ws.cell(row=row, column=5, value=att.check_in_time.strftime('%H:%M') if att.check_in_time else '')
-        ws.cell(row=row, column=6, value=att.check_out_time.strftime('%H:%M') if att.check_out_time else '')
-        ws.cell(row=row, column=7, value=type_map.get(att.attendance_type, att.attendance_type))
-        ws.cell(row=row, column=8, value=att.notes)
-    
-    for col in range(1, 9):
-        ws.column_dimensions[chr(64 + col)].width = 14
-    
-    filename = f"考勤记录_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return create_excel_response(wb, filename)
+    """导出考勤记录（流式，默认 Excel；支持 start_date/end_date 筛选）"""
+    return _stream_dataset(request, 'attendance', '考勤记录')
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def export_leaves(request):
-    """导出请假记录 Excel"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "请假记录"
-    
-    headers = ['员工编号', '姓名', '部门', '请假类型', '开始日期', '结束日期', '天数', '状态', '申请时间']
-    style_header(ws, headers)
-    
-    qs = LeaveRequest.objects.select_related('employee', 'employee__department').all()
-    
-    type_map = dict(LeaveRequest.LEAVE_TYPE_CHOICES)
-    status_map = dict(LeaveRequest.STATUS_CHOICES)
-    
-    for row, lv in enumerate(qs, 2):
-        ws.cell(row=row, column=1, value=lv.employee.employee_id)
-        ws.cell(row=row, column=2, value=lv.employee.name)
-        ws.cell(row=row, column=3, value=lv.employee.department.name if lv.employee.department else '')
-        ws.cell(row=row, column=4, value=type_map.get(lv.leave_type, lv.leave_type))
-        ws.cell(row=row, column=5, value=lv.start_date.strftime('%Y-%m-%d'))
-        ws.cell(row=row, column=6, value=lv.end_date.strftime('%Y-%m-%d'))
-        ws.cell(row=row, column=7, value=lv.days)
-        ws.cell(row=row, column=8, value=status_map.get(lv.status, lv.status))
-        ws.cell(row=row, column=9, value=lv.created_at.strftime('%Y-%m-%d %H:%M'))
-    
-    for col in range(1, 10):
-        ws.column_dimensions[chr(64 + col)].width = 14
-    
-    filename = f"请假记录_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return create_excel_response(wb, filename)
+    """导出请假记录（流式，默认 Excel）"""
+    return _stream_dataset(request, 'leaves', '请假记录')
 
 
 @api_view(['GET'])
@@ -343,3 +229,78 @@ def export_salary_template(request):
     
     filename = "薪资导入模板.xlsx"
     return create_excel_response(wb, filename)
+
+
+# ==================== 后台导出任务 ====================
+
+def _job_data(request, job):
+    data = export_jobs.job_payload(job)
+    data['download_url'] = (
+        request.build_absolute_uri(reverse('api_export_job_download', args=[job.pk])) if job.status == 'done' else None
+    )
+    return data
+
+
+def _get_job(request, job_id):
+    """本人提交的任务；管理员可查看所有任务（相同规格的任务在管理员间复用）"""
+    job = ExportJob.objects.filter(pk=job_id).first()
+    if job is None or not (job.user_id == request.user.id or request.user.is_staff):
+        return None
+    return job
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAdminUser])
+def export_jobs_list(request):
+    """后台导出任务
+
+    GET: 本人最近的任务
+    POST: 提交任务 {kind: export|report, dataset, params, export_format}，返回任务ID；
+          缓存窗口内相同规格的任务直接复用（reused=true）
+    """
+    if request.method == 'GET':
+        jobs = ExportJob.objects.filter(user=request.user).order_by('-created_at')[:20]
+        return Response(api_success([_job_data(request, job) for job in jobs]))
+
+    try:
+        spec = export_jobs.normalize_spec(
+            request.data.get('kind'),
+            request.data.get('dataset'),
+            request.data.get('params'),
+            request.data.get('export_format'),
+        )
+    except ValueError as e:
+        return Response(api_error(str(e), code='invalid_spec'), status=400)
+
+    job, reused = export_jobs.submit_job(request.user, spec)
+    if job is None:
+        return Response(
+            api_error('进行中的导出任务过多，请等待完成后再提交', code='too_many_jobs'), status=429)
+    return Response(api_success(_job_data(request, job), reused=reused), status=200 if reused else 202)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_job_detail(request, job_id):
+    """查询导出任务状态与进度"""
+    job = _get_job(request, job_id)
+    if job is None:
+        return Response(api_error('导出任务不存在', code='not_found'), status=404)
+    return Response(api_success(_job_data(request, job)))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_job_download(request, job_id):
+    """下载已完成任务的产物"""
+    job = _get_job(request, job_id)
+    if job is None:
+        return Response(api_error('导出任务不存在', code='not_found'), status=404)
+    if job.status != 'done':
+        return Response(api_error('导出任务尚未完成', code='not_ready', status=job.status), status=409)
+    path = export_jobs.artifact_path(job)
+    if not path.exists():
+        return Response(api_error('导出文件已过期，请重新提交', code='expired'), status=410)
+    content_type = 'application/json' if job.kind == 'report' else FORMATS[job.export_format][0]
+    return FileResponse(
+        open(path, 'rb'), as_attachment=True, filename=export_jobs.artifact_filename(job), content_type=content_type)
@@ -3,17 +3,20 @@ from rest_framework import generics, permissions, views
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import Q
 
 from .base import LoggingMixin
-from ...models import Employee, LeaveRequest, BusinessTrip, TravelExpense
+from ...models import Employee, EmploymentEvent, LeaveRequest, BusinessTrip, TravelExpense
 from ...permissions import get_managed_department_ids, HasRBACPermission
 from ...rbac import Permissions
+from ...pagination import KeysetPagination
 from ...utils import log_event, api_success, api_error, get_client_ip
 from ..serializers import (
     LeaveRequestSerializer, LeaveRequestWriteSerializer, LeaveApproveSerializer, 
     BusinessTripSerializer, BusinessTripWriteSerializer,
-    TravelExpenseSerializer, TravelExpenseWriteSerializer
+    TravelExpenseSerializer, TravelExpenseWriteSerializer,
+    plan_queryset,
 )
 
 
@@ -21,6 +24,8 @@ class LeaveListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
     """请假列表与创建"""
     serializer_class = LeaveRequestSerializer
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
     log_model_name = '请假'
     
     # RBAC 权限
@@ -30,12 +35,7 @@ class LeaveListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
         return [Permissions.LEAVE_VIEW]
     
     def get_queryset(self):
-        qs = LeaveRequest.objects.select_related(
-            'employee',
-            'employee__department',
-            'employee__department__manager',
-            'employee__department__manager__user'
-        ).all().order_by('-created_at')
+        qs = plan_queryset(LeaveRequest.objects.all(), LeaveRequestSerializer).order_by('-created_at')
         
         user = self.request.user
         if not user.is_staff:
@@ -171,6 +171,10 @@ class LeaveApproveAPIView(views.APIView):
 
         self._sync_overall_status(leave)
         leave.save()
+        if leave.status == 'approved':
+            # 离职以申请的结束日期生效；之后人事停用账号时不再重复记录
+            EmploymentEvent.record(leave.employee, EmploymentEvent.TYPE_RESIGN, leave.end_date,
+                                   note=f'离职申请 #{leave.id}', user=request.user)
         log_event(user=request.user, action='审批离职申请', detail=f'{leave.id} stage={stage} -> {leave.status}', ip=get_client_ip(request))
         return Response(api_success(LeaveRequestSerializer(leave, context={'request': request}).data))
 
@@ -222,7 +226,22 @@ class LeaveUpdateAPIView(views.APIView):
             leave.leave_type = request.data['leave_type']
         if 'reason' in request.data:
             leave.reason = request.data['reason']
-        
+
+        # 日期或类型变化后重新计算请假天数
+        try:
+            start_date = parse_date(str(leave.start_date))
+            end_date = parse_date(str(leave.end_date))
+        except ValueError:
+            # 格式正确但日期不存在（如 2024-02-30）
+            start_date = end_date = None
+        if not start_date or not end_date:
+            return Response(api_error('日期格式不正确', code='invalid_date'), status=400)
+        if end_date < start_date:
+            return Response(api_error('结束日期不能早于开始日期', code='invalid_date'), status=400)
+        leave.days = LeaveRequest.compute_days(leave.leave_type, start_date, end_date)
+        if leave.days <= 0:
+            return Response(api_error('所选日期范围内没有工作日，无需请假', code='invalid_date'), status=400)
+
         leave.save()
         
         log_event(user=request.user, action='变更请假', detail=f'{leave.employee.employee_id} {leave.start_date}~{leave.end_date}', ip=get_client_ip(request))
@@ -238,10 +257,7 @@ class BusinessTripListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
     log_model_name = '出差'
     
     def get_queryset(self):
-        qs = BusinessTrip.objects.select_related(
-            'employee',
-            'employee__department',
-        ).all().order_by('-created_at')
+        qs = plan_queryset(BusinessTrip.objects.all(), BusinessTripSerializer).order_by('-created_at')
         
         user = self.request.user
         
@@ -398,9 +414,7 @@ class TravelExpenseListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
     log_model_name = '差旅报销'
     
     def get_queryset(self):
-        qs = TravelExpense.objects.select_related(
-            'employee', 'employee__department', 'business_trip', 'approved_by'
-        ).all().order_by('-created_at')
+        qs = plan_queryset(TravelExpense.objects.all(), TravelExpenseSerializer).order_by('-created_at')
         
         user = self.request.user
         if not user.is_staff:
@@ -8,6 +8,7 @@ from django.db import transaction
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from ...models import Employee, VerificationCode
+from ...pagination import paginate_rows
 from ...utils import log_event, api_success, api_error, get_client_ip, generate_verification_code, send_verification_email
 
 
@@ -334,11 +335,10 @@ class OnboardPendingListAPIView(views.APIView):
         else:
             qs = Employee.objects.filter(onboard_status=status_filter)
 
-        qs = qs.select_related('user', 'onboard_reviewed_by', 'department', 'position').order_by('-created_at')
+        qs = qs.select_related('user', 'onboard_reviewed_by', 'department', 'position')
 
-        data = []
-        for emp in qs:
-            data.append({
+        def serialize(emp):
+            return {
                 'id': emp.id,
                 'employee_id': emp.employee_id,
                 'name': emp.name,
@@ -371,8 +371,13 @@ class OnboardPendingListAPIView(views.APIView):
                 'reviewed_by': emp.onboard_reviewed_by.username if emp.onboard_reviewed_by else None,
                 'department': emp.department.name if emp.department else None,
                 'position': emp.position.name if emp.position else None,
-            })
+            }
 
+        # 带 cursor/page 参数时分页，否则返回全部（兼容旧前端）
+        page = paginate_rows(request, qs, ('-created_at', '-id'), serialize)
+        if page is not None:
+            return Response(api_success(page))
+        data = [serialize(emp) for emp in qs.order_by('-created_at')]
         return Response(api_success(data, count=len(data)))
 
 
@@ -1,17 +1,19 @@
 """大数据报表 API 视图"""
 from rest_framework import permissions, views
 from rest_framework.response import Response
-from django.core.cache import cache
 from django.utils import timezone
-from django.db.models import Sum, Count, Avg, Q
+from django.db.models import Sum, Count, Q
 from django.db.models.functions import TruncMonth
 from datetime import timedelta
 from decimal import Decimal
 
-from ...models import Employee, Department, Position, Attendance, LeaveRequest, SalaryRecord
+from ...models import Employee, Position, AttendanceDailyStat, HeadcountSnapshot, LeaveRequest, PayrollMonthlyStat
 from ...permissions import HasRBACPermission
+from ...rollup import DepartmentRollup
 from ...rbac import Permissions
 from ...services import CacheKeys
+from ... import snapshot_cache
+from ...utils import workday_mask
 
 
 ATTENDANCE_COLORS = {
@@ -24,54 +26,28 @@ ATTENDANCE_COLORS = {
 
 
 def build_department_distribution_data():
-    departments = list(Department.objects.values('id', 'name', 'parent_id'))
-    labels = []
-    values = []
     colors = [
         '#3b82f6', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6',
         '#06b6d4', '#ec4899', '#84cc16', '#f97316', '#6366f1'
     ]
 
-    if not departments:
+    tree = DepartmentRollup()
+    if not tree.names:
         return {'detail': 'ok', 'labels': [], 'values': [], 'colors': [], 'total': 0}
 
-    children_map = {}
-    names = {}
-    top_level_ids = []
-    for dept in departments:
-        dept_id = dept['id']
-        names[dept_id] = dept['name']
-        parent_id = dept['parent_id']
-        children_map.setdefault(parent_id, []).append(dept_id)
-        if parent_id is None:
-            top_level_ids.append(dept_id)
-
-    active_counts = {
-        row['department_id']: row['cnt']
-        for row in Employee.objects.filter(is_active=True, department_id__isnull=False)
-        .values('department_id').annotate(cnt=Count('id'))
-    }
-
-    def count_department_tree(root_id):
-        total = 0
-        stack = [root_id]
-        while stack:
-            current_id = stack.pop()
-            total += active_counts.get(current_id, 0)
-            stack.extend(children_map.get(current_id, []))
-        return total
-
+    # 在职人数一次分组查询，沿部门树汇总到顶级部门
+    counts = tree.aggregate(Employee.objects.filter(is_active=True), cnt=Count('id'))
     dept_data = []
-    for dept_id in top_level_ids:
-        count = count_department_tree(dept_id)
+    for dept_id, name in tree.top_level():
+        count = counts.total(dept_id)['cnt']
         if count > 0:
-            dept_data.append({'name': names[dept_id], 'count': count})
+            dept_data.append({'name': name, 'count': count})
 
     dept_data.sort(key=lambda item: item['count'], reverse=True)
-    labels.extend(item['name'] for item in dept_data)
-    values.extend(item['count'] for item in dept_data)
+    labels = [item['name'] for item in dept_data]
+    values = [item['count'] for item in dept_data]
 
-    no_dept_count = Employee.objects.filter(is_active=True, department__isnull=True).count()
+    no_dept_count = counts.unassigned['cnt']
     if no_dept_count > 0:
         labels.append('未分配部门')
         values.append(no_dept_count)
@@ -92,23 +68,28 @@ def build_monthly_salary_data(months=12, include_current=False):
     if not include_current:
         end_index -= 1
 
+    # 薪资月度汇总一次分组查询取出整个区间
+    start_index = end_index - months + 1
+    monthly = {
+        (row['year'], row['month']): row
+        for row in PayrollMonthlyStat.objects.filter(
+            year__gte=start_index // 12, year__lte=end_index // 12,
+        ).values('year', 'month').annotate(total=Sum('total_net'), count=Sum('record_count')).order_by()
+    }
+
     results = []
-    for i in range(months - 1, -1, -1):
-        target_index = end_index - i
+    for target_index in range(start_index, end_index + 1):
         year = target_index // 12
         month = (target_index % 12) + 1
-        stats = SalaryRecord.objects.filter(year=year, month=month).aggregate(
-            total=Sum('net_salary'),
-            count=Count('id'),
-            avg=Avg('net_salary'),
-        )
+        stats = monthly.get((year, month)) or {}
+        total, count = stats.get('total') or 0, stats.get('count') or 0
         results.append({
             'year': year,
             'month': month,
             'label': f'{year}-{str(month).zfill(2)}',
-            'total': float(stats['total'] or 0),
-            'count': stats['count'] or 0,
-            'avg': float(stats['avg'] or 0),
+            'total': float(total),
+            'count': count,
+            'avg': float(total / count) if count else 0.0,
         })
 
     return {
@@ -126,7 +107,10 @@ def build_attendance_rate_data(days=30):
     days = max(1, min(int(days), 90))
     today = timezone.localdate()
     start_date = today - timedelta(days=days - 1)
-    qs = Attendance.objects.filter(date__gte=start_date, date__lte=today)
+    # 仅统计工作日（周末/节假日的加班打卡不计入出勤率）
+    mask = workday_mask(start_date, today)
+    workdays = [start_date + timedelta(days=i) for i, flag in enumerate(mask) if flag]
+    qs = AttendanceDailyStat.objects.filter(date__in=workdays)
 
     status_mapping = {
         'check_in': 'normal',
@@ -144,7 +128,7 @@ def build_attendance_rate_data(days=30):
         'leave': {'label': '请假', 'count': 0},
     }
 
-    for row in qs.values('attendance_type').annotate(cnt=Count('id')):
+    for row in qs.values('attendance_type').annotate(cnt=Sum('count')).order_by():
         mapped = status_mapping.get(row['attendance_type'], row['attendance_type'])
         if mapped in stats:
             stats[mapped]['count'] += row['cnt']
@@ -171,6 +155,7 @@ def build_attendance_rate_data(days=30):
     return {
         'detail': 'ok',
         'days': days,
+        'workdays': len(workdays),
         'labels': labels,
         'values': values,
         'colors': colors,
@@ -220,33 +205,28 @@ def build_leave_analysis_data(days=90):
 def build_employee_growth_data(months=12):
     months = max(1, min(int(months), 24))
     today = timezone.localdate()
+    end_index = today.year * 12 + today.month - 1
+    start_index = end_index - months + 1
+    start_year, start_month = start_index // 12, start_index % 12 + 1
+
+    # 人数快照：累计入职人数（不含复职）为"员工总数"，月末在职人数为"在职"
+    HeadcountSnapshot.ensure_current()
+    before = Q(year__lt=start_year) | Q(year=start_year, month__lt=start_month)
+    total = HeadcountSnapshot.objects.filter(before).aggregate(hires=Sum('hires'))['hires'] or 0
+    monthly = {
+        (row['year'], row['month']): row
+        for row in HeadcountSnapshot.objects.filter(year__gte=start_year, year__lte=end_index // 12)
+        .values('year', 'month').annotate(hires=Sum('hires'), active=Sum('headcount')).order_by()
+    }
+
     results = []
-    for i in range(months - 1, -1, -1):
-        target_index = today.year * 12 + today.month - 1 - i
+    for target_index in range(start_index, end_index + 1):
         target_year = target_index // 12
         target_month = (target_index % 12) + 1
-        if target_month == 12:
-            month_end_date = today.replace(year=target_year, month=12, day=31)
-        else:
-            from datetime import date
-            next_month = target_month + 1
-            next_year = target_year
-            if next_month > 12:
-                next_month = 1
-                next_year += 1
-            month_end_date = date(next_year, next_month, 1) - timedelta(days=1)
-
-        if target_year == today.year and target_month == today.month:
-            month_end_date = today
-
-        from datetime import datetime
-        month_end_dt = datetime.combine(month_end_date, datetime.max.time())
-        if timezone.is_aware(timezone.now()):
-            month_end_dt = timezone.make_aware(month_end_dt)
-
-        total = Employee.objects.filter(created_at__lte=month_end_dt).count()
-        active = Employee.objects.filter(created_at__lte=month_end_dt, is_active=True).count()
-        results.append({'date': f'{target_year}-{str(target_month).zfill(2)}', 'total': total, 'active': active})
+        row = monthly.get((target_year, target_month)) or {}
+        total += row.get('hires') or 0
+        results.append({'date': f'{target_year}-{str(target_month).zfill(2)}', 'total': total,
+                        'active': row.get('active') or 0})
 
     return {
         'detail': 'ok',
@@ -290,16 +270,23 @@ def build_report_overview_data():
     emp_new_this_month = Employee.objects.filter(hire_date__gte=this_month_start).count()
     emp_new_last_month = Employee.objects.filter(hire_date__gte=last_month_start, hire_date__lt=this_month_start).count()
 
-    salary_this_month = SalaryRecord.objects.filter(year=payroll_year, month=payroll_month, paid=True).aggregate(total=Sum('net_salary'))['total'] or Decimal('0')
-    salary_last_month = SalaryRecord.objects.filter(year=prev_payroll_year, month=prev_payroll_month, paid=True).aggregate(total=Sum('net_salary'))['total'] or Decimal('0')
-
-    attendance_this_month = Attendance.objects.filter(date__gte=this_month_start, date__lte=today).count()
-    normal_attendance = Attendance.objects.filter(
-        date__gte=this_month_start,
-        date__lte=today,
-        attendance_type__in=['check_in', 'check_out', 'late', 'early_leave'],
-    ).count()
-    late_this_month = Attendance.objects.filter(date__gte=this_month_start, date__lte=today, attendance_type='late').count()
+    paid_totals = {
+        (row['year'], row['month']): row['total']
+        for row in PayrollMonthlyStat.objects.filter(
+            Q(year=payroll_year, month=payroll_month) | Q(year=prev_payroll_year, month=prev_payroll_month)
+        ).values('year', 'month').annotate(total=Sum('paid_net')).order_by()
+    }
+    salary_this_month = paid_totals.get((payroll_year, payroll_month)) or Decimal('0')
+    salary_last_month = paid_totals.get((prev_payroll_year, prev_payroll_month)) or Decimal('0')
+
+    attendance = AttendanceDailyStat.objects.filter(date__gte=this_month_start, date__lte=today).aggregate(
+        total=Sum('count'),
+        normal=Sum('count', filter=Q(attendance_type__in=['check_in', 'check_out', 'late', 'early_leave'])),
+        late=Sum('count', filter=Q(attendance_type='late')),
+    )
+    attendance_this_month = attendance['total'] or 0
+    normal_attendance = attendance['normal'] or 0
+    late_this_month = attendance['late'] or 0
     attendance_rate = round(normal_attendance / attendance_this_month * 100, 1) if attendance_this_month > 0 else 0
 
     leave_this_month = LeaveRequest.objects.filter(created_at__date__gte=this_month_start).count()
@@ -408,25 +395,16 @@ class ReportOverviewAPIView(views.APIView):
     rbac_perms_any = [Permissions.REPORT_EMPLOYEE, Permissions.REPORT_SALARY, Permissions.REPORT_ATTENDANCE, Permissions.REPORT_LEAVE]
 
     def get(self, request):
-        cached_data = cache.get(CacheKeys.REPORT_OVERVIEW)
-        if cached_data:
-            return Response(cached_data)
-
-        response_data = build_report_overview_data()
-        cache.set(CacheKeys.REPORT_OVERVIEW, response_data, CacheKeys.TIMEOUT_SHORT)
-        return Response(response_data)
+        return Response(snapshot_cache.get_or_build(CacheKeys.REPORT_OVERVIEW, build_report_overview_data))
 
 
 class ReportSnapshotAPIView(views.APIView):
-    """报表页快照接口，减少前端多次往返请求。"""
+    """报表页快照接口，减少前端多次往返请求。
+
+    stale-while-revalidate：数据变更只标记快照为脏，读取时先返回上一份快照，由单个后台线程重算。
+    """
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
     rbac_perms_any = [Permissions.REPORT_EMPLOYEE, Permissions.REPORT_SALARY, Permissions.REPORT_ATTENDANCE, Permissions.REPORT_LEAVE]
 
     def get(self, request):
-        cached_data = cache.get(CacheKeys.REPORT_SNAPSHOT)
-        if cached_data:
-            return Response(cached_data)
-
-        response_data = build_report_snapshot_data()
-        cache.set(CacheKeys.REPORT_SNAPSHOT, response_data, CacheKeys.TIMEOUT_SHORT)
-        return Response(response_data)
+        return Response(snapshot_cache.get_or_build(CacheKeys.REPORT_SNAPSHOT, build_report_snapshot_data))
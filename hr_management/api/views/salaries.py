@@ -6,16 +6,16 @@ from django.db.models import Q
 from django.utils import timezone
 
 from .base import LoggingMixin
-from ...models import SalaryRecord, SystemLog
+from ...models import PayrollMonthlyStat, SalaryRecord, SystemLog
 from ...permissions import IsStaffOrOwnRelated, get_managed_department_ids, HasRBACPermission, user_has_rbac_permission
 from ...rbac import Permissions
 from ...utils import api_success, api_error
 from ...notifications import notify_salary_issued
-from ...pagination import StandardPagination
+from ...pagination import KeysetPagination
 from ..serializers import SalaryRecordSerializer, SalaryRecordWriteSerializer
 
 
-class SalaryListPagination(StandardPagination):
+class SalaryListPagination(KeysetPagination):
     """薪资列表分页：默认更小页，避免一次性拉取过大数据量。"""
     page_size = 50
     max_page_size = 500
@@ -52,6 +52,7 @@ class SalaryListCreateAPIView(LoggingMixin, generics.ListCreateAPIView):
     serializer_class = SalaryRecordSerializer
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
     pagination_class = SalaryListPagination
+    keyset_ordering = ('-year', '-month', '-id')
     log_model_name = '薪资记录'
 
     # RBAC 权限
@@ -192,8 +193,10 @@ def salary_disburse(request):
     count = len(record_ids)
     now = timezone.now()
 
-    # 批量更新
+    # 批量更新（update 不触发信号，重算涉及月份的薪资汇总）
+    periods = set(records.values_list('year', 'month').distinct())
     records.update(paid=True, paid_at=now)
+    PayrollMonthlyStat.rebuild(periods)
 
     # 发送通知给每位员工
     for record in SalaryRecord.objects.filter(id__in=record_ids).select_related('employee'):
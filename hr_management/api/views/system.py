@@ -4,6 +4,7 @@ from pathlib import Path
 
 from django.conf import settings
 from django.db import connections
+from django.http import HttpResponse
 from django.utils import timezone
 from rest_framework import generics, permissions
 from rest_framework.decorators import api_view, permission_classes
@@ -12,6 +13,7 @@ from rest_framework.response import Response
 from .base import LoggingMixin
 from ...models import SystemLog, CompanyDocument, RBACPermission
 from ...permissions import IsStaffOrOwner, HasRBACPermission, user_has_rbac_permission
+from ...pagination import KeysetPagination
 from ...rbac import Permissions
 from ...utils import api_error, api_success, log_event
 from ..serializers import (
@@ -27,6 +29,8 @@ class SystemLogListAPIView(generics.ListAPIView):
     serializer_class = SystemLogSerializer
     permission_classes = [permissions.IsAuthenticated, HasRBACPermission]
     rbac_perms = [Permissions.SYSTEM_LOG_VIEW]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
         qs = SystemLog.objects.select_related('user').all().order_by('-timestamp')
@@ -332,3 +336,15 @@ def apm_overview(request):
 
     return Response(api_success(get_apm_snapshot(top_n=top_n)))
 
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def apm_prometheus(request):
+    """APM 指标的 Prometheus 文本导出：按路由模板的延迟 / 数据库耗时直方图与请求、错误计数。"""
+    from ...permissions import user_has_rbac_permission
+    if not (request.user.is_superuser or request.user.is_staff or user_has_rbac_permission(request.user, 'system.view')):
+        return Response(api_error('无查看系统监控权限', code='forbidden'), status=403)
+
+    from ...latency import latency_registry, prometheus_text
+    return HttpResponse(prometheus_text(latency_registry.snapshot()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
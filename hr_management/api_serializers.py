@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Count
 from .models import Employee, Department, Position, Attendance, LeaveRequest, SalaryRecord, SystemLog, Role, RBACPermission, CompanyDocument, BusinessTrip, TravelExpense, CheckInLocation
 from django.utils import timezone
 
@@ -17,6 +18,11 @@ class DepartmentSerializer(serializers.ModelSerializer):
     )
     parent_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
 
+    # 预加载规划（见 api/serializers/prefetch.py）：方法字段用到的关联与注解
+    select_related_fields = ('manager', 'parent')
+    prefetch_related_fields = ('supervisors',)
+    annotated_fields = {'num_children': Count('children')}
+
     class Meta:
         model = Department
         fields = ['id', 'name', 'description', 'manager', 'supervisors', 'supervisor_ids',
@@ -51,10 +57,16 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return None
 
     def get_children_count(self, obj):
-        return obj.children.count()
+        num_children = getattr(obj, 'num_children', None)
+        return obj.children.count() if num_children is None else num_children
 
     def get_full_path(self, obj):
-        return obj.get_full_path()
+        # 同一次序列化共用一份部门路径映射（嵌套序列化器共享根序列化器的 context）
+        paths = self.context.get('department_paths')
+        if paths is None:
+            from .services import DepartmentService
+            paths = self.context['department_paths'] = DepartmentService.get_path_map()
+        return paths.get(obj.id) or obj.name
 
     def create(self, validated_data):
         supervisor_ids = validated_data.pop('supervisor_ids', [])
@@ -82,12 +94,8 @@ class DepartmentSerializer(serializers.ModelSerializer):
             if parent_id == instance.id:
                 raise serializers.ValidationError({'parent_id': '部门不能设置自己为上级部门'})
             # 检查是否设置为自己的子部门
-            if parent_id:
-                parent = Department.objects.filter(id=parent_id).first()
-                if parent:
-                    all_children = instance.get_all_children()
-                    if parent in all_children:
-                        raise serializers.ValidationError({'parent_id': '不能将子部门设置为上级部门'})
+            if parent_id and parent_id in instance.get_descendant_ids(include_self=False):
+                raise serializers.ValidationError({'parent_id': '不能将子部门设置为上级部门'})
             instance.parent_id = parent_id
 
         for attr, value in validated_data.items():
@@ -104,6 +112,8 @@ class PositionSerializer(serializers.ModelSerializer):
         source='default_roles', many=True, read_only=True
     )
 
+    prefetch_related_fields = ('default_roles',)
+
     class Meta:
         model = Position
         fields = ['id', 'name', 'department', 'description', 'default_roles', 'default_role_ids']
@@ -118,6 +128,10 @@ class UserSerializer(serializers.ModelSerializer):
     employee_id = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
     employee_name = serializers.SerializerMethodField()
+
+    select_related_fields = ('employee',)
+    prefetch_related_fields = ('roles',)
+
     class Meta:
         model = User
         fields = ['id', 'username', 'is_staff', 'is_superuser', 'is_active', 'email', 'first_name', 'last_name', 'must_change_password', 'roles', 'has_employee', 'employee_id', 'avatar', 'employee_name', 'date_joined', 'last_login']
@@ -314,8 +328,7 @@ class DepartmentWriteSerializer(serializers.ModelSerializer):
             if value.id == self.instance.id:
                 raise serializers.ValidationError('部门不能设置自己为上级部门')
             # 检查是否设置为自己的子部门
-            all_children = self.instance.get_all_children()
-            if value in all_children:
+            if value.id in self.instance.get_descendant_ids(include_self=False):
                 raise serializers.ValidationError('不能将子部门设置为上级部门')
         return value
 
@@ -530,7 +543,9 @@ class LeaveRequestWriteSerializer(serializers.ModelSerializer):
         end = attrs['end_date']
         if end < start:
             raise serializers.ValidationError('结束日期不能早于开始日期')
-        attrs['days'] = (end - start).days + 1
+        attrs['days'] = LeaveRequest.compute_days(attrs.get('leave_type'), start, end)
+        if attrs['days'] <= 0:
+            raise serializers.ValidationError('所选日期范围内没有工作日，无需请假')
         return attrs
 
     def create(self, validated_data):
@@ -29,6 +29,7 @@ from .api.views import (
     attendance_supplement_list, attendance_supplement_pending, attendance_supplement_approve,
     attendance_workday,
     CheckInLocationListCreateAPIView, CheckInLocationDetailAPIView, checkin_locations_active,
+    checkin_locations_validate,
     attendance_alerts,
     # Leaves
     LeaveListCreateAPIView, LeaveApproveAPIView, LeaveCancelAPIView, LeaveUpdateAPIView,
@@ -40,7 +41,7 @@ from .api.views import (
     SystemLogListAPIView, system_log_clear,
     CompanyDocumentListCreateAPIView, CompanyDocumentDetailAPIView,
     backups_list, backup_create, backup_clean, backup_restore,
-    health_check, health_report, system_metrics, apm_overview,
+    health_check, health_report, system_metrics, apm_overview, apm_prometheus,
     # RBAC
     RoleListAPIView, RoleListCreateAPIView, RoleDetailAPIView,
     PermissionListAPIView, PermissionListCreateAPIView, PermissionDetailAPIView,
@@ -53,7 +54,7 @@ from .api.views import (
     PositionListCreateAPIView, PositionDetailAPIView,
     # Export
     export_employees, export_salaries, export_attendance, export_leaves, export_my_salary_slip,
-    export_salary_template,
+    export_salary_template, export_jobs_list, export_job_detail, export_job_download,
     # Import
     EmployeeImportAPIView, AttendanceImportAPIView, SalaryImportAPIView,
     ImportTemplateAPIView,
@@ -119,6 +120,7 @@ urlpatterns = [
     # 签到地点管理
     path('checkin-locations/', CheckInLocationListCreateAPIView.as_view(), name='api_checkin_locations'),
     path('checkin-locations/active/', checkin_locations_active, name='api_checkin_locations_active'),
+    path('checkin-locations/validate/', checkin_locations_validate, name='api_checkin_locations_validate'),
     path('checkin-locations/<int:pk>/', CheckInLocationDetailAPIView.as_view(), name='api_checkin_location_detail'),
 
     # 考勤异常提醒
@@ -175,6 +177,7 @@ urlpatterns = [
     path('system/health/report/', health_report, name='api_health_report'),
     path('system/metrics/', system_metrics, name='api_system_metrics'),
     path('system/apm/', apm_overview, name='api_system_apm_overview'),
+    path('system/apm/prometheus/', apm_prometheus, name='api_system_apm_prometheus'),
 
     # Company Documents
     path('documents/', CompanyDocumentListCreateAPIView.as_view(), name='api_company_documents'),
@@ -187,6 +190,9 @@ urlpatterns = [
     path('export/salary-template/', export_salary_template, name='api_export_salary_template'),
     path('export/attendance/', export_attendance, name='api_export_attendance'),
     path('export/leaves/', export_leaves, name='api_export_leaves'),
+    path('export/jobs/', export_jobs_list, name='api_export_jobs'),
+    path('export/jobs/<uuid:job_id>/', export_job_detail, name='api_export_job_detail'),
+    path('export/jobs/<uuid:job_id>/download/', export_job_download, name='api_export_job_download'),
 
     # Import
     path('import/employees/', EmployeeImportAPIView.as_view(), name='api_import_employees'),
@@ -10,6 +10,9 @@ class HrManagementConfig(AppConfig):
         """应用启动时注册信号处理器"""
         # 导入信号处理器以注册它们
         from . import signals  # noqa: F401
+        from .permission_cache import setup_permission_cache_signals
+
+        setup_permission_cache_signals()
 
         # 启动简易调度器，处理每日缺勤标记等后台任务
         # 开发环境可设置环境变量 DISABLE_SCHEDULER=True 禁用
@@ -0,0 +1,205 @@
+"""
+审计日志批量写入 - 进程内有界队列 + 后台批量 INSERT
+
+log_event / log_user_action 写入的 SystemLog 先进入有界队列，由后台收集线程按
+AUDIT_LOG_BATCH_SIZE 条或 AUDIT_LOG_FLUSH_MS 毫秒（先到者为准）攒成一批，交给
+tasks.get_executor() 线程池执行一次 bulk_create。请求线程只做一次入队。
+
+- 安全相关操作（登录、密码、权限、角色、备份恢复等）及 WARNING/ERROR 级别同步写入，
+  保证返回响应前已落库
+- 队列满时退化为同步写入（不丢日志），计入 overflow 指标
+- 进程退出时（atexit / shutdown_executor）把队列中剩余的日志写完
+- timestamp 在入队时记录，批量写入不会让日志时间晚于实际操作
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 含以下关键字的操作同步写入
+SYNC_ACTION_KEYWORDS = ('登录', '退出', '密码', '验证码', '注册', '权限', '角色', '备份', '恢复', '日志')
+SYNC_LEVELS = ('WARNING', 'ERROR')
+
+
+def is_security_action(action: str, level: str = 'INFO') -> bool:
+    return level in SYNC_LEVELS or any(keyword in action for keyword in SYNC_ACTION_KEYWORDS)
+
+
+class AuditLogWriter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'sync_writes': 0,
+            'overflow': 0,
+            'failed': 0,
+            'max_depth': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'AUDIT_LOG_ASYNC', True)
+
+    @property
+    def batch_size(self) -> int:
+        return getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100)
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, 'AUDIT_LOG_FLUSH_MS', 500) / 1000
+
+    def _ensure_started(self) -> queue.Queue:
+        if self._thread is not None and self._thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._queue
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=getattr(settings, 'AUDIT_LOG_QUEUE_SIZE', 10000))
+                atexit.register(self.flush)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='audit_log_writer', daemon=True)
+            self._thread.start()
+        return self._queue
+
+    def submit(self, action: str, level: str = 'INFO', user_id: Optional[int] = None,
+               detail: str = '', ip: Optional[str] = None, sync: bool = False) -> None:
+        row = {
+            'action': action,
+            'level': level or 'INFO',
+            'user_id': user_id or None,
+            'detail': detail or '',
+            'ip_address': ip or None,
+            'timestamp': timezone.now(),
+        }
+        if sync or not self.enabled or self._stop.is_set() or is_security_action(row['action'], row['level']):
+            self._count(sync_writes=1)
+            self._write([row])
+            return
+
+        q = self._ensure_started()
+        try:
+            q.put_nowait(row)
+        except queue.Full:
+            # 背压：后台写入跟不上时由请求线程直接写，宁可变慢也不丢审计日志
+            self._count(overflow=1)
+            self._write([row])
+            return
+        depth = q.qsize()
+        with self._lock:
+            self._stats['enqueued'] += 1
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+
+    def _drain(self, limit: int, deadline: Optional[float]) -> List[Dict[str, Any]]:
+        """从队列取最多 limit 条；deadline 为 None 时不等待"""
+        batch = []
+        while len(batch) < limit:
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first] + self._drain(self.batch_size - 1, time.monotonic() + self.flush_interval)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Dict[str, Any]]) -> None:
+        from .tasks import get_executor
+
+        try:
+            get_executor().submit(self._write_in_worker, batch)
+        except RuntimeError:
+            # 线程池已关闭（进程退出中）
+            self._write(batch)
+
+    def _write_in_worker(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            self._write(batch)
+        finally:
+            connection.close()
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        from .models import SystemLog
+
+        start = time.perf_counter()
+        try:
+            SystemLog.objects.bulk_create([SystemLog(**row) for row in rows])
+        except Exception as e:
+            if len(rows) == 1:
+                self._count(failed=1)
+                logger.error(f"Failed to write audit log: {e}")
+                return
+            # 批量失败时逐条重试，避免一条坏数据拖累整批
+            logger.warning(f"Audit log batch of {len(rows)} failed ({e}), retrying one by one")
+            for row in rows:
+                self._write([row])
+            return
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        with self._lock:
+            self._stats['written'] += len(rows)
+            if len(rows) > 1:
+                self._stats['batches'] += 1
+                self._stats['last_batch_size'] = len(rows)
+                self._stats['last_flush_ms'] = elapsed_ms
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, value in deltas.items():
+                self._stats[name] += value
+
+    def flush(self, stop: bool = True) -> int:
+        """在当前线程写完队列中剩余的日志（stop=True 时同时停止后台线程，之后的日志同步写入）"""
+        if self._queue is None:
+            return 0
+        if stop:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join(timeout=self.flush_interval * 2)
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size, None)
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._stats)
+        return {
+            **counters,
+            'depth': self._queue.qsize() if self._queue is not None else 0,
+            'capacity': self._queue.maxsize if self._queue is not None else 0,
+            'async': self.enabled,
+        }
+
+
+audit_writer = AuditLogWriter()
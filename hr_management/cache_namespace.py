@@ -0,0 +1,68 @@
+"""
+缓存命名空间 - 代数（generation）计数器
+
+    key = versioned_key('att_today_17', ['attendance', 'attendance:17'])   # 'att_today_17#<代数>.<代数>'
+    bump('attendance:17')     # 该员工的考勤缓存全部失效
+    bump('attendance')        # 所有员工的考勤缓存全部失效
+
+- 每个命名空间在缓存中保存一个代数 ns:{命名空间}，永不过期
+- 缓存键末尾拼接所属各命名空间的代数（由粗到细），读取时一次 get_many 取齐
+- 失效 = 写入新代数：O(1)，不扫描键、不清空缓存库；旧代数的条目不再被读到，按各自 TTL 自然淘汰
+- 代数取微秒时间戳：计数器被淘汰后重建也不会与旧条目撞号，批量失效只需一次 set_many
+"""
+import time
+from typing import Callable, Iterable, List, Set
+
+from django.core.cache import cache
+
+NAMESPACE_PREFIX = 'ns:'
+
+_bump_listeners: List[Callable[[Set[str]], None]] = []
+
+
+def _ns_key(namespace: str) -> str:
+    return f'{NAMESPACE_PREFIX}{namespace}'
+
+
+def _new_generation() -> int:
+    return time.time_ns() // 1000
+
+
+def generations(namespaces: Iterable[str]) -> List[int]:
+    """读取各命名空间的当前代数，缺失的按当前时间初始化"""
+    keys = [_ns_key(ns) for ns in namespaces]
+    if not keys:
+        return []
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        value = found.get(key)
+        if value is None:
+            value = _new_generation()
+            if not cache.add(key, value, None):
+                value = cache.get(key, value)
+        result.append(value)
+    return result
+
+
+def versioned_key(key: str, namespaces: Iterable[str]) -> str:
+    """拼接命名空间代数后的实际缓存键"""
+    gens = generations(namespaces)
+    if not gens:
+        return key
+    return f'{key}#' + '.'.join(str(gen) for gen in gens)
+
+
+def bump(*namespaces: str) -> None:
+    """使命名空间下的所有缓存键失效（立即生效；信号/批量写入中请用 invalidation_bus.bump）"""
+    if namespaces:
+        namespaces = set(namespaces)
+        generation = _new_generation()
+        cache.set_many({_ns_key(ns): generation for ns in namespaces}, None)
+        for listener in _bump_listeners:
+            listener(namespaces)
+
+
+def on_bump(listener: Callable[[Set[str]], None]) -> None:
+    """注册本进程递增命名空间时的回调（用于清除进程内缓存）"""
+    _bump_listeners.append(listener)
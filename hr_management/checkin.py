@@ -0,0 +1,89 @@
+"""
+签到快速路径 - 早高峰签到/签退的热数据
+
+- 员工信息：按用户缓存签到所需的少量字段，缓存到当天结束（员工变更时由 signals 清除）
+- 当日上下文：是否工作日与迟到/早退截止时间，进程内按日期缓存
+- 签到地点：见 geofence.geofence_index（进程内索引）
+
+签到请求在缓存命中时只剩一次 INSERT（或已有记录时的读取 + UPDATE），审计日志交给后台线程写入。
+"""
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .services import CacheKeys
+
+CHECKIN_EMPLOYEE_FIELDS = ('id', 'employee_id', 'name', 'onboard_status')
+DAY_CONTEXT_TTL = 60  # 秒：节假日日历调整后最长的感知延迟
+
+
+def _seconds_until_tomorrow() -> int:
+    now = timezone.localtime()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+    return max(int((tomorrow - now).total_seconds()), 60)
+
+
+def get_checkin_employee(user_id: int) -> Optional[Dict[str, Any]]:
+    """签到所需的员工字段（id/工号/姓名/入职状态），按天缓存"""
+    from .models import Employee
+
+    key = CacheKeys.CHECKIN_EMPLOYEE.format(user_id=user_id)
+    profile = cache.get(key)
+    if profile is None:
+        profile = Employee.objects.filter(user_id=user_id).values(*CHECKIN_EMPLOYEE_FIELDS).first()
+        if profile is None:
+            return None
+        cache.set(key, profile, _seconds_until_tomorrow())
+    return profile
+
+
+def invalidate_checkin_employee(user_id: Optional[int]) -> None:
+    if user_id:
+        cache.delete(CacheKeys.CHECKIN_EMPLOYEE.format(user_id=user_id))
+
+
+class DayContext(NamedTuple):
+    date: date
+    is_workday: bool
+    check_in_deadline: Any
+    check_out_deadline: Any
+
+
+_day_context: Optional[DayContext] = None
+_day_context_at = 0.0
+
+
+def get_day_context(today: date) -> DayContext:
+    """当日是否工作日与截止时间（进程内缓存，日期变化或超过 DAY_CONTEXT_TTL 秒后刷新）"""
+    global _day_context, _day_context_at
+    ctx = _day_context
+    if ctx is not None and ctx.date == today and time.monotonic() - _day_context_at < DAY_CONTEXT_TTL:
+        return ctx
+
+    from .utils import is_workday, get_attendance_cutoff_times
+    cutoff_times = get_attendance_cutoff_times()
+    ctx = DayContext(
+        date=today,
+        is_workday=is_workday(today),
+        check_in_deadline=cutoff_times['check_in_deadline'],
+        check_out_deadline=cutoff_times['check_out_deadline'],
+    )
+    _day_context, _day_context_at = ctx, time.monotonic()
+    return ctx
+
+
+def serialize_checkin(rec, employee: Dict[str, Any], is_workday: bool) -> Dict[str, Any]:
+    """签到接口的精简响应（字段与 AttendanceSerializer 一致，员工信息只含基本字段）"""
+    return {
+        'id': rec.id,
+        'employee': {key: employee[key] for key in ('id', 'employee_id', 'name')},
+        'date': rec.date.isoformat(),
+        'check_in_time': rec.check_in_time.isoformat() if rec.check_in_time else None,
+        'check_out_time': rec.check_out_time.isoformat() if rec.check_out_time else None,
+        'attendance_type': rec.attendance_type,
+        'notes': rec.notes,
+        'is_workday': is_workday,
+    }
@@ -0,0 +1,249 @@
+"""
+流式导出引擎 - 内存占用与行数无关的 Excel / CSV / NDJSON 导出
+
+- 数据集（EXPORT_DATASETS）：按筛选参数构建 ExportTable，行数据来自
+  values_list().iterator(chunk_size=...)，不实例化模型、不缓存查询结果
+- xlsx：openpyxl write-only 工作簿，行写入临时 XML，保存到磁盘临时文件后以 FileResponse 分块返回
+- csv / ndjson：边查询边编码，通过 StreamingHttpResponse 逐块输出
+
+视图见 api/views/export.py；后台导出任务（export_jobs.py）复用 write_export()。
+"""
+import csv
+import json
+import tempfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+CHUNK_SIZE = 2000  # 每次从数据库游标读取的行数
+STREAM_BUFFER_SIZE = 64 * 1024  # csv/ndjson 每次输出的字节数
+
+FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+DEFAULT_FORMAT = 'xlsx'
+
+
+class ExportTable(NamedTuple):
+    title: str
+    columns: Sequence[Tuple[str, int]]  # (表头, 列宽)
+    rows: Iterable[Sequence[Any]]
+    count_rows: Optional[Callable[[], int]] = None  # 行数（后台任务显示进度用，流式下载不调用）
+
+    @property
+    def headers(self) -> List[str]:
+        return [header for header, _ in self.columns]
+
+
+# ============ 数据集 ============
+
+def _fmt_date(value, pattern='%Y-%m-%d'):
+    return value.strftime(pattern) if value else ''
+
+
+def _param(params: Mapping[str, Any], key: str):
+    value = params.get(key)
+    return value if value not in (None, '') else None
+
+
+def employees_table(params: Mapping[str, Any]) -> ExportTable:
+    from .models import Employee
+
+    genders = dict(Employee.GENDER_CHOICES)
+    qs = Employee.objects.order_by('employee_id').values_list(
+        'employee_id', 'name', 'gender', 'department__name', 'position__name',
+        'phone', 'email', 'hire_date', 'is_active',
+    )
+
+    def rows():
+        for emp_id, name, gender, dept, pos, phone, email, hire_date, is_active in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield [emp_id, name, genders.get(gender, ''), dept or '', pos or '', phone, email,
+                   _fmt_date(hire_date), '在职' if is_active else '离职']
+
+    columns = [('员工编号', 15), ('姓名', 15), ('性别', 15), ('部门', 15), ('职位', 15),
+               ('手机号', 15), ('邮箱', 15), ('入职日期', 15), ('状态', 15)]
+    return ExportTable('员工列表', columns, rows(), qs.count)
+
+
+def salaries_table(params: Mapping[str, Any]) -> ExportTable:
+    from .models import SalaryRecord
+
+    qs = SalaryRecord.objects.all()
+    # 优先按 ids 筛选
+    ids = _param(params, 'ids')
+    id_list = [int(i) for i in str(ids).split(',') if i.strip().isdigit()] if ids else []
+    if id_list:
+        qs = qs.filter(id__in=id_list)
+    else:
+        if _param(params, 'year'):
+            qs = qs.filter(year=params['year'])
+        if _param(params, 'month'):
+            qs = qs.filter(month=params['month'])
+    qs = qs.order_by('-year', '-month', 'employee__employee_id').values_list(
+        'employee__employee_id', 'employee__name', 'employee__department__name', 'year', 'month',
+        'basic_salary', 'bonus', 'allowance', 'net_salary', 'paid',
+    )
+
+    def rows():
+        for emp_id, name, dept, year, month, basic, bonus, allowance, net, paid in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield [emp_id, name, dept or '', year, month, float(basic), float(bonus), float(allowance),
+                   float(net), '已发放' if paid else '未发放']
+
+    columns = [('员工编号', 12), ('姓名', 12), ('部门', 12), ('年份', 12), ('月份', 12),
+               ('基本工资', 12), ('奖金', 12), ('津贴', 12), ('实发工资', 12), ('发放状态', 12)]
+    return ExportTable('薪资记录', columns, rows(), qs.count)
+
+
+def attendance_table(params: Mapping[str, Any]) -> ExportTable:
+    from .models import Attendance
+
+    qs = Attendance.objects.all()
+    if _param(params, 'start_date'):
+        qs = qs.filter(date__gte=params['start_date'])
+    if _param(params, 'end_date'):
+        qs = qs.filter(date__lte=params['end_date'])
+    qs = qs.order_by('-date', 'employee__employee_id').values_list(
+        'employee__employee_id', 'employee__name', 'employee__department__name', 'date',
+        'check_in_time', 'check_out_time', 'attendance_type', 'notes',
+    )
+    types = dict(Attendance.ATTENDANCE_TYPE_CHOICES)
+
+    def rows():
+        for emp_id, name, dept, day, check_in, check_out, att_type, notes in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield [emp_id, name, dept or '', _fmt_date(day), _fmt_date(check_in, '%H:%M'),
+                   _fmt_date(check_out, '%H:%M'), types.get(att_type, att_type), notes]
+
+    columns = [('员工编号', 14), ('姓名', 14), ('部门', 14), ('日期', 14), ('上班时间', 14),
+               ('下班时间', 14), ('考勤类型', 14), ('备注', 14)]
+    return ExportTable('考勤记录', columns, rows(), qs.count)
+
+
+def leaves_table(params: Mapping[str, Any]) -> ExportTable:
+    from .models import LeaveRequest
+
+    qs = LeaveRequest.objects.order_by('-created_at').values_list(
+        'employee__employee_id', 'employee__name', 'employee__department__name', 'leave_type',
+        'start_date', 'end_date', 'days', 'status', 'created_at',
+    )
+    types = dict(LeaveRequest.LEAVE_TYPE_CHOICES)
+    statuses = dict(LeaveRequest.STATUS_CHOICES)
+
+    def rows():
+        for emp_id, name, dept, leave_type, start, end, days, status, created_at in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield [emp_id, name, dept or '', types.get(leave_type, leave_type), _fmt_date(start),
+                   _fmt_date(end), days, statuses.get(status, status), _fmt_date(created_at, '%Y-%m-%d %H:%M')]
+
+    columns = [('员工编号', 14), ('姓名', 14), ('部门', 14), ('请假类型', 14), ('开始日期', 14),
+               ('结束日期', 14), ('天数', 14), ('状态', 14), ('申请时间', 14)]
+    return ExportTable('请假记录', columns, rows(), qs.count)
+
+
+EXPORT_DATASETS: Dict[str, Callable[[Mapping[str, Any]], ExportTable]] = {
+    'employees': employees_table,
+    'salaries': salaries_table,
+    'attendance': attendance_table,
+    'leaves': leaves_table,
+}
+
+
+# ============ 写出 ============
+
+def _header_cells(ws, headers: Sequence[str]) -> List[WriteOnlyCell]:
+    """表头样式与 api/views/export.style_header 一致"""
+    font = Font(bold=True, color="FFFFFF")
+    fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    align = Alignment(horizontal="center", vertical="center")
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font, cell.fill, cell.alignment, cell.border = font, fill, align, border
+        cells.append(cell)
+    return cells
+
+
+def write_xlsx(table: ExportTable, fileobj) -> None:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=table.title)
+    for i, (_, width) in enumerate(table.columns, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.append(_header_cells(ws, table.headers))
+    for row in table.rows:
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class _LineBuffer:
+    """csv.writer 的写入目标：直接返回写入的字符串"""
+    def write(self, value):
+        return value
+
+
+def iter_text(table: ExportTable, fmt: str) -> Iterator[bytes]:
+    """csv / ndjson 按 STREAM_BUFFER_SIZE 分块输出（csv 带 BOM，Excel 直接打开不乱码）"""
+    if fmt == 'csv':
+        writer = csv.writer(_LineBuffer())
+        lines = (writer.writerow(row) for row in table.rows)
+        chunks, size = ['\ufeff', writer.writerow(table.headers)], 0
+    else:
+        headers = table.headers
+        lines = (
+            json.dumps(dict(zip(headers, row)), ensure_ascii=False, default=_json_default) + '\n'
+            for row in table.rows
+        )
+        chunks, size = [], 0
+    for line in lines:
+        chunks.append(line)
+        size += len(line)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(chunks).encode('utf-8')
+            chunks, size = [], 0
+    if chunks:
+        yield ''.join(chunks).encode('utf-8')
+
+
+def write_export(table: ExportTable, fileobj, fmt: str = DEFAULT_FORMAT) -> None:
+    """写入二进制文件对象（后台导出任务使用）"""
+    if fmt == 'xlsx':
+        write_xlsx(table, fileobj)
+    else:
+        for chunk in iter_text(table, fmt):
+            fileobj.write(chunk)
+
+
+def stream_export(table: ExportTable, filename: str, fmt: str = DEFAULT_FORMAT):
+    """导出下载响应；filename 不含扩展名"""
+    content_type, ext = FORMATS[fmt]
+    filename = f'{filename}.{ext}'
+    if fmt == 'xlsx':
+        # zip 需要在末尾写目录，无法边生成边发送：先写入磁盘临时文件，再分块读出
+        tmp = tempfile.TemporaryFile()
+        try:
+            write_xlsx(table, tmp)
+        except Exception:
+            tmp.close()
+            raise
+        tmp.seek(0)
+        return FileResponse(tmp, as_attachment=True, filename=filename, content_type=content_type)
+
+    response = StreamingHttpResponse(iter_text(table, fmt), content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
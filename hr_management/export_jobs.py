@@ -0,0 +1,360 @@
+"""
+后台导出/报表任务 - 提交规格、轮询进度、下载产物
+
+- 提交：规格 = (kind, dataset, params, export_format)，按规格摘要（spec_hash）去重：
+  EXPORT_JOB_CACHE_SECONDS 内相同规格的任务（排队中、生成中或已完成且文件仍在）直接复用
+- 执行：独立线程池（EXPORT_JOB_WORKERS），不占用 tasks.get_executor() 的通用线程；
+  每个用户同时进行的任务数不超过 EXPORT_JOB_MAX_PER_USER
+- 产物：导出数据集复用 export_engine 的 write_export()，报表写为 JSON；
+  先写 .part 临时文件再改名，保存在 settings.EXPORT_ROOT。该目录不在 MEDIA_ROOT 下，
+  产物只能经 export_job_download（管理员权限校验）下载
+- 清理：cleanup_expired() 由定时任务每小时执行，删除过期产物，并把进程重启后遗留的
+  排队中/生成中任务标记为失败
+
+视图见 api/views/export.py（export/jobs/ 系列接口）。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .export_engine import CHUNK_SIZE, EXPORT_DATASETS, FORMATS, ExportTable, write_export
+
+logger = logging.getLogger(__name__)
+
+LEGACY_MEDIA_DIR = 'exports'  # 旧版本写在 MEDIA_ROOT 下的产物目录，清理时删除
+ACTIVE_STATUSES = ('pending', 'running')
+
+# 各数据集接受的筛选参数（其余参数忽略，不参与规格摘要）
+EXPORT_PARAMS = {
+    'employees': (),
+    'salaries': ('ids', 'year', 'month'),
+    'attendance': ('start_date', 'end_date'),
+    'leaves': (),
+}
+EXPORT_TITLES = {
+    'employees': '员工列表',
+    'salaries': '薪资记录',
+    'attendance': '考勤记录',
+    'leaves': '请假记录',
+}
+
+
+def _int(params: Mapping[str, Any], key: str) -> Optional[int]:
+    value = params.get(key)
+    return int(value) if value not in (None, '') else None
+
+
+def _attendance_report(params):
+    from .query_utils import ReportQueries
+    return ReportQueries.get_attendance_summary(
+        _int(params, 'year'), _int(params, 'month'), _int(params, 'department_id'))
+
+
+def _salary_report(params):
+    from .query_utils import ReportQueries
+    return ReportQueries.get_salary_summary(_int(params, 'year'), _int(params, 'month'))
+
+
+def _leave_report(params):
+    from .query_utils import ReportQueries
+    return list(ReportQueries.get_leave_statistics(_int(params, 'year'), _int(params, 'department_id')))
+
+
+# 报表：(标题, 参数, 必填参数, 生成函数)
+REPORTS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...], Callable[[Mapping[str, Any]], Any]]] = {
+    'attendance': ('考勤汇总', ('year', 'month', 'department_id'), ('year', 'month'), _attendance_report),
+    'salary': ('薪资汇总', ('year', 'month'), ('year',), _salary_report),
+    'leave': ('请假统计', ('year', 'department_id'), ('year',), _leave_report),
+}
+
+
+def _setting(name: str, default: int) -> int:
+    return getattr(settings, name, default)
+
+
+# ============ 规格 ============
+
+def normalize_spec(kind: str, dataset: str, params: Optional[Mapping[str, Any]], fmt: Optional[str]) -> Dict[str, Any]:
+    """校验并规范化任务规格，不合法时抛出 ValueError（消息可直接返回给前端）"""
+    kind = kind or 'export'
+    params = params or {}
+    if not isinstance(params, Mapping):
+        raise ValueError('params 必须是对象')
+    if kind == 'export':
+        if dataset not in EXPORT_DATASETS:
+            raise ValueError(f"dataset 仅支持 {', '.join(EXPORT_DATASETS)}")
+        fmt = (fmt or 'xlsx').lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"export_format 仅支持 {', '.join(FORMATS)}")
+        allowed, required = EXPORT_PARAMS[dataset], ()
+    elif kind == 'report':
+        if dataset not in REPORTS:
+            raise ValueError(f"report 仅支持 {', '.join(REPORTS)}")
+        fmt = 'json'
+        _, allowed, required, _ = REPORTS[dataset]
+    else:
+        raise ValueError('kind 仅支持 export、report')
+
+    cleaned = {key: str(params[key]) for key in allowed if params.get(key) not in (None, '')}
+    missing = [key for key in required if key not in cleaned]
+    if missing:
+        raise ValueError(f"缺少参数: {', '.join(missing)}")
+    if kind == 'report':
+        try:
+            for key in cleaned:
+                _int(cleaned, key)
+        except ValueError:
+            raise ValueError('报表参数必须为整数')
+    return {'kind': kind, 'dataset': dataset, 'params': cleaned, 'export_format': fmt}
+
+
+def spec_hash(spec: Mapping[str, Any]) -> str:
+    payload = json.dumps(spec, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# ============ 线程池 ============
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_setting('EXPORT_JOB_WORKERS', 2), thread_name_prefix='export_job_')
+    return _executor
+
+
+def shutdown_job_executor() -> None:
+    """关闭线程池：不等待正在生成的文件，未完成的任务由 cleanup_expired() 标记为失败"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# ============ 提交 ============
+
+def find_reusable(digest: str):
+    """缓存窗口内相同规格、仍可用的任务"""
+    from .models import ExportJob
+
+    now = timezone.now()
+    since = now - timedelta(seconds=_setting('EXPORT_JOB_CACHE_SECONDS', 600))
+    candidates = ExportJob.objects.filter(
+        spec_hash=digest, created_at__gte=since, status__in=ACTIVE_STATUSES + ('done',),
+    ).order_by('-created_at')
+    for job in candidates[:3]:
+        if job.status != 'done':
+            return job
+        if job.file_path and job.expires_at and job.expires_at > now and artifact_path(job).exists():
+            return job
+    return None
+
+
+def active_job_count(user_id: int) -> int:
+    from .models import ExportJob
+    return ExportJob.objects.filter(user_id=user_id, status__in=ACTIVE_STATUSES).count()
+
+
+def submit_job(user, spec: Mapping[str, Any], run: bool = True):
+    """提交规范化后的规格，返回 (job, reused)
+
+    相同规格在缓存窗口内复用已有任务；超过每用户并发上限时返回 (None, False)。
+    run=False 时只创建任务，由调用方在当前线程执行 run_job()。
+    """
+    from .models import ExportJob
+
+    digest = spec_hash(spec)
+    existing = find_reusable(digest)
+    if existing is not None:
+        return existing, True
+    if active_job_count(user.pk) >= _setting('EXPORT_JOB_MAX_PER_USER', 2):
+        return None, False
+
+    job = ExportJob.objects.create(user=user, spec_hash=digest, **spec)
+    if run:
+        # 提交事务后再交给线程池，工作线程才能读到任务记录
+        transaction.on_commit(lambda: get_job_executor().submit(_run_in_worker, job.pk))
+    return job, False
+
+
+# ============ 执行 ============
+
+def export_root() -> Path:
+    return Path(settings.EXPORT_ROOT)
+
+
+def artifact_path(job) -> Path:
+    return export_root() / job.file_path
+
+
+def artifact_filename(job) -> str:
+    title = REPORTS[job.dataset][0] if job.kind == 'report' else EXPORT_TITLES.get(job.dataset, job.dataset)
+    ext = 'json' if job.kind == 'report' else FORMATS[job.export_format][1]
+    return f"{title}_{timezone.localtime(job.created_at):%Y%m%d_%H%M%S}.{ext}"
+
+
+def _track_progress(job_id, table: ExportTable) -> ExportTable:
+    """包装行迭代器，每 CHUNK_SIZE 行更新一次进度"""
+    from .models import ExportJob
+
+    def rows():
+        count = 0
+        for row in table.rows:
+            yield row
+            count += 1
+            if count % CHUNK_SIZE == 0:
+                ExportJob.objects.filter(pk=job_id).update(progress=count)
+        ExportJob.objects.filter(pk=job_id).update(progress=count)
+
+    return table._replace(rows=rows())
+
+
+def run_job(job_id) -> None:
+    """在当前线程生成产物（失败时记录错误，不抛出）"""
+    from .models import ExportJob
+
+    updated = ExportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now())
+    if not updated:
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    export_dir = export_root()
+    export_dir.mkdir(parents=True, exist_ok=True)
+    ext = 'json' if job.kind == 'report' else FORMATS[job.export_format][1]
+    relative = f'{job.pk}.{ext}'
+    target = export_dir / f'{job.pk}.{ext}'
+    partial = export_dir / f'{job.pk}.{ext}.part'
+
+    try:
+        if job.kind == 'report':
+            data = REPORTS[job.dataset][3](job.params)
+            partial.write_text(json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False), encoding='utf-8')
+            total = len(data) if isinstance(data, list) else 1
+        else:
+            table = EXPORT_DATASETS[job.dataset](job.params)
+            total = table.count_rows() if table.count_rows else None
+            ExportJob.objects.filter(pk=job.pk).update(total=total)
+            with open(partial, 'wb') as fileobj:
+                write_export(_track_progress(job.pk, table), fileobj, job.export_format)
+        os.replace(partial, target)
+    except Exception as e:
+        logger.exception(f"Export job {job.pk} failed")
+        partial.unlink(missing_ok=True)
+        ExportJob.objects.filter(pk=job.pk).update(
+            status='failed', error=str(e)[:1000], finished_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(hours=_setting('EXPORT_JOB_RETENTION_HOURS', 24)),
+        )
+        return
+
+    finished = timezone.now()
+    ExportJob.objects.filter(pk=job.pk).update(
+        status='done', progress=total or 0, total=total, file_path=relative,
+        file_size=target.stat().st_size, finished_at=finished,
+        expires_at=finished + timedelta(hours=_setting('EXPORT_JOB_RETENTION_HOURS', 24)),
+    )
+    logger.info(f"Export job {job.pk} ({job.kind}:{job.dataset}) finished: {total} rows")
+
+
+def _run_in_worker(job_id) -> None:
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def job_payload(job) -> Dict[str, Any]:
+    percent = None
+    if job.status == 'done':
+        percent = 100
+    elif job.total:
+        percent = min(99, int(job.progress * 100 / job.total))
+    return {
+        'id': str(job.pk),
+        'kind': job.kind,
+        'dataset': job.dataset,
+        'params': job.params,
+        'export_format': job.export_format,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': percent,
+        'file_size': job.file_size,
+        'filename': artifact_filename(job) if job.status == 'done' else None,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'expires_at': job.expires_at,
+    }
+
+
+# ============ 清理 ============
+
+def cleanup_expired() -> Dict[str, int]:
+    """删除过期任务及产物、孤立文件，并把超时未完成的任务标记为失败"""
+    from .models import ExportJob
+
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=_setting('EXPORT_JOB_TIMEOUT_SECONDS', 7200))
+    retention = timedelta(hours=_setting('EXPORT_JOB_RETENTION_HOURS', 24))
+    stale = ExportJob.objects.filter(status__in=ACTIVE_STATUSES, created_at__lt=stale_before).update(
+        status='failed', error='任务超时或进程重启中断', finished_at=now, expires_at=now + retention)
+
+    expired = ExportJob.objects.filter(status__in=('done', 'failed'), expires_at__lt=now)
+    removed_files = 0
+    for file_path in expired.exclude(file_path='').values_list('file_path', flat=True).iterator():
+        path = export_root() / file_path
+        if path.exists():
+            path.unlink(missing_ok=True)
+            removed_files += 1
+    removed_jobs, _ = expired.delete()
+
+    # 孤立文件：任务记录已删除，或进程中断留下的 .part
+    export_dir = export_root()
+    if export_dir.exists():
+        cutoff = (now - retention).timestamp()
+        for path in export_dir.iterdir():
+            if not path.is_file() or path.stat().st_mtime >= cutoff:
+                continue
+            job_id = path.name.split('.', 1)[0]
+            if path.name.endswith('.part') or not ExportJob.objects.filter(pk=_uuid_or_none(job_id)).exists():
+                path.unlink(missing_ok=True)
+                removed_files += 1
+
+    # 旧版本写在 MEDIA_ROOT 下、可被 /media/ 直接访问的产物：全部删除（对应任务下载时返回已过期）
+    legacy_dir = Path(settings.MEDIA_ROOT) / LEGACY_MEDIA_DIR
+    if legacy_dir.is_dir():
+        for path in legacy_dir.iterdir():
+            if path.is_file():
+                path.unlink(missing_ok=True)
+                removed_files += 1
+
+    result = {'stale': stale, 'jobs': removed_jobs, 'files': removed_files}
+    if any(result.values()):
+        logger.info(f"Export jobs cleaned up: {result}")
+    return result
+
+
+def _uuid_or_none(value: str):
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
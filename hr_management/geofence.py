@@ -0,0 +1,183 @@
+"""
+签到地理围栏索引 - 进程内网格索引
+
+启用的 CheckInLocation 在首次使用时整表载入内存，每个围栏按其外接矩形登记到
+固定大小（GRID_SIZE 度）的网格中；查询时只需取坐标所在网格内的候选围栏计算
+Haversine 距离，不访问数据库。员工与考勤地点的关联关系同样预先载入。
+
+地点或员工关联变更时（signals）递增缓存中的版本号，各进程最多 VERSION_CHECK_INTERVAL 秒后重建索引。
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371000  # 地球半径（米）
+METERS_PER_DEGREE = 111320
+GRID_SIZE = 0.01  # 网格边长（度），约 1.1 公里
+MAX_CELLS_PER_FENCE = 400  # 超大半径的围栏不进网格，每次查询都参与计算
+
+VERSION_KEY = 'geofence_index_version'
+VERSION_CHECK_INTERVAL = 10  # 秒
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """使用 Haversine 公式计算两点间距离（米）"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = lat2_rad - lat1_rad
+    delta_lng = math.radians(lng2 - lng1)
+    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2
+    return EARTH_RADIUS * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class Fence(NamedTuple):
+    """启用的签到地点（只读快照，字段与 CheckInLocation 同名）"""
+    id: int
+    name: str
+    latitude: float
+    longitude: float
+    radius: int
+
+
+def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    return math.floor(latitude / GRID_SIZE), math.floor(longitude / GRID_SIZE)
+
+
+class _Snapshot(NamedTuple):
+    fences: Tuple[Fence, ...]
+    grid: Dict[Tuple[int, int], Tuple[Fence, ...]]
+    oversized: Tuple[Fence, ...]
+    employee_locations: Dict[int, FrozenSet[int]]  # 员工ID -> 关联的地点ID（含停用地点）
+
+
+class GeofenceIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _get_snapshot(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+                return self._snapshot
+            version = self._current_version()
+            if self._snapshot is None or version != self._version:
+                self._snapshot = self._build()
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _build(self) -> _Snapshot:
+        from .models import CheckInLocation, Employee
+
+        fences = tuple(
+            Fence(loc_id, name, float(lat), float(lng), radius)
+            for loc_id, name, lat, lng, radius in CheckInLocation.objects.filter(is_active=True)
+            .order_by('-is_default', '-created_at')
+            .values_list('id', 'name', 'latitude', 'longitude', 'radius')
+        )
+
+        grid = defaultdict(list)
+        oversized = []
+        for fence in fences:
+            # 外接矩形略放大 1%，抵消球面近似误差
+            lat_span = fence.radius * 1.01 / METERS_PER_DEGREE
+            cos_lat = max(math.cos(math.radians(abs(fence.latitude) + lat_span)), 1e-6)
+            lng_span = fence.radius * 1.01 / (METERS_PER_DEGREE * cos_lat)
+            lat_lo, lng_lo = _cell(fence.latitude - lat_span, fence.longitude - lng_span)
+            lat_hi, lng_hi = _cell(fence.latitude + lat_span, fence.longitude + lng_span)
+            if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > MAX_CELLS_PER_FENCE:
+                oversized.append(fence)
+                continue
+            for i in range(lat_lo, lat_hi + 1):
+                for j in range(lng_lo, lng_hi + 1):
+                    grid[(i, j)].append(fence)
+
+        employee_locations = defaultdict(set)
+        for emp_id, loc_id in Employee.checkin_locations.through.objects.values_list('employee_id', 'checkinlocation_id'):
+            employee_locations[emp_id].add(loc_id)
+
+        logger.info(f"Geofence index built: {len(fences)} fences, {len(grid)} cells")
+        return _Snapshot(
+            fences=fences,
+            grid={cell: tuple(items) for cell, items in grid.items()},
+            oversized=tuple(oversized),
+            employee_locations={emp_id: frozenset(ids) for emp_id, ids in employee_locations.items()},
+        )
+
+    def invalidate(self) -> None:
+        """签到地点或员工关联变更后调用"""
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        self._snapshot = None
+
+    def _allowed_ids(self, snapshot: _Snapshot, employee_id: Optional[int]) -> Optional[FrozenSet[int]]:
+        """员工可用的地点ID；None 表示不限（使用全部启用地点）"""
+        if employee_id is None:
+            return None
+        return snapshot.employee_locations.get(employee_id)
+
+    def candidates(self, employee_id: Optional[int] = None) -> List[Fence]:
+        """员工需要校验的启用地点（员工有关联时只取关联且启用的）"""
+        snapshot = self._get_snapshot()
+        allowed = self._allowed_ids(snapshot, employee_id)
+        if allowed is None:
+            return list(snapshot.fences)
+        return [fence for fence in snapshot.fences if fence.id in allowed]
+
+    def requires_location(self, employee_id: Optional[int] = None) -> bool:
+        """是否需要位置校验（没有可用的启用地点时允许任意位置签到）"""
+        return bool(self.candidates(employee_id))
+
+    def locate(self, latitude: float, longitude: float,
+               employee_id: Optional[int] = None) -> Tuple[bool, Optional[Fence], float]:
+        """
+        返回 (是否在范围内, 地点, 距离)：在范围内时为最近的命中地点；
+        否则为最近的可用地点；没有可用地点时为 (True, None, 0)
+        """
+        snapshot = self._get_snapshot()
+        allowed = self._allowed_ids(snapshot, employee_id)
+
+        nearest, nearest_distance = None, float('inf')
+        for fence in snapshot.grid.get(_cell(latitude, longitude), ()) + snapshot.oversized:
+            if allowed is not None and fence.id not in allowed:
+                continue
+            distance = haversine(latitude, longitude, fence.latitude, fence.longitude)
+            if distance <= fence.radius and distance < nearest_distance:
+                nearest, nearest_distance = fence, distance
+        if nearest is not None:
+            return True, nearest, nearest_distance
+
+        # 未命中：在可用地点中找最近的一个用于提示
+        fences = snapshot.fences if allowed is None else [f for f in snapshot.fences if f.id in allowed]
+        if not fences:
+            return True, None, 0
+        for fence in fences:
+            distance = haversine(latitude, longitude, fence.latitude, fence.longitude)
+            if distance < nearest_distance:
+                nearest, nearest_distance = fence, distance
+        return False, nearest, nearest_distance
+
+    def locate_many(self, points: Iterable[Tuple[float, float]],
+                    employee_id: Optional[int] = None) -> List[Tuple[bool, Optional[Fence], float]]:
+        return [self.locate(lat, lng, employee_id) for lat, lng in points]
+
+
+geofence_index = GeofenceIndex()
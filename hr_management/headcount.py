@@ -0,0 +1,108 @@
+"""
+月度人数回放 - 按时间顺序回放任职事件（EmploymentEvent），得到每月各部门的人数快照
+
+    rows = replay_headcount(
+        EmploymentEvent.objects.order_by('event_date', 'id').values_list(*EVENT_FIELDS),
+        since_index, end_index,
+    )
+
+- 月份用"月序号" year * 12 + month - 1 表示，便于连续区间计算
+- 在职状态：入职/复职后在职，离职后不在职；调岗只改变在职员工的部门
+- 输出 [(年, 月, 部门, {headcount, hires, ...}), ...]，只含 since_index ~ end_index 且有数据的格子；
+  headcount 为月末在职人数，其余为当月发生数
+- 单条事件的影响见 event_effects()：回放逐条使用；新事件晚于该员工已有事件时，
+  HeadcountSnapshot.apply_event() 直接把它叠加到已有快照上，不再回放全部事件
+
+纯函数、不依赖 ORM，HeadcountSnapshot.rebuild() / apply_event() 与初始化迁移共用。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EVENT_FIELDS = ('employee_id', 'event_type', 'event_date', 'department_id', 'from_department_id')
+FLOW_FIELDS = ('hires', 'reactivations', 'resignations', 'transfers_in', 'transfers_out')
+
+_FLOW_OF = {'hire': 'hires', 'reactivate': 'reactivations', 'resign': 'resignations'}
+
+
+def month_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def event_effects(event_type: str, dept_id: int, from_dept_id: Optional[int],
+                  employed_in: Optional[int]) -> Tuple[Optional[int], Dict[int, int], List[Tuple[int, str]]]:
+    """
+    单条事件的影响
+
+    Args:
+        employed_in: 事件前所在部门，不在职为 None
+
+    Returns:
+        (事件后所在部门（不在职为 None）, {部门: 在职人数增减}, [(部门, 当月发生数字段), ...])
+    """
+    dept_id = dept_id or 0
+    moves: Dict[int, int] = {}
+
+    def move(dept: int, delta: int):
+        moves[dept] = moves.get(dept, 0) + delta
+
+    if event_type in ('hire', 'reactivate'):
+        if employed_in is not None:
+            move(employed_in, -1)
+        move(dept_id, 1)
+        return dept_id, moves, [(dept_id, _FLOW_OF[event_type])]
+    if event_type == 'resign':
+        if employed_in is not None:
+            move(employed_in, -1)
+        return None, moves, [(dept_id, 'resignations')]
+    if event_type == 'transfer' and employed_in is not None:
+        move(employed_in, -1)
+        move(dept_id, 1)
+        out_dept = from_dept_id if from_dept_id is not None else employed_in
+        return dept_id, moves, [(out_dept, 'transfers_out'), (dept_id, 'transfers_in')]
+    return employed_in, moves, []
+
+
+def replay_headcount(events: Iterable[Tuple], since_index: int, end_index: int) -> List[Tuple[int, int, int, Dict[str, int]]]:
+    """events 须按 (event_date, id) 排序，字段顺序见 EVENT_FIELDS"""
+    current: Dict[int, int] = {}      # 在职员工 → 部门
+    headcount: Dict[int, int] = {}    # 部门 → 在职人数
+    flows: Dict[int, Dict[str, int]] = {}  # 部门 → 当月发生数
+    rows = []
+    cursor: Optional[int] = None      # 下一个待输出的月份
+
+    def emit_until(last: int):
+        """输出 cursor ~ last 各月的快照"""
+        nonlocal cursor, flows
+        while cursor <= last:
+            if cursor >= since_index:
+                for dept_id in sorted(set(headcount) | set(flows)):
+                    values = dict.fromkeys(FLOW_FIELDS, 0)
+                    values.update(flows.get(dept_id, {}))
+                    values['headcount'] = headcount.get(dept_id, 0)
+                    if any(values.values()):
+                        rows.append((cursor // 12, cursor % 12 + 1, dept_id, values))
+            flows = {}
+            cursor += 1
+
+    for employee_id, event_type, event_date, dept_id, from_dept_id in events:
+        index = month_index(event_date.year, event_date.month)
+        if index > end_index:
+            break
+        if cursor is None:
+            cursor = index
+        emit_until(index - 1)
+
+        after, moves, flow_fields = event_effects(event_type, dept_id, from_dept_id, current.get(employee_id))
+        if after is None:
+            current.pop(employee_id, None)
+        else:
+            current[employee_id] = after
+        for dept, delta in moves.items():
+            headcount[dept] = headcount.get(dept, 0) + delta
+        for dept, field in flow_fields:
+            bucket = flows.setdefault(dept, {})
+            bucket[field] = bucket.get(field, 0) + 1
+
+    if cursor is None:
+        return rows
+    emit_until(end_index)
+    return rows
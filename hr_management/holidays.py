@@ -0,0 +1,251 @@
+"""
+节假日日历 - 进程内日期类型查询
+
+数据保存在 HolidayCalendar 表中（内置 JSON 随迁移导入，新年度通过
+`python manage.py import_holidays` 批量导入，或由可选的离线同步任务从节假日API拉取）。
+首次查询时整表载入内存（每年仅几十行），之后 is_workday / get_info 都是字典查找，
+签到、缺勤标记等请求路径不再访问外部网络。
+
+区间查询：每年预计算一个按年内序号索引的工作日位图（array('B')）及其前缀和（array('I')），
+workdays_between 为两次数组下标运算，workday_mask 为按年切片拼接，不再逐日判断。
+
+跨进程一致性：导入或修改日历时递增缓存中的版本号，各进程最多 VERSION_CHECK_INTERVAL 秒后重新载入。
+"""
+from array import array
+import json
+import logging
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_DIR = Path(__file__).resolve().parent / 'data' / 'holidays'
+HOLIDAY_API_URL = 'http://timor.tech/api/holiday/year/{year}/'
+
+# type: 0=工作日, 1=周末, 2=节假日, 3=调休补班（与 HolidayCalendar.DAY_TYPE_CHOICES 一致）
+TYPE_NAMES = {0: '工作日', 1: '周末', 2: '节假日', 3: '调休补班'}
+WORKDAY_TYPES = (0, 3)
+
+VERSION_KEY = 'holiday_calendar_version'
+VERSION_CHECK_INTERVAL = 60  # 秒
+
+
+def _default_type(day: date) -> int:
+    return 0 if day.weekday() < 5 else 1
+
+
+class HolidayStore:
+    """进程内节假日日历：date -> (类型, 名称)，未收录的日期按周一至周五上班处理"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: Dict[date, Tuple[int, str]] = {}
+        self._years = frozenset()
+        self._version = None
+        self._checked_at = 0.0
+        self._warned_years = set()
+        self._year_masks: Dict[int, Tuple[array, array]] = {}
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _ensure_loaded(self) -> None:
+        if self._version is not None and time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+                return
+            version = self._current_version()
+            if version != self._version:
+                self._load()
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def _load(self) -> None:
+        from .models import HolidayCalendar
+
+        days = {
+            day: (day_type, name)
+            for day, day_type, name in HolidayCalendar.objects.values_list('date', 'day_type', 'name')
+        }
+        self._days = days
+        self._years = frozenset(day.year for day in days)
+        self._year_masks = {}
+        logger.info(f"Holiday calendar loaded: {len(days)} days, years={sorted(self._years)}")
+
+    def invalidate(self) -> None:
+        """日历数据变更后调用：递增全局版本号并让本进程下次查询时重新载入"""
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        self._version = None
+
+    def has_year(self, year: int) -> bool:
+        self._ensure_loaded()
+        return year in self._years
+
+    def day_type(self, day: date) -> int:
+        self._ensure_loaded()
+        entry = self._days.get(day)
+        if entry is not None:
+            return entry[0]
+        if day.year not in self._years and day.year not in self._warned_years:
+            self._warned_years.add(day.year)
+            logger.warning(f"Holiday calendar has no data for {day.year}, falling back to weekday rule")
+        return _default_type(day)
+
+    def is_workday(self, day: date) -> bool:
+        return self.day_type(day) in WORKDAY_TYPES
+
+    def get_info(self, day: date) -> Dict[str, Any]:
+        day_type = self.day_type(day)
+        entry = self._days.get(day)
+        return {
+            'is_workday': day_type in WORKDAY_TYPES,
+            'type': day_type,
+            'type_name': TYPE_NAMES.get(day_type, '未知'),
+            'holiday_name': (entry[1] or None) if entry else None,
+            'from_calendar': entry is not None,
+        }
+
+    def _year_mask(self, year: int) -> Tuple[array, array]:
+        """(位图, 前缀和)：mask[i] 为当年第 i 天是否工作日，prefix[i] 为前 i 天的工作日数"""
+        # 先取 masks 再取 days：_load 先替换 days 后替换 masks，保证不会把旧数据写进新的缓存字典
+        masks = self._year_masks
+        days = self._days
+        cached = masks.get(year)
+        if cached is not None:
+            return cached
+        first = date(year, 1, 1)
+        total = (date(year + 1, 1, 1) - first).days
+        # 先按周一至周五生成，再覆盖日历中的节假日/调休
+        offset = first.weekday()
+        mask = array('B', ((offset + i) % 7 < 5 for i in range(total)))
+        for day, (day_type, _) in days.items():
+            if day.year == year:
+                mask[day.timetuple().tm_yday - 1] = day_type in WORKDAY_TYPES
+        prefix = array('I', [0]) * (total + 1)
+        running = 0
+        for i, flag in enumerate(mask):
+            running += flag
+            prefix[i + 1] = running
+        masks[year] = (mask, prefix)
+        return mask, prefix
+
+    def _year_spans(self, start: date, end: date):
+        """把 [start, end] 拆成按年的 (year, 起始序号, 结束序号+1)"""
+        for year in range(start.year, end.year + 1):
+            lo = start.timetuple().tm_yday - 1 if year == start.year else 0
+            hi = end.timetuple().tm_yday if year == end.year else (date(year + 1, 1, 1) - date(year, 1, 1)).days
+            yield year, lo, hi
+
+    def workday_mask(self, start: date, end: date) -> array:
+        """[start, end] 区间逐日工作日标记（array('B')，1=工作日），start > end 时为空"""
+        self._ensure_loaded()
+        result = array('B')
+        if start > end:
+            return result
+        for year, lo, hi in self._year_spans(start, end):
+            if year not in self._years:
+                self.day_type(date(year, 1, 1))  # 触发缺失年份告警
+            result.extend(self._year_mask(year)[0][lo:hi])
+        return result
+
+    def workdays_between(self, start: date, end: date) -> int:
+        """[start, end] 区间（含两端）的工作日天数"""
+        self._ensure_loaded()
+        if start > end:
+            return 0
+        total = 0
+        for year, lo, hi in self._year_spans(start, end):
+            if year not in self._years:
+                self.day_type(date(year, 1, 1))
+            prefix = self._year_mask(year)[1]
+            total += prefix[hi] - prefix[lo]
+        return total
+
+
+holiday_calendar = HolidayStore()
+
+
+def workdays_between(start: date, end: date) -> int:
+    return holiday_calendar.workdays_between(start, end)
+
+
+def workday_mask(start: date, end: date) -> array:
+    return holiday_calendar.workday_mask(start, end)
+
+
+# ============ 导入 / 同步 ============
+
+def parse_year_payload(payload: Dict[str, Any]) -> List[Tuple[date, int, str]]:
+    """解析节假日API年度格式（内置 JSON 与之相同）：holiday=true 为节假日，false 为调休补班"""
+    entries = []
+    for item in (payload.get('holiday') or {}).values():
+        day_type = 2 if item.get('holiday') else 3
+        entries.append((date.fromisoformat(item['date']), day_type, item.get('name') or ''))
+    return sorted(entries)
+
+
+def load_bundled_year(year: int) -> Optional[List[Tuple[date, int, str]]]:
+    path = BUNDLED_DIR / f'{year}.json'
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return parse_year_payload(json.load(f))
+
+
+def fetch_year(year: int, timeout: int = 10) -> List[Tuple[date, int, str]]:
+    """从节假日API拉取整年数据（仅用于离线同步，不在请求路径上调用）"""
+    import requests
+
+    resp = requests.get(
+        HOLIDAY_API_URL.format(year=year),
+        timeout=timeout,
+        headers={'User-Agent': 'Mozilla/5.0 HR-System/1.0'},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get('code') != 0:
+        raise ValueError(f"Holiday API returned error: {data}")
+    return parse_year_payload(data)
+
+
+def import_year(year: int, entries: Iterable[Tuple[date, int, str]], source: str = 'bundled') -> int:
+    """替换某一年的日历数据（手工维护的 source='manual' 记录保留且优先）"""
+    from django.db import transaction
+    from .models import HolidayCalendar
+
+    rows = [
+        HolidayCalendar(date=day, day_type=day_type, name=name, source=source)
+        for day, day_type, name in entries
+        if day.year == year
+    ]
+    with transaction.atomic():
+        HolidayCalendar.objects.filter(date__year=year).exclude(source='manual').delete()
+        HolidayCalendar.objects.bulk_create(rows, ignore_conflicts=True)
+    holiday_calendar.invalidate()
+    return len(rows)
+
+
+def sync_from_api(years: Iterable[int]) -> Dict[int, int]:
+    """从节假日API同步指定年份；拉取失败或返回空数据时保留现有日历"""
+    result = {}
+    for year in years:
+        try:
+            entries = fetch_year(year)
+        except Exception as e:
+            logger.warning(f"Holiday sync for {year} failed: {e}")
+            continue
+        if not entries:
+            logger.info(f"Holiday API has no data for {year} yet, skipped")
+            continue
+        result[year] = import_year(year, entries, source='api')
+    return result
@@ -0,0 +1,629 @@
+"""
+批量导入引擎 - 流式读取 Excel，分批校验、分块写入
+
+- 读取：openpyxl read_only 模式逐行读取，不把整本工作簿载入内存
+- 校验：每行按 FIELD_MAP 取列后由 Importer.clean() 规范化（日期、时间、金额、枚举），
+  外键（部门、职位、员工）从 prepare() 预加载的 {名称/工号: id} 字典解析，不逐行查库；
+  文件内重复的记录（同一工号、同一员工同一天等）以第一次出现为准，后面的行报错
+- 写入：每 IMPORT_BATCH_SIZE 行一块，每块一个事务，某块写入失败只影响该块。
+  考勤、薪资按唯一键 upsert（bulk_create(update_conflicts=True)）；员工只覆盖文件中填写的字段，
+  已有员工 bulk_update，新员工连同账号 bulk_create
+- 试运行（dry_run）：完成全部校验并统计将新增/更新的条数，不写入数据库，返回完整错误列表
+
+bulk_create / bulk_update 不触发 post_save，导入完成后由 finalize() 统一清理缓存。
+视图见 api/views/import_data.py。
+"""
+import logging
+import time as time_module
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 2000  # 每块写入的行数
+MAX_RESPONSE_ERRORS = 50  # 正式导入时返回的错误条数（试运行返回全部）
+
+
+class ImportFileError(Exception):
+    """文件级错误（无法解析、没有数据），对应 400 响应"""
+
+
+# ============ 单元格解析 ============
+
+def _text(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Excel 把纯数字的工号、手机号读成浮点数
+        value = int(value)
+    return str(value).strip()
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(text: str) -> Optional[date]:
+    # 同一文件中日期大量重复，缓存解析结果；ISO 格式走 fromisoformat 快速路径
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(text, '%Y/%m/%d').date()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_time(text: str) -> Optional[time]:
+    try:
+        return time.fromisoformat(text)  # HH:MM 与 HH:MM:SS
+    except ValueError:
+        return None
+
+
+def _date(value, label: str) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    parsed = _parse_date(_text(value))
+    if parsed is None:
+        raise ValueError(f'{label}格式错误')
+    return parsed
+
+
+def _time(value, label: str) -> time:
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time):
+        return value
+    parsed = _parse_time(_text(value))
+    if parsed is None:
+        raise ValueError(f'{label}格式错误')
+    return parsed
+
+
+def _decimal(value, label: str) -> Decimal:
+    try:
+        return Decimal(_text(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{label}格式错误')
+
+
+def _int(value, label: str) -> int:
+    try:
+        return int(Decimal(_text(value)))
+    except InvalidOperation:
+        raise ValueError(f'{label}格式错误')
+
+
+def _present(value) -> bool:
+    return value is not None and _text(value) != ''
+
+
+# ============ 导入器 ============
+
+class Importer:
+    """导入器基类：子类声明 FIELD_MAP / required，实现 prepare、clean、key、apply"""
+    model_name = ''
+    FIELD_MAP: Dict[str, str] = {}
+    required: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self.touched_employee_ids = set()
+
+    def column_map(self, headers: Sequence[Any]) -> Dict[str, int]:
+        col_map = {}
+        for i, header in enumerate(headers):
+            field = self.FIELD_MAP.get(_text(header))
+            if field and field not in col_map:
+                col_map[field] = i
+        return col_map
+
+    def prepare(self) -> None:
+        """预加载外键字典"""
+
+    def clean(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """校验并规范化一行，不合法时抛出 ValueError"""
+        raise NotImplementedError
+
+    def key(self, row: Dict[str, Any]):
+        """唯一键，用于文件内去重与匹配已有记录"""
+        raise NotImplementedError
+
+    def apply(self, rows: List[Dict[str, Any]], dry_run: bool) -> Tuple[int, int]:
+        """写入一块数据，返回 (新增数, 更新数)；dry_run 时只统计"""
+        raise NotImplementedError
+
+    def finalize(self) -> None:
+        """正式导入完成后清理缓存"""
+        from .signals import invalidate_analytics_caches
+
+        invalidate_analytics_caches(namespaces=[f'attendance:{emp_id}' for emp_id in self.touched_employee_ids])
+
+
+class EmployeeImporter(Importer):
+    model_name = '员工'
+    FIELD_MAP = {
+        '工号': 'employee_id',
+        '员工工号': 'employee_id',
+        '姓名': 'name',
+        '员工姓名': 'name',
+        '性别': 'gender',
+        '手机号': 'phone',
+        '联系电话': 'phone',
+        '邮箱': 'email',
+        '电子邮箱': 'email',
+        '部门': 'department',
+        '所属部门': 'department',
+        '职位': 'position',
+        '岗位': 'position',
+        '入职日期': 'hire_date',
+        '基本工资': 'salary',
+        '薪资': 'salary',
+        '身份证号': 'id_card',
+        '地址': 'address',
+        '家庭住址': 'address',
+        '出生日期': 'birth_date',
+        '紧急联系人': 'emergency_contact',
+        '紧急联系电话': 'emergency_phone',
+    }
+    required = ('employee_id', 'name')
+    GENDER_MAP = {'男': 'M', '女': 'F', 'm': 'M', 'f': 'F', 'male': 'M', 'female': 'F'}
+    TEXT_FIELDS = ('phone', 'email', 'id_card', 'address', 'emergency_contact', 'emergency_phone')
+
+    def prepare(self):
+        from .models import Department, Employee, Position
+
+        # 文本字段长度上限取自模型定义（TextField 无上限）
+        self.text_limits = {}
+        for field in self.TEXT_FIELDS:
+            model_field = Employee._meta.get_field(field)
+            if model_field.max_length:
+                self.text_limits[field] = (model_field.verbose_name, model_field.max_length)
+        self.departments = dict(Department.objects.values_list('name', 'id'))
+        self.positions = {name: (pk, dept_id) for pk, name, dept_id in
+                          Position.objects.values_list('id', 'name', 'department_id')}
+        # 新员工以工号为用户名建账号，不能与任何已有账号重名（不绑定到已有账号）
+        self.employee_codes = set(Employee.objects.values_list('employee_id', flat=True))
+        self.usernames = set(get_user_model().objects.values_list('username', flat=True))
+        self.position_roles: Dict[int, List[int]] = {}
+        for pos_id, role_id in Position.default_roles.through.objects.values_list('position_id', 'role_id'):
+            self.position_roles.setdefault(pos_id, []).append(role_id)
+        self.events = []
+        self.touched_user_ids = set()
+        self.position_changes: Dict[int, Tuple[Optional[int], Optional[int]]] = {}  # 用户ID -> (原职位, 新职位)
+
+    def clean(self, data):
+        row = {'employee_id': _text(data.get('employee_id')), 'name': _text(data.get('name'))}
+        if not row['employee_id'] or not row['name']:
+            raise ValueError('工号或姓名为空')
+        if len(row['employee_id']) > 20:
+            raise ValueError('工号超过20个字符')
+        if row['employee_id'] not in self.employee_codes and row['employee_id'] in self.usernames:
+            raise ValueError(f'用户名 "{row["employee_id"]}" 已存在，不能为新员工创建账号')
+
+        if _present(data.get('gender')):
+            gender = self.GENDER_MAP.get(_text(data['gender']).lower())
+            if gender is None:
+                raise ValueError(f'性别 "{_text(data["gender"])}" 无法识别')
+            row['gender'] = gender
+        for field in self.TEXT_FIELDS:
+            if _present(data.get(field)):
+                value = _text(data[field])
+                if field in self.text_limits:
+                    label, max_length = self.text_limits[field]
+                    if len(value) > max_length:
+                        raise ValueError(f'{label}超过{max_length}个字符')
+                row[field] = value
+        if _present(data.get('department')):
+            dept_name = _text(data['department'])
+            if dept_name not in self.departments:
+                raise ValueError(f'部门 "{dept_name}" 不存在')
+            row['department_id'] = self.departments[dept_name]
+        if _present(data.get('position')):
+            pos_name = _text(data['position'])
+            if pos_name not in self.positions:
+                raise ValueError(f'职位 "{pos_name}" 不存在')
+            row['position_id'], pos_dept_id = self.positions[pos_name]
+            # 与 Employee.save() 一致：部门以职位所属部门为准
+            if pos_dept_id:
+                row['department_id'] = pos_dept_id
+        if _present(data.get('hire_date')):
+            row['hire_date'] = _date(data['hire_date'], '入职日期')
+        if _present(data.get('birth_date')):
+            row['birth_date'] = _date(data['birth_date'], '出生日期')
+        if _present(data.get('salary')):
+            row['salary'] = _decimal(data['salary'], '基本工资')
+        return row
+
+    def key(self, row):
+        return row['employee_id']
+
+    def apply(self, rows, dry_run):
+        from .models import Employee, EmploymentEvent, Role
+
+        existing = {emp.employee_id: emp for emp in Employee.objects.filter(employee_id__in=[r['employee_id'] for r in rows])}
+        new_rows = [r for r in rows if r['employee_id'] not in existing]
+        if dry_run:
+            return len(new_rows), len(rows) - len(new_rows)
+
+        # 已有员工：只覆盖文件中填写了的字段
+        now = timezone.now()
+        to_update, update_fields = [], set()
+        for row in rows:
+            emp = existing.get(row['employee_id'])
+            if emp is None:
+                continue
+            old_dept_id, old_pos_id = emp.department_id, emp.position_id
+            for field, value in row.items():
+                if field != 'employee_id':
+                    setattr(emp, field, value)
+                    update_fields.add(field)
+            emp.updated_at = now
+            to_update.append(emp)
+            if emp.position_id != old_pos_id:
+                self.position_changes[emp.user_id] = (old_pos_id, emp.position_id)
+            if emp.is_employed and emp.department_id != old_dept_id:
+                self.events.append(EmploymentEvent(
+                    employee_id=emp.pk, event_type=EmploymentEvent.TYPE_TRANSFER, event_date=now.date(),
+                    department_id=emp.department_id or 0, from_department_id=old_dept_id or 0, note='Excel 导入',
+                ))
+        if to_update:
+            Employee.objects.bulk_update(to_update, sorted(update_fields | {'updated_at'}), batch_size=IMPORT_BATCH_SIZE)
+
+        created = self._create(new_rows, Employee, EmploymentEvent, Role) if new_rows else 0
+        self.touched_employee_ids.update(emp.id for emp in to_update)
+        self.touched_user_ids.update(emp.user_id for emp in to_update)
+        return created, len(to_update)
+
+    def _create(self, rows, Employee, EmploymentEvent, Role) -> int:
+        """新员工：以工号为用户名建账号（不可用密码，由管理员重置），首次登录需改密码"""
+        User = get_user_model()
+        usernames = [r['employee_id'] for r in rows]
+        users = []
+        for row in rows:
+            user = User(username=row['employee_id'], email=row.get('email', ''))
+            user.set_unusable_password()
+            users.append(user)
+        # 用户名已在 clean() 中校验；导入期间被并发注册占用时违反唯一约束，本块回滚
+        User.objects.bulk_create(users, batch_size=IMPORT_BATCH_SIZE)
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        self.usernames.update(usernames)
+        self.touched_user_ids.update(user_ids.values())
+
+        Employee.objects.bulk_create(
+            [Employee(user_id=user_ids[row['employee_id']], must_change_password=True, **row) for row in rows],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        # 与 EmployeeSerializer.create 一致：分配职位默认角色
+        memberships = [
+            Role.users.through(role_id=role_id, user_id=user_ids[row['employee_id']])
+            for row in rows if row.get('position_id')
+            for role_id in self.position_roles.get(row['position_id'], ())
+        ]
+        if memberships:
+            Role.users.through.objects.bulk_create(memberships, ignore_conflicts=True)
+
+        today = timezone.localdate()
+        for emp_id, dept_id, hire_date in Employee.objects.filter(employee_id__in=usernames).values_list(
+                'id', 'department_id', 'hire_date'):
+            self.events.append(EmploymentEvent(
+                employee_id=emp_id, event_type=EmploymentEvent.TYPE_HIRE, event_date=hire_date or today,
+                department_id=dept_id or 0, note='Excel 导入',
+            ))
+        return len(rows)
+
+    def _sync_position_roles(self) -> None:
+        """与 EmployeeSerializer.update 一致：职位变更时移除原职位默认角色，再分配新职位默认角色"""
+        from .models import Role
+
+        Membership = Role.users.through
+        removed = [
+            (user_id, role_id)
+            for user_id, (old_pos_id, _) in self.position_changes.items()
+            for role_id in self.position_roles.get(old_pos_id, ())
+        ]
+        for i in range(0, len(removed), IMPORT_BATCH_SIZE):
+            chunk = removed[i:i + IMPORT_BATCH_SIZE]
+            condition = Q()
+            for user_id, role_id in chunk:
+                condition |= Q(user_id=user_id, role_id=role_id)
+            Membership.objects.filter(condition).delete()
+        Membership.objects.bulk_create(
+            [
+                Membership(user_id=user_id, role_id=role_id)
+                for user_id, (_, new_pos_id) in self.position_changes.items()
+                for role_id in self.position_roles.get(new_pos_id, ())
+            ],
+            batch_size=IMPORT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def finalize(self):
+        from .invalidation import invalidation_bus
+        from .models import EmploymentEvent, HeadcountSnapshot
+        from .permission_cache import PermissionCache
+        from .services import CacheKeys
+
+        # bulk 写入不触发信号：补写任职事件并重算受影响月份的人数快照
+        if self.events:
+            EmploymentEvent.objects.bulk_create(self.events, batch_size=IMPORT_BATCH_SIZE)
+            first = min(event.event_date for event in self.events)
+            HeadcountSnapshot.rebuild((first.year, first.month))
+        if self.position_changes:
+            with transaction.atomic():
+                self._sync_position_roles()
+        # 职位、部门变化影响权限与签到热缓存
+        PermissionCache.invalidate_users(self.touched_user_ids)
+        invalidation_bus.delete(*(CacheKeys.CHECKIN_EMPLOYEE.format(user_id=uid) for uid in self.touched_user_ids))
+        invalidation_bus.bump('employees', *(f'user:{uid}' for uid in self.touched_user_ids))
+        super().finalize()
+
+
+class AttendanceImporter(Importer):
+    model_name = '考勤'
+    FIELD_MAP = {
+        '工号': 'employee_id',
+        '员工工号': 'employee_id',
+        '日期': 'date',
+        '考勤日期': 'date',
+        '类型': 'attendance_type',
+        '考勤类型': 'attendance_type',
+        '上班时间': 'check_in',
+        '签到时间': 'check_in',
+        '下班时间': 'check_out',
+        '签退时间': 'check_out',
+        '备注': 'notes',
+    }
+    required = ('employee_id', 'date')
+    # 模板中的"正常"对应正常上班打卡记录
+    TYPE_MAP = {
+        '正常': 'check_in',
+        '上班打卡': 'check_in',
+        '下班打卡': 'check_out',
+        '迟到': 'late',
+        '早退': 'early_leave',
+        '缺勤': 'absent',
+        '请假': 'leave',
+        'normal': 'check_in',
+        'check_in': 'check_in',
+        'check_out': 'check_out',
+        'late': 'late',
+        'early_leave': 'early_leave',
+        'absent': 'absent',
+        'leave': 'leave',
+    }
+
+    def prepare(self):
+        from .models import Employee
+        self.employees = dict(Employee.objects.values_list('employee_id', 'id'))
+        self.date_range = None
+
+    def clean(self, data):
+        emp_code = _text(data.get('employee_id'))
+        if emp_code not in self.employees:
+            raise ValueError(f'工号 "{emp_code}" 不存在')
+        if not _present(data.get('date')):
+            raise ValueError('日期为空')
+        row = {
+            'employee_id': self.employees[emp_code],
+            'date': _date(data['date'], '日期'),
+            'attendance_type': 'check_in',
+            'check_in_time': _time(data['check_in'], '上班时间') if _present(data.get('check_in')) else None,
+            'check_out_time': _time(data['check_out'], '下班时间') if _present(data.get('check_out')) else None,
+            'notes': _text(data.get('notes')),
+        }
+        if _present(data.get('attendance_type')):
+            att_type = self.TYPE_MAP.get(_text(data['attendance_type']))
+            if att_type is None:
+                raise ValueError(f'考勤类型 "{_text(data["attendance_type"])}" 无法识别')
+            row['attendance_type'] = att_type
+        return row
+
+    def key(self, row):
+        return row['employee_id'], row['date']
+
+    def apply(self, rows, dry_run):
+        from .models import Attendance
+
+        low, high = min(r['date'] for r in rows), max(r['date'] for r in rows)
+        existing = set(Attendance.objects.filter(
+            employee_id__in={r['employee_id'] for r in rows},
+            date__range=(low, high),
+        ).values_list('employee_id', 'date'))
+        updated = sum(1 for r in rows if self.key(r) in existing)
+        if dry_run:
+            return len(rows) - updated, updated
+
+        # 一条 INSERT ... ON CONFLICT (employee_id, date) DO UPDATE 完成新增与覆盖
+        Attendance.objects.bulk_create(
+            [Attendance(**row) for row in rows],
+            batch_size=IMPORT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['employee', 'date'],
+            update_fields=['attendance_type', 'check_in_time', 'check_out_time', 'notes'],
+        )
+        self.touched_employee_ids.update(r['employee_id'] for r in rows)
+        if self.date_range:
+            low, high = min(low, self.date_range[0]), max(high, self.date_range[1])
+        self.date_range = (low, high)
+        return len(rows) - updated, updated
+
+    def finalize(self):
+        from .models import AttendanceDailyStat
+
+        # bulk_create 不触发信号：按导入涉及的日期区间重算考勤日汇总
+        if self.date_range:
+            AttendanceDailyStat.rebuild(*self.date_range)
+        super().finalize()
+
+
+class SalaryImporter(Importer):
+    model_name = '薪资'
+    FIELD_MAP = {
+        '工号': 'employee_id',
+        '员工工号': 'employee_id',
+        '年份': 'year',
+        '月份': 'month',
+        '基本工资': 'basic_salary',
+        '奖金': 'bonus',
+        '津贴': 'allowance',
+    }
+    required = ('employee_id', 'year', 'month', 'basic_salary')
+
+    def prepare(self):
+        from .models import Employee
+        self.employees = dict(Employee.objects.values_list('employee_id', 'id'))
+        self.periods = set()
+
+    def clean(self, data):
+        emp_code = _text(data.get('employee_id'))
+        if emp_code not in self.employees:
+            raise ValueError(f'工号 "{emp_code}" 不存在')
+        year, month = _int(data.get('year'), '年份'), _int(data.get('month'), '月份')
+        if not 1 <= month <= 12:
+            raise ValueError('月份超出范围')
+        if not _present(data.get('basic_salary')):
+            raise ValueError('基本工资为空')
+        return {
+            'employee_id': self.employees[emp_code],
+            'year': year,
+            'month': month,
+            'basic_salary': _decimal(data['basic_salary'], '基本工资'),
+            'bonus': _decimal(data['bonus'], '奖金') if _present(data.get('bonus')) else Decimal('0'),
+            'allowance': _decimal(data['allowance'], '津贴') if _present(data.get('allowance')) else Decimal('0'),
+        }
+
+    def key(self, row):
+        return row['employee_id'], row['year'], row['month']
+
+    def apply(self, rows, dry_run):
+        from .models import SalaryRecord
+
+        # (员工, 年, 月) -> 加班费
+        existing = {
+            (emp_id, year, month): overtime_pay
+            for emp_id, year, month, overtime_pay in SalaryRecord.objects.filter(
+                employee_id__in={r['employee_id'] for r in rows},
+                year__in={r['year'] for r in rows},
+                month__in={r['month'] for r in rows},
+            ).values_list('employee_id', 'year', 'month', 'overtime_pay')
+        }
+        updated = sum(1 for r in rows if self.key(r) in existing)
+        if dry_run:
+            return len(rows) - updated, updated
+
+        # bulk 写入不经过 SalaryRecord.save()，在这里计算实发工资（已有记录保留原加班费）
+        records = []
+        for row in rows:
+            rec = SalaryRecord(**row)
+            rec.overtime_pay = existing.get(self.key(row), Decimal('0'))
+            rec.net_salary = rec.basic_salary + rec.bonus + rec.overtime_pay + rec.allowance
+            records.append(rec)
+        SalaryRecord.objects.bulk_create(
+            records,
+            batch_size=IMPORT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['employee', 'year', 'month'],
+            update_fields=['basic_salary', 'bonus', 'allowance', 'net_salary'],
+        )
+        self.periods.update((r['year'], r['month']) for r in rows)
+        return len(rows) - updated, updated
+
+    def finalize(self):
+        from .models import PayrollMonthlyStat
+
+        # bulk_create 不触发信号：重算导入涉及月份的薪资汇总
+        PayrollMonthlyStat.rebuild(self.periods)
+        super().finalize()
+
+
+# ============ 执行 ============
+
+def _flush(importer: Importer, batch: List[Tuple[int, Dict[str, Any]]], dry_run: bool,
+           result: Dict[str, Any], errors: List[str]) -> None:
+    rows = [row for _, row in batch]
+    try:
+        with transaction.atomic():
+            created, updated = importer.apply(rows, dry_run)
+    except (DatabaseError, ValueError) as e:
+        logger.warning(f"Import chunk of {len(batch)} {importer.model_name} rows failed: {e}")
+        errors.append(f'第 {batch[0][0]}-{batch[-1][0]} 行: 写入失败（{e}），本块 {len(batch)} 条未导入')
+        result['failed'] += len(batch)
+        return
+    result['created'] += created
+    result['updated'] += updated
+    result['success'] += len(batch)
+
+
+def run_import(importer: Importer, file, dry_run: bool = False,
+               batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """流式导入 Excel 文件；文件无法解析或没有数据时抛出 ImportFileError"""
+    started = time_module.perf_counter()
+    try:
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f'解析 Excel 失败: {str(e)}')
+
+    result = {'dry_run': dry_run, 'total': 0, 'success': 0, 'failed': 0, 'created': 0, 'updated': 0}
+    errors: List[str] = []
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = next(rows, None)
+        if headers is None:
+            raise ImportFileError('文件为空或只有表头')
+        col_map = importer.column_map(headers)
+        missing = [field for field in importer.required if field not in col_map]
+        if missing:
+            return {**result, 'errors': [f'缺少必填列: {missing}'], 'error_count': 1}
+
+        importer.prepare()
+        columns = list(col_map.items())
+        seen: Dict[Any, int] = {}
+        batch: List[Tuple[int, Dict[str, Any]]] = []
+        for row_idx, row in enumerate(rows, start=2):
+            # read_only 模式会读到格式残留的空行
+            if not row or all(value is None or value == '' for value in row):
+                continue
+            result['total'] += 1
+            data = {field: row[idx] if idx < len(row) else None for field, idx in columns}
+            try:
+                cleaned = importer.clean(data)
+                key = importer.key(cleaned)
+                if key in seen:
+                    raise ValueError(f'与第 {seen[key]} 行重复')
+                seen[key] = row_idx
+            except ValueError as e:
+                errors.append(f'第 {row_idx} 行: {e}')
+                result['failed'] += 1
+                continue
+            batch.append((row_idx, cleaned))
+            if len(batch) >= batch_size:
+                _flush(importer, batch, dry_run, result, errors)
+                batch = []
+        if batch:
+            _flush(importer, batch, dry_run, result, errors)
+    finally:
+        wb.close()
+
+    if result['total'] == 0:
+        raise ImportFileError('文件为空或只有表头')
+    if not dry_run and result['success']:
+        importer.finalize()
+
+    elapsed = time_module.perf_counter() - started
+    result.update({
+        'errors': errors if dry_run else errors[:MAX_RESPONSE_ERRORS],
+        'error_count': len(errors),
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_sec': int(result['total'] / elapsed) if elapsed > 0 else None,
+    })
+    return result
@@ -0,0 +1,161 @@
+"""
+缓存失效总线 - 合并同一请求/任务内的失效，事务提交后一次性下发
+
+    from .invalidation import invalidation_bus
+
+    invalidation_bus.delete(CacheKeys.EMPLOYEE_COUNT)         # 需要删除的缓存键
+    invalidation_bus.mark_dirty(CacheKeys.REPORT_SNAPSHOT)    # 快照键：只标记为脏（见 snapshot_cache）
+    invalidation_bus.bump('attendance:17')                    # 命名空间：递增代数（见 cache_namespace）
+
+    with invalidation_bus.batch():                            # 请求/后台任务范围，由中间件与任务装饰器包裹
+        ...
+
+- 去重：同一批次内重复的键只下发一次，批量导入、自动标记缺勤时成千上万次信号只产生一次删除
+- 事务感知：在事务内登记的键挂到该事务的 on_commit 上，事务回滚则一并丢弃，不会误删缓存
+- 下发：一次 delete_many + 一次 set_many（脏标记）+ 一次 set_many（命名空间代数），Redis 下各为一次往返
+- 未处于批次也不在事务内时立即下发，行为与直接调用 cache.delete 相同
+- 计数：requested（登记次数）、issued（实际下发的键数）、coalesced（被合并掉的次数）、
+  discarded（随事务回滚丢弃的键数）、flushes（下发次数），见 stats()
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, Set
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ('delete', 'dirty', 'bump')
+
+    def __init__(self):
+        self.delete: Set[str] = set()
+        self.dirty: Set[str] = set()
+        self.bump: Set[str] = set()
+
+    def merge(self, other: '_Pending') -> None:
+        self.delete |= other.delete
+        self.dirty |= other.dirty
+        self.bump |= other.bump
+
+    def __len__(self):
+        return len(self.delete) + len(self.dirty) + len(self.bump)
+
+
+class InvalidationBus:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(('requested', 'issued', 'discarded', 'flushes'), 0)
+
+    # ---------- 登记 ----------
+    def delete(self, *keys: str) -> None:
+        """登记需要删除的缓存键"""
+        self._collect('delete', keys)
+
+    def mark_dirty(self, *keys: str) -> None:
+        """登记需要标记为脏的快照键"""
+        self._collect('dirty', keys)
+
+    def bump(self, *namespaces: str) -> None:
+        """登记需要递增代数的缓存命名空间"""
+        self._collect('bump', namespaces)
+
+    def _collect(self, kind: str, keys: Iterable[str]) -> None:
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        self._count(requested=len(keys))
+        if connection.in_atomic_block:
+            getattr(self._transaction_pending(), kind).update(keys)
+            return
+        pending = _Pending()
+        getattr(pending, kind).update(keys)
+        self._deliver(pending)
+
+    def _transaction_pending(self) -> _Pending:
+        """当前事务对应的待下发集合；同一事务只注册一次 on_commit"""
+        bound = getattr(self._local, 'transaction', None)
+        if bound is not None:
+            callback, pending = bound
+            # 事务回滚时 Django 会清空 run_on_commit，回调不在其中即说明已是新事务
+            if any(entry[1] is callback for entry in connection.run_on_commit):
+                return pending
+            self._count(discarded=len(pending))
+
+        pending = _Pending()
+
+        def callback():
+            if getattr(self._local, 'transaction', (None,))[0] is callback:
+                self._local.transaction = None
+            self._deliver(pending)
+
+        transaction.on_commit(callback)
+        self._local.transaction = (callback, pending)
+        return pending
+
+    # ---------- 批次 ----------
+    @contextmanager
+    def batch(self):
+        """批次范围内（含已提交的事务）登记的键在退出时统一下发"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._local.batch = _Pending()
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                pending, self._local.batch = self._local.batch, None
+                self._flush(pending)
+
+    def batched(self, func: Callable) -> Callable:
+        """以批次包裹函数（后台任务入口）"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.batch():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _deliver(self, pending: _Pending) -> None:
+        if getattr(self._local, 'depth', 0):
+            self._local.batch.merge(pending)
+        else:
+            self._flush(pending)
+
+    # ---------- 下发 ----------
+    def _flush(self, pending: _Pending) -> None:
+        if not pending:
+            return
+        try:
+            if pending.delete:
+                cache.delete_many(sorted(pending.delete))
+            if pending.dirty:
+                from . import snapshot_cache
+                snapshot_cache.mark_dirty(*sorted(pending.dirty))
+            if pending.bump:
+                from . import cache_namespace
+                cache_namespace.bump(*pending.bump)
+        except Exception:
+            logger.exception('Cache invalidation flush failed (%s keys)', len(pending))
+            return
+        self._count(issued=len(pending), flushes=1)
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, value in deltas.items():
+                self._counters[name] += value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters['coalesced'] = max(counters['requested'] - counters['issued'] - counters['discarded'], 0)
+        return counters
+
+
+invalidation_bus = InvalidationBus()
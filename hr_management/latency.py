@@ -0,0 +1,317 @@
+"""
+接口延迟直方图 - 固定桶的对数线性直方图，按路由模板聚合，可经 Redis 跨进程合并
+
+    latency_registry.record('GET /api/leaves/<int:pk>/', 12.3, db_queries=4, db_time_ms=1.8)
+    routes = latency_registry.snapshot()          # {路由: RouteStats}，配置 Redis 时为所有 worker 的合计
+    routes['GET /api/leaves/<int:pk>/'].latency.percentile(0.95)
+
+- 桶：下限 min_value 起每翻一倍为一档，每档再线性均分 SUB_BUCKETS 份（相对误差 ≤ 25%）；
+  另有低于下限、超过上限各一个桶。桶数固定，每个接口的内存占用恒定
+- 键：解析后的路由模板（'GET /api/leaves/<int:pk>/approve/'），而不是原始路径，接口数量有上限
+- 百分位：按桶累加计数，O(桶数)，无需排序
+- 合并：各进程把增量每 FLUSH_SECONDS 秒用一次 pipeline 写入 Redis 哈希（HINCRBY），
+  读取时汇总所有进程；缓存后端不是 Redis 时只统计本进程
+- 计数自进程启动（或 Redis 中的数据创建）起累计，与 Prometheus 的 histogram 语义一致
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKETS = 4
+FLUSH_SECONDS = getattr(settings, 'APM_HISTOGRAM_FLUSH_SECONDS', 5)
+REDIS_PREFIX = 'hr:apm:'
+
+# 指标名 → (下限, 档数)
+HISTOGRAMS = {
+    'latency': (0.5, 18),      # 毫秒：0.5ms ~ 131s
+    'db_time': (0.05, 18),     # 毫秒：0.05ms ~ 13s
+    'db_queries': (1, 12),     # 次：1 ~ 4096
+}
+
+
+@lru_cache(maxsize=None)
+def bucket_bounds(min_value: float, octaves: int) -> Tuple[float, ...]:
+    """各桶的上界（最后一个溢出桶为 inf）"""
+    bounds = [min_value]
+    for octave in range(octaves):
+        base = min_value * (1 << octave)
+        bounds.extend(base * (1 + (sub + 1) / SUB_BUCKETS) for sub in range(SUB_BUCKETS))
+    bounds.append(math.inf)
+    return tuple(bounds)
+
+
+class LogLinearHistogram:
+    __slots__ = ('min_value', 'octaves', 'counts', 'count', 'sum')
+
+    def __init__(self, min_value: float, octaves: int):
+        self.min_value = min_value
+        self.octaves = octaves
+        self.counts = [0] * (octaves * SUB_BUCKETS + 2)
+        self.count = 0
+        self.sum = 0.0
+
+    def bucket_of(self, value: float) -> int:
+        if value < self.min_value:
+            return 0
+        ratio = value / self.min_value
+        octave = int(math.log2(ratio))
+        if octave >= self.octaves:
+            return len(self.counts) - 1
+        sub = int((ratio / (1 << octave) - 1) * SUB_BUCKETS)
+        return 1 + octave * SUB_BUCKETS + min(max(sub, 0), SUB_BUCKETS - 1)
+
+    def record(self, value: float) -> None:
+        self.counts[self.bucket_of(value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: 'LogLinearHistogram') -> None:
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.count += other.count
+        self.sum += other.sum
+
+    @property
+    def bounds(self) -> Tuple[float, ...]:
+        return bucket_bounds(self.min_value, self.octaves)
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0
+
+    def percentile(self, p: float) -> float:
+        """第 p 分位数：定位所在桶后在桶内线性插值（溢出桶返回最大有限上界）"""
+        if not self.count:
+            return 0
+        target = max(p * self.count, 1)
+        seen = 0
+        bounds = self.bounds
+        for i, value in enumerate(self.counts):
+            if value and seen + value >= target:
+                if i == len(bounds) - 1:
+                    return bounds[-2]
+                lower = bounds[i - 1] if i else 0
+                return lower + (bounds[i] - lower) * (target - seen) / value
+            seen += value
+        return bounds[-2]
+
+    def max_bound(self) -> float:
+        """最大样本所在桶的上界"""
+        bounds = self.bounds
+        for i in range(len(self.counts) - 1, -1, -1):
+            if self.counts[i]:
+                return bounds[i] if i < len(bounds) - 1 else bounds[-2]
+        return 0
+
+
+class RouteStats:
+    """单个接口的统计：延迟 / 数据库耗时 / 查询数直方图 + 计数"""
+
+    __slots__ = ('latency', 'db_time', 'db_queries', 'errors', 'n_plus_one', 'last_seen')
+
+    def __init__(self):
+        for name, (min_value, octaves) in HISTOGRAMS.items():
+            setattr(self, name, LogLinearHistogram(min_value, octaves))
+        self.errors = 0
+        self.n_plus_one = 0
+        self.last_seen: Optional[str] = None
+
+    @property
+    def total(self) -> int:
+        return self.latency.count
+
+    def merge(self, other: 'RouteStats') -> None:
+        for name in HISTOGRAMS:
+            getattr(self, name).merge(getattr(other, name))
+        self.errors += other.errors
+        self.n_plus_one += other.n_plus_one
+        if other.last_seen and (self.last_seen is None or other.last_seen > self.last_seen):
+            self.last_seen = other.last_seen
+
+    # ---------- Redis 哈希 ----------
+    def to_increments(self) -> Tuple[Dict[str, int], Dict[str, float]]:
+        """(HINCRBY 字段, HINCRBYFLOAT 字段)，只含非零项"""
+        ints = {'errors': self.errors, 'n_plus_one': self.n_plus_one}
+        floats = {}
+        for name in HISTOGRAMS:
+            hist = getattr(self, name)
+            ints[f'{name}:n'] = hist.count
+            ints.update((f'{name}:{i}', value) for i, value in enumerate(hist.counts) if value)
+            floats[f'{name}:sum'] = hist.sum
+        return {k: v for k, v in ints.items() if v}, {k: v for k, v in floats.items() if v}
+
+    @classmethod
+    def from_hash(cls, data: Dict[str, str]) -> 'RouteStats':
+        stats = cls()
+        for field, value in data.items():
+            name, _, part = field.partition(':')
+            if name in HISTOGRAMS:
+                hist = getattr(stats, name)
+                if part == 'n':
+                    hist.count = int(value)
+                elif part == 'sum':
+                    hist.sum = float(value)
+                elif part.isdigit() and int(part) < len(hist.counts):
+                    hist.counts[int(part)] = int(value)
+            elif field in ('errors', 'n_plus_one'):
+                setattr(stats, field, int(value))
+            elif field == 'last_seen':
+                stats.last_seen = value
+        return stats
+
+
+def _redis_client():
+    """缓存后端为 django-redis 时返回其原生连接，否则返回 None"""
+    if not latency_registry.shared:
+        return None
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception:
+        logger.debug('Redis unavailable for latency histograms', exc_info=True)
+        return None
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class LatencyRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, RouteStats] = {}    # 本进程累计
+        self._pending: Dict[str, RouteStats] = {}   # 尚未写入 Redis 的增量
+        self._last_flush = time.monotonic()
+        self._shared: Optional[bool] = None
+
+    @property
+    def shared(self) -> bool:
+        """缓存后端是否为 Redis（是则跨进程合并）"""
+        if self._shared is None:
+            self._shared = 'django_redis' in settings.CACHES.get('default', {}).get('BACKEND', '')
+        return self._shared
+
+    def record(self, route: str, duration_ms: float, is_error: bool = False,
+               db_queries: Optional[int] = None, db_time_ms: Optional[float] = None,
+               n_plus_one: bool = False) -> None:
+        now = datetime.now().isoformat()
+        buckets = (self._routes, self._pending) if self.shared else (self._routes,)
+        with self._lock:
+            for bucket in buckets:
+                stats = bucket.get(route)
+                if stats is None:
+                    stats = bucket[route] = RouteStats()
+                stats.latency.record(duration_ms)
+                if db_queries is not None:
+                    stats.db_queries.record(db_queries)
+                    stats.db_time.record(db_time_ms or 0)
+                stats.errors += bool(is_error)
+                stats.n_plus_one += bool(n_plus_one)
+                stats.last_seen = now
+            due = self.shared and time.monotonic() - self._last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """把本进程的增量写入 Redis"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        client = _redis_client()
+        if client is None or not pending:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for route, stats in pending.items():
+                key = f'{REDIS_PREFIX}route:{route}'
+                ints, floats = stats.to_increments()
+                for field, value in ints.items():
+                    pipe.hincrby(key, field, value)
+                for field, value in floats.items():
+                    pipe.hincrbyfloat(key, field, value)
+                pipe.hset(key, 'last_seen', stats.last_seen or '')
+            pipe.sadd(f'{REDIS_PREFIX}routes', *pending)
+            pipe.execute()
+        except Exception:
+            logger.warning('Failed to flush latency histograms to Redis', exc_info=True)
+
+    def local_snapshot(self) -> Dict[str, RouteStats]:
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                copy = RouteStats()
+                copy.merge(stats)
+                result[route] = copy
+            return result
+
+    def snapshot(self) -> Dict[str, RouteStats]:
+        """所有进程合并后的统计；无 Redis 或读取失败时返回本进程统计"""
+        client = _redis_client()
+        if client is None:
+            return self.local_snapshot()
+        self.flush()
+        try:
+            routes = sorted(_decode(route) for route in client.smembers(f'{REDIS_PREFIX}routes'))
+            pipe = client.pipeline(transaction=False)
+            for route in routes:
+                pipe.hgetall(f'{REDIS_PREFIX}route:{route}')
+            rows = pipe.execute()
+        except Exception:
+            logger.warning('Failed to read latency histograms from Redis', exc_info=True)
+            return self.local_snapshot()
+        return {
+            route: RouteStats.from_hash({_decode(k): _decode(v) for k, v in row.items()})
+            for route, row in zip(routes, rows) if row
+        }
+
+
+def prometheus_text(routes: Dict[str, RouteStats]) -> str:
+    """按 Prometheus 文本格式（0.0.4）导出"""
+    def label(route: str) -> str:
+        method, _, path = route.partition(' ')
+        path = path.replace('\\', '\\\\').replace('"', '\\"')
+        return f'method="{method}",route="{path}"'
+
+    def le(bound: float) -> str:
+        return '+Inf' if math.isinf(bound) else repr(round(bound / 1000, 9))
+
+    lines: List[str] = []
+    for metric, name, help_text in (
+        ('latency', 'hr_http_request_duration_seconds', 'API request latency by route'),
+        ('db_time', 'hr_http_request_db_seconds', 'Database time per API request by route'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for route, stats in routes.items():
+            hist = getattr(stats, metric)
+            labels = label(route)
+            cumulative = 0
+            for bound, value in zip(hist.bounds, hist.counts):
+                cumulative += value
+                lines.append(f'{name}_bucket{{{labels},le="{le(bound)}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum / 1000}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+    for name, help_text, value_of in (
+        ('hr_http_requests_total', 'API requests by route', lambda s: s.total),
+        ('hr_http_request_errors_total', 'API requests with status >= 400 by route', lambda s: s.errors),
+        ('hr_http_request_db_queries_total', 'Database queries issued by API requests by route',
+         lambda s: int(s.db_queries.sum)),
+        ('hr_http_request_n_plus_one_total', 'API requests flagged with N+1 query patterns by route',
+         lambda s: s.n_plus_one),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for route, stats in routes.items():
+            lines.append(f'{name}{{{label(route)}}} {value_of(stats)}')
+    return '\n'.join(lines) + '\n'
+
+
+latency_registry = LatencyRegistry()
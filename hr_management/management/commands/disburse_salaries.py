@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from hr_management.models import SalaryRecord
+from hr_management.models import PayrollMonthlyStat, SalaryRecord
 
 
 def _previous_year_month(dt):
@@ -31,6 +31,7 @@ class Command(BaseCommand):
 
         paid_time = timezone.now()
         updated = qs.update(paid=True, paid_at=paid_time)
+        PayrollMonthlyStat.rebuild([(year, month)])
         self.stdout.write(self.style.SUCCESS(f"已标记发薪：{updated} 条（{year}-{month}，时间 {paid_time}）"))
         if updated == 0:
             self.stdout.write(self.style.WARNING(
@@ -0,0 +1,48 @@
+"""
+批量导入年度节假日数据到 HolidayCalendar
+
+用法：
+    python manage.py import_holidays                 # 导入内置数据中的当年与次年
+    python manage.py import_holidays 2026 2027       # 导入指定年份的内置数据
+    python manage.py import_holidays 2027 --file holidays_2027.json
+    python manage.py import_holidays 2027 --from-api # 从节假日API拉取（需要外网）
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from hr_management.holidays import load_bundled_year, parse_year_payload, fetch_year, import_year
+
+
+class Command(BaseCommand):
+    help = '批量导入年度节假日/调休数据（内置JSON、指定文件或节假日API）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', nargs='*', type=int, help='年份，默认当年与次年')
+        parser.add_argument('--file', help='节假日API年度格式的 JSON 文件（仅可指定一个年份）')
+        parser.add_argument('--from-api', action='store_true', help='从节假日API拉取')
+
+    def handle(self, *args, **options):
+        current_year = timezone.localdate().year
+        years = options['years'] or [current_year, current_year + 1]
+        file_path = options.get('file')
+        if file_path and len(years) != 1:
+            raise CommandError('--file 只能与一个年份同时使用')
+
+        for year in years:
+            if file_path:
+                with open(file_path, encoding='utf-8') as f:
+                    entries, source = parse_year_payload(json.load(f)), 'file'
+            elif options.get('from_api'):
+                try:
+                    entries, source = fetch_year(year), 'api'
+                except Exception as e:
+                    raise CommandError(f'{year} 年节假日拉取失败：{e}')
+            else:
+                entries, source = load_bundled_year(year), 'bundled'
+
+            if not entries:
+                self.stdout.write(self.style.WARNING(f'{year} 年无可导入数据，已跳过'))
+                continue
+
+            count = import_year(year, entries, source=source)
+            self.stdout.write(self.style.SUCCESS(f'{year} 年节假日已导入：{count} 天（来源：{source}）'))
@@ -0,0 +1,37 @@
+"""
+根据 Attendance 重算考勤日汇总（AttendanceDailyStat）
+
+用法：
+    python manage.py rebuild_attendance_stats               # 全部日期
+    python manage.py rebuild_attendance_stats --days 7      # 最近 7 天
+    python manage.py rebuild_attendance_stats --start 2025-01-01 --end 2025-01-31
+（适用于 queryset.update()、bulk_create 等绕过信号的批量写入之后）
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from hr_management.models import AttendanceDailyStat
+
+
+class Command(BaseCommand):
+    help = '重算考勤日汇总（按日期、部门、考勤类型统计的考勤记录数）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='只重算最近 N 天')
+        parser.add_argument('--start', type=str, help='开始日期 YYYY-MM-DD')
+        parser.add_argument('--end', type=str, help='结束日期 YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('日期格式应为 YYYY-MM-DD')
+        if options['days']:
+            end = timezone.localdate()
+            start = end - timedelta(days=options['days'] - 1)
+
+        count = AttendanceDailyStat.rebuild(start, end)
+        scope = f'{start or "最早"} ~ {end or "最新"}'
+        self.stdout.write(self.style.SUCCESS(f'考勤日汇总已重算（{scope}）：{count} 条'))
@@ -0,0 +1,18 @@
+"""
+根据 Department.parent 全量重建部门闭包表
+
+用法：python manage.py rebuild_department_closure
+（适用于通过 queryset.update() 等绕过信号的批量修改之后）
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from hr_management.models import DepartmentClosure
+
+
+class Command(BaseCommand):
+    help = '全量重建部门闭包表（部门层级关系）'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = DepartmentClosure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'部门闭包表已重建：{count} 条关系'))
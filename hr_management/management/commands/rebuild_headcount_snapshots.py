@@ -0,0 +1,31 @@
+"""
+根据任职事件（EmploymentEvent）重算月度人数快照（HeadcountSnapshot）
+
+用法：
+    python manage.py rebuild_headcount_snapshots                  # 全部月份
+    python manage.py rebuild_headcount_snapshots --since 2025-01  # 从指定月份重算到本月
+"""
+from django.core.management.base import BaseCommand, CommandError
+from hr_management.models import HeadcountSnapshot
+
+
+class Command(BaseCommand):
+    help = '按任职事件重算月度人数快照（月末在职人数与当月入职/离职/调岗人数）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, help='起始月份 YYYY-MM，默认全部')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                year, month = (int(part) for part in options['since'].split('-'))
+            except ValueError:
+                raise CommandError('月份格式应为 YYYY-MM')
+            if not 1 <= month <= 12:
+                raise CommandError('月份格式应为 YYYY-MM')
+            since = (year, month)
+
+        count = HeadcountSnapshot.rebuild(since)
+        scope = options['since'] or '全部月份'
+        self.stdout.write(self.style.SUCCESS(f'月度人数快照已重算（{scope} 起）：{count} 条'))
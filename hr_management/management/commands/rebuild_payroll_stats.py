@@ -0,0 +1,32 @@
+"""
+根据 SalaryRecord 重算薪资月度汇总（PayrollMonthlyStat）
+
+用法：
+    python manage.py rebuild_payroll_stats                       # 全部月份
+    python manage.py rebuild_payroll_stats --year 2025 --month 6
+（适用于 queryset.update()、bulk_create 等绕过信号的批量写入之后）
+"""
+from django.core.management.base import BaseCommand, CommandError
+from hr_management.models import PayrollMonthlyStat
+
+
+class Command(BaseCommand):
+    help = '重算薪资月度汇总（按年月、部门统计的薪资记录数与实发合计）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='年份')
+        parser.add_argument('--month', type=int, help='月份(1-12)，需与 --year 一起使用')
+
+    def handle(self, *args, **options):
+        year, month = options['year'], options['month']
+        if month and not year:
+            raise CommandError('--month 需与 --year 一起使用')
+        if year and month:
+            periods, scope = [(year, month)], f'{year}-{month:02d}'
+        elif year:
+            periods, scope = [(year, m) for m in range(1, 13)], f'{year} 年'
+        else:
+            periods, scope = None, '全部月份'
+
+        count = PayrollMonthlyStat.rebuild(periods)
+        self.stdout.write(self.style.SUCCESS(f'薪资月度汇总已重算（{scope}）：{count} 条'))
@@ -0,0 +1,232 @@
+"""
+函数结果缓存 - 两级缓存 + 防击穿
+
+    @memoize('dept_paths', 3600, namespaces=('org',), l1_ttl=5)
+    def get_path_map():
+        ...
+
+    value = get_or_compute('some_key', lambda: expensive(), 300)
+
+- 键构造：装饰时解析一次函数签名，调用时只做位置参数到参数名的映射，不再每次 inspect.signature
+- L1：可选的进程内 LRU（容量有限、TTL 很短），命中时不访问共享缓存；
+  本进程递增命名空间时同步清除（见 cache_namespace.on_bump），跨进程的陈旧时间不超过 l1_ttl
+- L2：Django cache，条目为 (值, 过期时间, 计算耗时)；None / 0 / 空列表同样缓存
+- 提前刷新：临近过期时按计算耗时以一定概率提前重算（XFetch），热点键不会在同一时刻集体过期
+- single-flight：未命中时用 cache.add 抢锁，只有一个请求回源，其余请求短暂等待其结果，超时后自行计算
+- 指标：命中/未命中/L1 命中/回源耗时写入 monitoring.metrics
+"""
+import hashlib
+import inspect
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+
+from . import cache_namespace
+
+EARLY_REFRESH_BETA = 1.0  # 越大越早刷新
+LOCK_TTL = 60             # 回源锁最长持有时间（秒）
+WAIT_SECONDS = 5          # 等待其他请求回源的最长时间
+_POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+def _record(method: str, *args) -> None:
+    """写入 monitoring.metrics（失败不影响业务流程）"""
+    try:
+        from .monitoring import metrics
+        getattr(metrics, method)(*args)
+    except Exception:
+        pass
+
+
+class _LocalTTLCache:
+    """线程安全、容量有限的进程内 TTL 缓存，条目记录所属命名空间"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires, _, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, namespaces: Tuple[str, ...]) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, namespaces, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def forget_namespaces(self, namespaces) -> None:
+        with self._lock:
+            for key in [key for key, (_, owned, _) in self._data.items() if namespaces.intersection(owned)]:
+                del self._data[key]
+
+
+def _read(key: str) -> Any:
+    """读取 L2 条目；未命中或被选中提前刷新时返回 _MISSING"""
+    entry = cache.get(key)
+    if not isinstance(entry, tuple) or len(entry) != 3:
+        return _MISSING
+    value, expires, delta = entry
+    # XFetch：剩余时间越短、计算越慢，越可能由本次请求提前重算
+    if time.time() - delta * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) >= expires:
+        return _MISSING
+    return value
+
+
+def _compute(key: str, func: Callable[[], Any], timeout: int) -> Any:
+    started = time.perf_counter()
+    value = func()
+    delta = time.perf_counter() - started
+    cache.set(key, (value, time.time() + timeout, delta), timeout)
+    _record('record_cache_compute', delta * 1000)
+    return value
+
+
+def get_or_compute(key: str, func: Callable[[], Any], timeout: int) -> Any:
+    """读取 L2，未命中时 single-flight 回源"""
+    value = _read(key)
+    if value is not _MISSING:
+        _record('record_cache_hit')
+        return value
+    _record('record_cache_miss')
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TTL):
+        try:
+            return _compute(key, func, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    # 其他请求正在回源：提前刷新的场景下旧值仍在，直接返回；否则等待其结果
+    entry = cache.get(key)
+    if isinstance(entry, tuple) and len(entry) == 3:
+        return entry[0]
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(_POLL_INTERVAL)
+        entry = cache.get(key)
+        if isinstance(entry, tuple) and len(entry) == 3:
+            return entry[0]
+    return _compute(key, func, timeout)
+
+
+class _KeyBuilder:
+    """预编译的缓存键构造器"""
+
+    def __init__(self, func: Callable, template: str, namespaces: Iterable[str]):
+        self.func_name = func.__name__
+        self.template = template
+        self.namespaces = tuple(namespaces)
+        signature = inspect.signature(func)
+        params = signature.parameters.values()
+        self.positional = [
+            p.name for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+        ]
+        self.defaults = {p.name: p.default for p in params if p.default is not p.empty}
+        # 含 *args / **kwargs 的函数仍走 sig.bind，保证多余参数也参与键
+        self.signature = signature if any(
+            p.kind in (p.VAR_POSITIONAL, p.VAR_KEYWORD) for p in params
+        ) else None
+
+    def arguments(self, args, kwargs) -> Dict[str, Any]:
+        if self.signature is not None:
+            bound = self.signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments
+        values = dict(self.defaults)
+        values.update(zip(self.positional, args))
+        values.update(kwargs)
+        return values
+
+    def build(self, args, kwargs) -> Tuple[str, Tuple[str, ...]]:
+        """返回 (基础键, 命名空间)"""
+        arguments = self.arguments(args, kwargs)
+        try:
+            base = self.template.format(**arguments)
+            namespaces = tuple(ns.format(**arguments) for ns in self.namespaces)
+        except (KeyError, IndexError):
+            # 模板参数不匹配时使用哈希
+            digest = hashlib.md5(repr(sorted(arguments.items())).encode()).hexdigest()[:8]
+            base, namespaces = f'{self.func_name}_{digest}', tuple(ns for ns in self.namespaces if '{' not in ns)
+        return base, namespaces
+
+
+_local_caches = []
+
+
+def _forget_local(namespaces) -> None:
+    for local in _local_caches:
+        local.forget_namespaces(namespaces)
+
+
+cache_namespace.on_bump(_forget_local)
+
+
+def memoize(key_template: str, timeout: int, namespaces: Iterable[str] = (),
+            l1_ttl: float = 0, l1_size: int = 256):
+    """
+    缓存装饰器
+
+    Args:
+        key_template: 缓存键模板，支持 {arg_name} 格式
+        timeout: L2 缓存超时时间（秒）
+        namespaces: 键所属的命名空间模板（见 cache_namespace），同样支持 {arg_name}
+        l1_ttl: 进程内缓存的 TTL（秒），0 表示不启用
+        l1_size: 进程内缓存的最大条目数
+    """
+    def decorator(func: Callable) -> Callable:
+        builder = _KeyBuilder(func, key_template, namespaces)
+        local: Optional[_LocalTTLCache] = None
+        if l1_ttl > 0:
+            local = _LocalTTLCache(l1_size, l1_ttl)
+            _local_caches.append(local)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            base, owned = builder.build(args, kwargs)
+            if local is not None:
+                value = local.get(base)
+                if value is not _MISSING:
+                    _record('record_cache_hit', True)
+                    return value
+            key = cache_namespace.versioned_key(base, owned)
+            value = get_or_compute(key, lambda: func(*args, **kwargs), timeout)
+            if local is not None:
+                local.set(base, value, owned)
+            return value
+
+        def invalidate(*args, **kwargs):
+            """清除指定参数对应的缓存（L1 与 L2）"""
+            base, owned = builder.build(args, kwargs)
+            if local is not None:
+                local.pop(base)
+            cache.delete(cache_namespace.versioned_key(base, owned))
+
+        wrapper.invalidate = invalidate
+        wrapper.cache_key_template = key_template
+        return wrapper
+
+    return decorator
@@ -3,6 +3,8 @@ API 响应中间件 - 统一处理响应格式、异常和性能监控
 """
 import time
 import logging
+from contextlib import nullcontext
+from django.db import connection
 from django.http import JsonResponse
 from django.conf import settings
 from rest_framework.views import exception_handler
@@ -76,6 +78,7 @@ class APIPerformanceMiddleware:
     1. 记录 API 请求耗时
     2. 慢请求告警
     3. 请求统计
+    4. SQL 统计：查询数、数据库耗时（X-DB-Queries / X-DB-Time 响应头）与 N+1 检测
     """
 
     # 慢请求阈值（毫秒）
@@ -89,15 +92,31 @@ class APIPerformanceMiddleware:
         if not request.path.startswith('/api/'):
             return self.get_response(request)
 
+        from .query_monitor import QueryRecorder
+        recorder = QueryRecorder() if getattr(settings, 'DB_INSTRUMENTATION', True) else None
+
         start_time = time.time()
 
-        response = self.get_response(request)
+        with connection.execute_wrapper(recorder) if recorder else nullcontext():
+            response = self.get_response(request)
 
         # 计算耗时
         duration_ms = (time.time() - start_time) * 1000
 
         # 添加响应头
         response['X-Request-Duration'] = f'{duration_ms:.2f}ms'
+        n_plus_one = []
+        if recorder:
+            response['X-DB-Queries'] = str(recorder.count)
+            response['X-DB-Time'] = f'{recorder.total_ms:.2f}ms'
+            n_plus_one = recorder.n_plus_one()
+            if n_plus_one:
+                top = n_plus_one[0]
+                logger.warning(
+                    f'可能的 N+1 问题: {request.method} {request.path} 共 {recorder.count} 次查询，'
+                    f'{len(n_plus_one)} 个语句重复执行，最多 {top["count"]} 次: {top["pattern"]}',
+                    extra={'path': request.path, 'method': request.method, 'n_plus_one': n_plus_one}
+                )
 
         # 写入 APM 指标（失败不影响业务流程）
         try:
@@ -108,7 +127,11 @@ class APIPerformanceMiddleware:
                 path=request.path,
                 method=request.method,
                 status_code=response.status_code,
-                user=request.user.username if request.user.is_authenticated else 'anonymous'
+                user=request.user.username if request.user.is_authenticated else 'anonymous',
+                db_queries=recorder.count if recorder else None,
+                db_time_ms=recorder.total_ms if recorder else None,
+                n_plus_one=n_plus_one,
+                route=request.resolver_match.route if request.resolver_match else None,
             )
         except Exception:
             pass
@@ -132,6 +155,23 @@ class APIPerformanceMiddleware:
         return response
 
 
+class CacheInvalidationMiddleware:
+    """
+    缓存失效合并中间件
+
+    请求处理期间（信号、批量写入）登记的缓存失效去重后，在响应返回前一次性下发；
+    事务内的失效仍以事务提交为准，回滚的不会下发（见 invalidation.py）
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .invalidation import invalidation_bus
+        with invalidation_bus.batch():
+            return self.get_response(request)
+
+
 class CORSDebugMiddleware:
     """
     CORS 调试中间件 - 开发环境用于排查跨域问题
@@ -206,6 +246,24 @@ class GZipAPIMiddleware:
         return response
 
 
+class RBACMiddleware:
+    """
+    RBAC 权限上下文中间件
+
+    为每个请求挂载 request.rbac（RBACContext），权限集合在首次检查时
+    编译一次，供 HasRBACPermission / require_permission / 视图代码共用。
+    需放在 AuthenticationMiddleware 之后。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .rbac import RBACContext
+        request.rbac = RBACContext(request)
+        return self.get_response(request)
+
+
 class SecurityHeadersMiddleware:
     """
     安全响应头中间件
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_closure(apps, schema_editor):
+    """根据现有 parent 关系填充闭包表"""
+    Department = apps.get_model('hr_management', 'Department')
+    DepartmentClosure = apps.get_model('hr_management', 'DepartmentClosure')
+    parents = dict(Department.objects.values_list('id', 'parent_id'))
+    rows = []
+    for dept_id in parents:
+        depth, current, seen = 0, dept_id, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            rows.append(DepartmentClosure(ancestor_id=current, descendant_id=dept_id, depth=depth))
+            current = parents.get(current)
+            depth += 1
+    DepartmentClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0025_remove_employee_passport_no'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(default=0, verbose_name='层级距离')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='hr_management.department', verbose_name='祖先部门')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='hr_management.department', verbose_name='后代部门')),
+            ],
+            options={
+                'verbose_name': '部门层级关系',
+                'verbose_name_plural': '部门层级关系',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='hr_manageme_descend_57d4db_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+def import_bundled_holidays(apps, schema_editor):
+    """导入内置的年度节假日数据"""
+    from hr_management.holidays import BUNDLED_DIR, load_bundled_year
+    HolidayCalendar = apps.get_model('hr_management', 'HolidayCalendar')
+    rows = []
+    for path in sorted(BUNDLED_DIR.glob('*.json')):
+        for day, day_type, name in load_bundled_year(int(path.stem)) or ():
+            rows.append(HolidayCalendar(date=day, day_type=day_type, name=name, source='bundled'))
+    HolidayCalendar.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0026_department_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HolidayCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('day_type', models.PositiveSmallIntegerField(choices=[(0, '工作日'), (1, '周末'), (2, '节假日'), (3, '调休补班')], verbose_name='日期类型')),
+                ('name', models.CharField(blank=True, max_length=50, verbose_name='节假日名称')),
+                ('source', models.CharField(default='bundled', max_length=20, verbose_name='数据来源')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '节假日日历',
+                'verbose_name_plural': '节假日日历',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(import_bundled_holidays, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0027_holiday_calendar'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='systemlog',
+            name='hr_manageme_timesta_6c38f4_idx',
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['-date', '-id'], name='hr_manageme_date_43bb89_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['-created_at', '-id'], name='hr_manageme_created_38dc07_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryrecord',
+            index=models.Index(fields=['-year', '-month', '-id'], name='hr_manageme_year_270bfd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='hr_manageme_timesta_087932_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hr_management', '0028_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('export', '数据导出'), ('report', '统计报表')], default='export', max_length=10, verbose_name='任务类型')),
+                ('dataset', models.CharField(max_length=30, verbose_name='数据集/报表')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='参数')),
+                ('export_format', models.CharField(default='xlsx', max_length=10, verbose_name='文件格式')),
+                ('spec_hash', models.CharField(db_index=True, max_length=64, verbose_name='规格摘要')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '生成中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='已处理行数')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='总行数')),
+                ('file_path', models.CharField(blank=True, max_length=255, verbose_name='文件路径')),
+                ('file_size', models.PositiveBigIntegerField(default=0, verbose_name='文件大小')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='过期时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='提交人')),
+            ],
+            options={
+                'verbose_name': '导出任务',
+                'verbose_name_plural': '导出任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'status'], name='hr_manageme_user_id_6f9208_idx'), models.Index(fields=['status', 'expires_at'], name='hr_manageme_status_ccc8ba_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:44
+
+from django.db import migrations, models
+
+
+def build_stats(apps, schema_editor):
+    """根据现有考勤记录填充考勤日汇总"""
+    Attendance = apps.get_model('hr_management', 'Attendance')
+    AttendanceDailyStat = apps.get_model('hr_management', 'AttendanceDailyStat')
+    rows = [
+        AttendanceDailyStat(date=row['date'], department_id=row['employee__department_id'] or 0,
+                            attendance_type=row['attendance_type'], count=row['cnt'])
+        for row in Attendance.objects.order_by().values('date', 'employee__department_id', 'attendance_type')
+        .annotate(cnt=models.Count('id'))
+    ]
+    AttendanceDailyStat.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0029_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('department_id', models.PositiveIntegerField(default=0, verbose_name='部门ID')),
+                ('attendance_type', models.CharField(max_length=20, verbose_name='考勤类型')),
+                ('count', models.IntegerField(default=0, verbose_name='记录数')),
+            ],
+            options={
+                'verbose_name': '考勤日汇总',
+                'verbose_name_plural': '考勤日汇总',
+                'unique_together': {('date', 'department_id', 'attendance_type')},
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+def build_stats(apps, schema_editor):
+    """根据现有薪资记录填充薪资月度汇总"""
+    SalaryRecord = apps.get_model('hr_management', 'SalaryRecord')
+    PayrollMonthlyStat = apps.get_model('hr_management', 'PayrollMonthlyStat')
+    paid = models.Q(paid=True)
+    rows = [
+        PayrollMonthlyStat(year=row['year'], month=row['month'], department_id=row['employee__department_id'] or 0,
+                           record_count=row['cnt'], total_net=row['net'] or 0,
+                           paid_count=row['paid_cnt'], paid_net=row['paid_net'] or 0)
+        for row in SalaryRecord.objects.order_by().values('year', 'month', 'employee__department_id').annotate(
+            cnt=models.Count('id'), net=models.Sum('net_salary'),
+            paid_cnt=models.Count('id', filter=paid), paid_net=models.Sum('net_salary', filter=paid),
+        )
+    ]
+    PayrollMonthlyStat.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0030_attendance_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollMonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='年份')),
+                ('month', models.IntegerField(verbose_name='月份')),
+                ('department_id', models.PositiveIntegerField(default=0, verbose_name='部门ID')),
+                ('record_count', models.IntegerField(default=0, verbose_name='记录数')),
+                ('total_net', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='实发合计')),
+                ('paid_count', models.IntegerField(default=0, verbose_name='已发放记录数')),
+                ('paid_net', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='已发放实发合计')),
+            ],
+            options={
+                'verbose_name': '薪资月度汇总',
+                'verbose_name_plural': '薪资月度汇总',
+                'unique_together': {('year', 'month', 'department_id')},
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
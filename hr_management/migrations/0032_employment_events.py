@@ -0,0 +1,96 @@
+# Generated by Django 4.2.27 on 2026-10-18 05:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+from hr_management.headcount import EVENT_FIELDS, month_index, replay_headcount
+
+
+def backfill(apps, schema_editor):
+    """按现有员工数据补写任职事件（入职；已批准离职申请或已停用的记离职），再回放生成人数快照"""
+    Employee = apps.get_model('hr_management', 'Employee')
+    LeaveRequest = apps.get_model('hr_management', 'LeaveRequest')
+    EmploymentEvent = apps.get_model('hr_management', 'EmploymentEvent')
+    HeadcountSnapshot = apps.get_model('hr_management', 'HeadcountSnapshot')
+
+    resigned_on = dict(
+        LeaveRequest.objects.filter(leave_type='resignation', status='approved')
+        .order_by('employee_id', 'end_date').values_list('employee_id', 'end_date')
+    )
+    events = []
+    for emp in Employee.objects.filter(onboard_status='onboarded').only(
+            'id', 'department_id', 'hire_date', 'is_active', 'created_at', 'updated_at'):
+        dept_id = emp.department_id or 0
+        hired = emp.hire_date or timezone.localdate(emp.created_at)
+        events.append(EmploymentEvent(employee_id=emp.id, event_type='hire', event_date=hired,
+                                      department_id=dept_id, note='历史数据'))
+        left = resigned_on.get(emp.id) or (None if emp.is_active else timezone.localdate(emp.updated_at))
+        if left:
+            events.append(EmploymentEvent(employee_id=emp.id, event_type='resign', event_date=max(left, hired),
+                                          department_id=dept_id, note='历史数据'))
+    EmploymentEvent.objects.bulk_create(events, batch_size=1000)
+
+    today = timezone.localdate()
+    rows = replay_headcount(
+        EmploymentEvent.objects.order_by('event_date', 'id').values_list(*EVENT_FIELDS),
+        0, month_index(today.year, today.month),
+    )
+    HeadcountSnapshot.objects.bulk_create(
+        [HeadcountSnapshot(year=year, month=month, department_id=dept_id, **values)
+         for year, month, dept_id, values in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hr_management', '0031_payroll_monthly_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeadcountSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='年份')),
+                ('month', models.IntegerField(verbose_name='月份')),
+                ('department_id', models.PositiveIntegerField(default=0, verbose_name='部门ID')),
+                ('headcount', models.IntegerField(default=0, verbose_name='月末在职人数')),
+                ('hires', models.IntegerField(default=0, verbose_name='入职')),
+                ('reactivations', models.IntegerField(default=0, verbose_name='复职')),
+                ('resignations', models.IntegerField(default=0, verbose_name='离职')),
+                ('transfers_in', models.IntegerField(default=0, verbose_name='调入')),
+                ('transfers_out', models.IntegerField(default=0, verbose_name='调出')),
+            ],
+            options={
+                'verbose_name': '月度人数快照',
+                'verbose_name_plural': '月度人数快照',
+                'unique_together': {('year', 'month', 'department_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EmploymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('hire', '入职'), ('transfer', '调岗'), ('resign', '离职'), ('reactivate', '复职')], max_length=20, verbose_name='事件类型')),
+                ('event_date', models.DateField(db_index=True, verbose_name='生效日期')),
+                ('department_id', models.PositiveIntegerField(default=0, verbose_name='部门ID')),
+                ('from_department_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='原部门ID')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='备注')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='记录时间')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='操作人')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='employment_events', to='hr_management.employee', verbose_name='员工')),
+            ],
+            options={
+                'verbose_name': '任职事件',
+                'verbose_name_plural': '任职事件',
+                'ordering': ['event_date', 'id'],
+                'indexes': [models.Index(fields=['employee', '-id'], name='hr_manageme_employe_ffa8fe_idx')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
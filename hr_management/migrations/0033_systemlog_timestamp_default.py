@@ -0,0 +1,19 @@
+# Generated by Django 4.2.27 on 2026-10-18 06:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr_management', '0032_employment_events'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='systemlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='时间'),
+        ),
+    ]
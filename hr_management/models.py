@@ -1,8 +1,13 @@
-from django.db import models
+import logging
+import uuid
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 
 class Department(models.Model):
     """部门模型"""
@@ -27,21 +32,104 @@ class Department(models.Model):
         return self.name
 
     def get_full_path(self):
-        """获取部门完整路径，如：总公司 > 技术部 > 前端组"""
-        path = [self.name]
-        parent = self.parent
-        while parent:
-            path.insert(0, parent.name)
-            parent = parent.parent
-        return ' > '.join(path)
+        """获取部门完整路径，如：总公司 > 技术部 > 前端组（基于闭包表单次查询）"""
+        names = list(
+            DepartmentClosure.objects.filter(descendant_id=self.pk)
+            .order_by('-depth')
+            .values_list('ancestor__name', flat=True)
+        )
+        return ' > '.join(names) if names else self.name
+
+    def get_descendant_ids(self, include_self=True):
+        """获取所有下级部门ID（基于闭包表单次查询）"""
+        qs = DepartmentClosure.objects.filter(ancestor_id=self.pk)
+        if not include_self:
+            qs = qs.filter(depth__gt=0)
+        return list(qs.values_list('descendant_id', flat=True))
 
     def get_all_children(self):
-        """获取所有子部门（递归）"""
-        children = list(self.children.all())
-        result = list(children)  # 复用已加载的列表，避免重复查询
-        for child in children:
-            result.extend(child.get_all_children())
-        return result
+        """获取所有子部门（基于闭包表单次查询，不含自身）"""
+        return list(Department.objects.filter(
+            closure_ancestors__ancestor_id=self.pk,
+            closure_ancestors__depth__gt=0,
+        ))
+
+
+class DepartmentClosure(models.Model):
+    """部门闭包表：保存所有 (祖先, 后代, 层级距离) 关系，由信号维护
+
+    每个部门都有一条 depth=0 的自身记录，子树查询和完整路径查询均为单次索引查询。
+    """
+    ancestor = models.ForeignKey(Department, on_delete=models.CASCADE,
+                                 related_name='closure_descendants', verbose_name='祖先部门')
+    descendant = models.ForeignKey(Department, on_delete=models.CASCADE,
+                                   related_name='closure_ancestors', verbose_name='后代部门')
+    depth = models.PositiveIntegerField(default=0, verbose_name='层级距离')
+
+    class Meta:
+        verbose_name = '部门层级关系'
+        verbose_name_plural = '部门层级关系'
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    @classmethod
+    def subtree_ids(cls, department_id):
+        """返回以 department_id 为根的子树ID子查询（含自身），可直接用于 __in 过滤"""
+        return cls.objects.filter(ancestor_id=department_id).values('descendant_id')
+
+    @classmethod
+    def attach(cls, department):
+        """将部门（及其整棵子树）挂到当前 parent 下：先断开旧祖先，再批量插入新路径"""
+        subtree = list(cls.objects.filter(ancestor_id=department.pk).values_list('descendant_id', 'depth'))
+        if not subtree:
+            # 新建部门：仅有自身
+            cls.objects.create(ancestor_id=department.pk, descendant_id=department.pk, depth=0)
+            subtree = [(department.pk, 0)]
+        else:
+            cls.detach(department.pk)
+
+        if not department.parent_id:
+            return
+        ancestors = list(cls.objects.filter(descendant_id=department.parent_id).values_list('ancestor_id', 'depth'))
+        cls.objects.bulk_create([
+            cls(ancestor_id=anc_id, descendant_id=desc_id, depth=anc_depth + desc_depth + 1)
+            for anc_id, anc_depth in ancestors
+            for desc_id, desc_depth in subtree
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def detach(cls, department_id):
+        """删除子树与其外部祖先之间的所有关系（子树内部关系保留）"""
+        subtree = cls.subtree_ids(department_id)
+        cls.objects.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+
+    @classmethod
+    def parent_id_of(cls, department_id):
+        """闭包表中记录的直接上级ID（用于判断 parent 是否变更）"""
+        return cls.objects.filter(descendant_id=department_id, depth=1).values_list(
+            'ancestor_id', flat=True
+        ).first()
+
+    @classmethod
+    def rebuild(cls):
+        """根据 Department.parent 全量重建闭包表（数据修复/迁移使用）"""
+        parents = dict(Department.objects.values_list('id', 'parent_id'))
+        rows = []
+        for dept_id in parents:
+            depth, current, seen = 0, dept_id, set()
+            while current is not None and current not in seen:
+                seen.add(current)
+                rows.append(cls(ancestor_id=current, descendant_id=dept_id, depth=depth))
+                current = parents.get(current)
+                depth += 1
+        cls.objects.all().delete()
+        cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
 
 
 class Position(models.Model):
@@ -228,6 +316,205 @@ class Employee(models.Model):
             (today.month, today.day) < (self.hire_date.month, self.hire_date.day)
         )
 
+    @property
+    def is_employed(self):
+        """已入职且在职"""
+        return self.is_active and self.onboard_status == 'onboarded'
+
+    EMPLOYMENT_FIELDS = ('is_active', 'onboard_status', 'department_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录读出时的在职状态与部门，保存时据此写入任职事件（延迟加载了其中字段时不记录）
+        if all(field in instance.__dict__ for field in cls.EMPLOYMENT_FIELDS):
+            instance._employment_key = tuple(instance.__dict__[field] for field in cls.EMPLOYMENT_FIELDS)
+        return instance
+
+
+class EmploymentEvent(models.Model):
+    """任职事件日志（只追加）：入职、调岗、离职、复职
+
+    由 Employee 的信号（在职状态、部门变化）与离职审批写入，HeadcountSnapshot 按时间顺序回放得到月度人数。
+    department_id 为事件后所在部门（离职为离职时所在部门），0 表示未分配部门。
+    """
+    TYPE_HIRE = 'hire'
+    TYPE_TRANSFER = 'transfer'
+    TYPE_RESIGN = 'resign'
+    TYPE_REACTIVATE = 'reactivate'
+    EVENT_TYPE_CHOICES = [
+        (TYPE_HIRE, '入职'),
+        (TYPE_TRANSFER, '调岗'),
+        (TYPE_RESIGN, '离职'),
+        (TYPE_REACTIVATE, '复职'),
+    ]
+    # 各类事件要求的上一条在职状态事件（入职/复职/离职，不含调岗）类型，None 表示没有事件
+    ALLOWED_AFTER = {
+        TYPE_HIRE: {None},
+        TYPE_TRANSFER: {TYPE_HIRE, TYPE_REACTIVATE},
+        TYPE_RESIGN: {TYPE_HIRE, TYPE_REACTIVATE},
+        TYPE_REACTIVATE: {TYPE_RESIGN},
+    }
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='employment_events', verbose_name='员工')
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES, verbose_name='事件类型')
+    event_date = models.DateField(db_index=True, verbose_name='生效日期')
+    department_id = models.PositiveIntegerField(default=0, verbose_name='部门ID')
+    from_department_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='原部门ID')
+    note = models.CharField(max_length=200, blank=True, verbose_name='备注')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+', verbose_name='操作人')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='记录时间')
+
+    class Meta:
+        verbose_name = '任职事件'
+        verbose_name_plural = '任职事件'
+        ordering = ['event_date', 'id']
+        indexes = [
+            models.Index(fields=['employee', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} {self.get_event_type_display()} {self.event_date}"
+
+    @classmethod
+    def record(cls, employee, event_type, event_date=None, from_department_id=None, note='', user=None):
+        """按任职状态写入一条事件并计入人数快照；与当前状态不符（如重复离职）时返回 None"""
+        event_date = event_date or timezone.localdate()
+        status_events = cls.objects.filter(employee_id=employee.pk).exclude(event_type=cls.TYPE_TRANSFER)
+        if event_type == cls.TYPE_TRANSFER:
+            # 调岗看生效日的在职状态：已审批、尚未生效的离职不影响离职前的调岗
+            status_events = status_events.filter(event_date__lte=event_date).order_by('-event_date', '-id')
+        else:
+            status_events = status_events.order_by('-id')
+        last = status_events.values_list('event_type', flat=True).first()
+        if last not in cls.ALLOWED_AFTER[event_type]:
+            if event_type == cls.TYPE_TRANSFER:
+                logger.info("Skip transfer of employee %s on %s: not employed (last status event: %s)",
+                            employee.pk, event_date, last)
+            return None
+        event = cls.objects.create(
+            employee_id=employee.pk, event_type=event_type, event_date=event_date,
+            department_id=employee.department_id or 0, from_department_id=from_department_id,
+            note=note, created_by=user,
+        )
+        if event_type == cls.TYPE_TRANSFER:
+            # 尚未生效的离职改为从新部门离职
+            cls.objects.filter(
+                employee_id=employee.pk, event_type=cls.TYPE_RESIGN, event_date__gt=event_date,
+            ).update(department_id=event.department_id)
+        transaction.on_commit(lambda: HeadcountSnapshot.apply_event(event))
+        return event
+
+
+class HeadcountSnapshot(models.Model):
+    """月度人数快照：(年, 月, 部门) → 月末在职人数与当月入职/复职/离职/调入/调出人数
+
+    按时间顺序回放 EmploymentEvent 得到（见 headcount.py）。新事件由 apply_event() 增量计入，
+    删除事件、批量导入后重算受影响的月份，定时任务每天重算上月与本月
+    （python manage.py rebuild_headcount_snapshots 可手动全量重算）。
+    """
+    year = models.IntegerField(verbose_name='年份')
+    month = models.IntegerField(verbose_name='月份')
+    department_id = models.PositiveIntegerField(default=0, verbose_name='部门ID')
+    headcount = models.IntegerField(default=0, verbose_name='月末在职人数')
+    hires = models.IntegerField(default=0, verbose_name='入职')
+    reactivations = models.IntegerField(default=0, verbose_name='复职')
+    resignations = models.IntegerField(default=0, verbose_name='离职')
+    transfers_in = models.IntegerField(default=0, verbose_name='调入')
+    transfers_out = models.IntegerField(default=0, verbose_name='调出')
+
+    class Meta:
+        verbose_name = '月度人数快照'
+        verbose_name_plural = '月度人数快照'
+        unique_together = ['year', 'month', 'department_id']
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d} 部门{self.department_id}: {self.headcount}人"
+
+    @classmethod
+    def rebuild(cls, since=None):
+        """重算 since（(年, 月)，默认全部）到本月的快照，返回写入的行数"""
+        from .headcount import EVENT_FIELDS, month_index, replay_headcount
+
+        today = timezone.localdate()
+        since_index = month_index(*since) if since else 0
+        events = EmploymentEvent.objects.order_by('event_date', 'id').values_list(*EVENT_FIELDS)
+        rows = [
+            cls(year=year, month=month, department_id=dept_id, **values)
+            for year, month, dept_id, values in replay_headcount(
+                events.iterator(chunk_size=2000), since_index, month_index(today.year, today.month))
+        ]
+        stale = cls.objects.all()
+        if since:
+            stale = stale.filter(models.Q(year__gt=since[0]) | models.Q(year=since[0], month__gte=since[1]))
+        with transaction.atomic():
+            stale.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    @classmethod
+    def apply_event(cls, event):
+        """把一条新写入的事件叠加到已有快照上（该员工已有更晚生效的事件时退回 rebuild），返回改动的部门数"""
+        from .headcount import event_effects, month_index
+
+        today = timezone.localdate()
+        start = month_index(event.event_date.year, event.event_date.month)
+        end = month_index(today.year, today.month)
+        if start > end:
+            return 0  # 未来生效：跨月后由定时任务的 rebuild 计入
+        since = (event.event_date.year, event.event_date.month)
+        earlier = (EmploymentEvent.objects.filter(employee_id=event.employee_id).exclude(pk=event.pk)
+                   .order_by('-event_date', '-id'))
+        previous = earlier.values_list('event_date', 'department_id').first()
+        if previous is not None and previous[0] > event.event_date:
+            return cls.rebuild(since)
+        # 事件前的状态：最近一条在职状态事件决定是否在职，最近一条事件决定所在部门
+        status = earlier.exclude(event_type=EmploymentEvent.TYPE_TRANSFER).values_list('event_type', flat=True).first()
+        employed_in = None
+        if status in (EmploymentEvent.TYPE_HIRE, EmploymentEvent.TYPE_REACTIVATE):
+            employed_in = previous[1] or 0
+
+        _, moves, flow_fields = event_effects(
+            event.event_type, event.department_id, event.from_department_id, employed_in)
+        flows = {}
+        for dept_id, field in flow_fields:
+            flows.setdefault(dept_id, {})
+            flows[dept_id][field] = flows[dept_id].get(field, 0) + 1
+        months = [(index // 12, index % 12 + 1) for index in range(start, end + 1)]
+        in_range = models.Q(year__gt=since[0]) | models.Q(year=since[0], month__gte=since[1])
+        try:
+            with transaction.atomic():
+                for dept_id, delta in moves.items():
+                    if not delta:
+                        continue
+                    rows = cls.objects.filter(in_range, department_id=dept_id)
+                    rows.update(headcount=models.F('headcount') + delta)
+                    present = set(rows.values_list('year', 'month'))
+                    cls.objects.bulk_create([
+                        cls(year=year, month=month, department_id=dept_id, headcount=delta)
+                        for year, month in months if (year, month) not in present
+                    ])
+                for dept_id, values in flows.items():
+                    key = {'year': since[0], 'month': since[1], 'department_id': dept_id}
+                    if not cls.objects.filter(**key).update(
+                            **{field: models.F(field) + count for field, count in values.items()}):
+                        cls.objects.create(**key, **values)
+                # 与 rebuild 一致：不保留全为 0 的格子
+                cls.objects.filter(in_range, headcount=0, hires=0, reactivations=0, resignations=0,
+                                   transfers_in=0, transfers_out=0).delete()
+        except IntegrityError:
+            # 并发写入同一格子：以回放结果为准
+            return cls.rebuild(since)
+        return len(set(moves) | set(flows))
+
+    @classmethod
+    def ensure_current(cls):
+        """跨月后定时任务尚未运行时补算本月"""
+        today = timezone.localdate()
+        if not cls.objects.filter(year=today.year, month=today.month).exists():
+            cls.rebuild((today.year, today.month))
+
 
 class Attendance(models.Model):
     """考勤记录模型"""
@@ -257,11 +544,80 @@ class Attendance(models.Model):
         indexes = [
             models.Index(fields=['date', 'attendance_type']),
             models.Index(fields=['employee', '-date']),
+            models.Index(fields=['-date', '-id']),  # 游标分页
         ]
 
     def __str__(self):
         return f"{self.employee.name} - {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录读出时的 (日期, 员工, 类型)，保存/删除时据此修正考勤日汇总
+        instance._stat_key = (
+            instance.__dict__.get('date'),
+            instance.__dict__.get('employee_id'),
+            instance.__dict__.get('attendance_type'),
+        )
+        return instance
+
+
+class AttendanceDailyStat(models.Model):
+    """考勤日汇总：(日期, 部门, 考勤类型) → 记录数，由 Attendance 的信号维护
+
+    部门取员工所在部门（新增记录按写入时 +1；编辑、删除记录及 rebuild() 按当前部门重算整天），0 表示未分配部门。
+    考勤图表只读本表的日期区间，与员工人数无关。
+    queryset.update()、bulk_create 等绕过信号的批量写入之后调用 rebuild()
+    （或 python manage.py rebuild_attendance_stats）重算受影响的日期。
+    """
+    date = models.DateField(verbose_name='日期')
+    department_id = models.PositiveIntegerField(default=0, verbose_name='部门ID')
+    attendance_type = models.CharField(max_length=20, verbose_name='考勤类型')
+    count = models.IntegerField(default=0, verbose_name='记录数')
+
+    class Meta:
+        verbose_name = '考勤日汇总'
+        verbose_name_plural = '考勤日汇总'
+        unique_together = ['date', 'department_id', 'attendance_type']
+
+    def __str__(self):
+        return f"{self.date} 部门{self.department_id} {self.attendance_type}: {self.count}"
+
+    @classmethod
+    def bump(cls, day, department_id, attendance_type, delta):
+        """增减一个格子的计数"""
+        key = {'date': day, 'department_id': department_id or 0, 'attendance_type': attendance_type}
+        if cls.objects.filter(**key).update(count=models.F('count') + delta) or delta <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(count=delta, **key)
+        except IntegrityError:
+            # 并发写入同一格子：对方已建好，改为累加
+            cls.objects.filter(**key).update(count=models.F('count') + delta)
+
+    @classmethod
+    def rebuild(cls, start=None, end=None, dates=None):
+        """按 Attendance 重算 [start, end] 日期区间（默认全部）或 dates 中的各个日期，返回写入的格子数"""
+        source = Attendance.objects.all()
+        stale = cls.objects.all()
+        if dates is not None:
+            source, stale = source.filter(date__in=dates), stale.filter(date__in=dates)
+        if start is not None:
+            source, stale = source.filter(date__gte=start), stale.filter(date__gte=start)
+        if end is not None:
+            source, stale = source.filter(date__lte=end), stale.filter(date__lte=end)
+        rows = [
+            cls(date=row['date'], department_id=row['employee__department_id'] or 0,
+                attendance_type=row['attendance_type'], count=row['cnt'])
+            for row in source.order_by().values('date', 'employee__department_id', 'attendance_type')
+            .annotate(cnt=models.Count('id'))
+        ]
+        with transaction.atomic():
+            stale.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
 
 class AttendanceSupplement(models.Model):
     """考勤补签申请模型"""
@@ -354,11 +710,25 @@ class LeaveRequest(models.Model):
         indexes = [
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['employee', 'leave_type', 'status']),
+            models.Index(fields=['-created_at', '-id']),  # 游标分页
         ]
 
     def __str__(self):
         return f"{self.employee.name} - {self.leave_type} - {self.start_date}"
 
+    # 按自然日计算天数的假期类型（产假、陪产假按日历天数），其余按工作日计算
+    CALENDAR_DAY_TYPES = ('maternity', 'paternity', 'resignation')
+
+    @classmethod
+    def compute_days(cls, leave_type, start_date, end_date) -> int:
+        """请假天数：产假/陪产假为自然日，其余为区间内工作日（剔除周末、法定节假日，计入调休补班）"""
+        if end_date < start_date:
+            return 0
+        if leave_type in cls.CALENDAR_DAY_TYPES:
+            return (end_date - start_date).days + 1
+        from .holidays import workdays_between
+        return workdays_between(start_date, end_date)
+
 
 class SalaryRecord(models.Model):
     """薪资记录模型"""
@@ -379,6 +749,9 @@ class SalaryRecord(models.Model):
         verbose_name_plural = '薪资记录'
         ordering = ['-year', '-month', 'employee']
         unique_together = ['employee', 'year', 'month']
+        indexes = [
+            models.Index(fields=['-year', '-month', '-id']),  # 游标分页
+        ]
 
     def __str__(self):
         return f"{self.employee.name} - {self.year}年{self.month}月"
@@ -388,6 +761,83 @@ class SalaryRecord(models.Model):
         self.net_salary = self.basic_salary + self.bonus + self.overtime_pay + self.allowance
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录读出时的 (年, 月, 员工, 实发, 是否发放)，保存/删除时据此修正薪资月度汇总
+        instance._stat_key = tuple(
+            instance.__dict__.get(field) for field in ('year', 'month', 'employee_id', 'net_salary', 'paid')
+        )
+        return instance
+
+
+class PayrollMonthlyStat(models.Model):
+    """薪资月度汇总：(年, 月, 部门) → 记录数与实发合计，由 SalaryRecord 的信号维护
+
+    部门取员工所在部门（新增记录按写入时累加；编辑、删除记录及 rebuild() 按当前部门重算整月），0 表示未分配部门。
+    定时任务每天重算最近 3 个月。
+    薪资趋势与部门成本图表只读本表，查询量与记录数无关。
+    queryset.update()、bulk_create 等绕过信号的批量写入之后调用 rebuild()
+    （或 python manage.py rebuild_payroll_stats）重算受影响的月份。
+    """
+    year = models.IntegerField(verbose_name='年份')
+    month = models.IntegerField(verbose_name='月份')
+    department_id = models.PositiveIntegerField(default=0, verbose_name='部门ID')
+    record_count = models.IntegerField(default=0, verbose_name='记录数')
+    total_net = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name='实发合计')
+    paid_count = models.IntegerField(default=0, verbose_name='已发放记录数')
+    paid_net = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name='已发放实发合计')
+
+    class Meta:
+        verbose_name = '薪资月度汇总'
+        verbose_name_plural = '薪资月度汇总'
+        unique_together = ['year', 'month', 'department_id']
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d} 部门{self.department_id}: {self.record_count}人 {self.total_net}"
+
+    @classmethod
+    def bump(cls, year, month, department_id, **deltas):
+        """按 deltas（字段 → 增量）修正一个格子"""
+        key = {'year': year, 'month': month, 'department_id': department_id or 0}
+        updates = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if not updates or cls.objects.filter(**key).update(**updates) or deltas.get('record_count', 0) <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**deltas, **key)
+        except IntegrityError:
+            # 并发写入同一格子：对方已建好，改为累加
+            cls.objects.filter(**key).update(**updates)
+
+    @classmethod
+    def rebuild(cls, periods=None):
+        """按 SalaryRecord 重算 periods（[(年, 月), ...]，默认全部）的汇总，返回写入的格子数"""
+        source = SalaryRecord.objects.all()
+        stale = cls.objects.all()
+        if periods is not None:
+            periods = set(periods)
+            if not periods:
+                return 0
+            scope = models.Q()
+            for year, month in periods:
+                scope |= models.Q(year=year, month=month)
+            source, stale = source.filter(scope), stale.filter(scope)
+        paid = models.Q(paid=True)
+        rows = [
+            cls(year=row['year'], month=row['month'], department_id=row['employee__department_id'] or 0,
+                record_count=row['cnt'], total_net=row['net'] or 0,
+                paid_count=row['paid_cnt'], paid_net=row['paid_net'] or 0)
+            for row in source.order_by().values('year', 'month', 'employee__department_id').annotate(
+                cnt=models.Count('id'), net=models.Sum('net_salary'),
+                paid_cnt=models.Count('id', filter=paid), paid_net=models.Sum('net_salary', filter=paid),
+            )
+        ]
+        with transaction.atomic():
+            stale.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
 
 class CompanyDocument(models.Model):
     """公司文档模型"""
@@ -428,7 +878,7 @@ class SystemLog(models.Model):
         ('DEBUG', '调试'),
     ]
 
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='时间')
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, verbose_name='时间')
     level = models.CharField(max_length=10, choices=LEVEL_CHOICES, default='INFO', verbose_name='级别')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='system_logs', verbose_name='用户')
     action = models.CharField(max_length=100, verbose_name='操作')
@@ -441,7 +891,7 @@ class SystemLog(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['level', '-timestamp']),
-            models.Index(fields=['-timestamp']),
+            models.Index(fields=['-timestamp', '-id']),  # 时间倒序列表与游标分页
         ]
 
     def __str__(self):
@@ -515,10 +965,8 @@ def get_user_all_permissions(user: User):
     if user.is_superuser:
         return ['*']  # 表示全部权限
 
-    permission_keys = set()
-    for role in get_user_all_roles(user):
-        permission_keys.update(role.permissions.values_list('key', flat=True))
-    return list(permission_keys)
+    from .permission_cache import cached_user_permissions
+    return list(cached_user_permissions(user))
 
 
 class BusinessTrip(models.Model):
@@ -667,3 +1115,83 @@ class TravelExpense(models.Model):
 
     def __str__(self):
         return f"{self.employee.name} - {self.get_expense_type_display()} - ¥{self.amount}"
+
+
+class HolidayCalendar(models.Model):
+    """节假日日历：仅记录偏离"周一至周五上班"规则的日期（法定节假日、调休补班）"""
+    TYPE_WORKDAY = 0
+    TYPE_WEEKEND = 1
+    TYPE_HOLIDAY = 2
+    TYPE_MAKEUP_WORKDAY = 3
+    DAY_TYPE_CHOICES = [
+        (TYPE_WORKDAY, '工作日'),
+        (TYPE_WEEKEND, '周末'),
+        (TYPE_HOLIDAY, '节假日'),
+        (TYPE_MAKEUP_WORKDAY, '调休补班'),
+    ]
+
+    date = models.DateField(unique=True, verbose_name='日期')
+    day_type = models.PositiveSmallIntegerField(choices=DAY_TYPE_CHOICES, verbose_name='日期类型')
+    name = models.CharField(max_length=50, blank=True, verbose_name='节假日名称')
+    source = models.CharField(max_length=20, default='bundled', verbose_name='数据来源')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '节假日日历'
+        verbose_name_plural = '节假日日历'
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date} {self.get_day_type_display()} {self.name}".strip()
+
+
+class ExportJob(models.Model):
+    """后台导出/报表任务：产物保存在 EXPORT_ROOT（不对外提供静态访问），过期后由定时任务清理"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '排队中'),
+        (STATUS_RUNNING, '生成中'),
+        (STATUS_DONE, '已完成'),
+        (STATUS_FAILED, '失败'),
+    ]
+    KIND_CHOICES = [
+        ('export', '数据导出'),
+        ('report', '统计报表'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs', verbose_name='提交人')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='export', verbose_name='任务类型')
+    dataset = models.CharField(max_length=30, verbose_name='数据集/报表')
+    params = models.JSONField(default=dict, blank=True, verbose_name='参数')
+    export_format = models.CharField(max_length=10, default='xlsx', verbose_name='文件格式')
+    spec_hash = models.CharField(max_length=64, db_index=True, verbose_name='规格摘要')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='状态')
+    progress = models.PositiveIntegerField(default=0, verbose_name='已处理行数')
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name='总行数')
+    file_path = models.CharField(max_length=255, blank=True, verbose_name='文件路径')
+    file_size = models.PositiveBigIntegerField(default=0, verbose_name='文件大小')
+    error = models.TextField(blank=True, verbose_name='错误信息')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name='过期时间')
+
+    class Meta:
+        verbose_name = '导出任务'
+        verbose_name_plural = '导出任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.dataset} [{self.get_status_display()}]"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
@@ -7,11 +7,14 @@ import time
 import psutil
 import threading
 from datetime import datetime, timedelta
-from collections import deque, defaultdict
+from collections import deque
 from django.core.cache import cache
 from django.db import connection
 from django.conf import settings
 
+from .audit_log import audit_writer
+from .latency import RouteStats, latency_registry
+
 
 class SystemMetrics:
     """系统指标收集器"""
@@ -33,17 +36,16 @@ class SystemMetrics:
 
         # 请求统计（最近1小时）
         self.request_counts = deque(maxlen=60)  # 每分钟一个数据点
-        self.request_times = deque(maxlen=1000)  # 最近1000个请求的响应时间
         self.error_counts = deque(maxlen=60)
         self.slow_requests = deque(maxlen=300)
+        self.n_plus_one_samples = deque(maxlen=100)
 
-        # APM：接口维度聚合（每个接口保留最近200次）
-        self.endpoint_stats = defaultdict(lambda: {
-            'durations': deque(maxlen=200),
-            'total': 0,
-            'errors': 0,
-            'last_seen': None,
-        })
+        # 本进程全部 API 请求的延迟 / 数据库耗时 / 查询数直方图（自启动起累计）
+        self.overall = RouteStats()
+        self._overall_lock = threading.Lock()
+
+        # APM：接口维度聚合，按路由模板分桶的直方图（见 latency.py）
+        self.endpoint_stats = latency_registry
 
         # 数据库查询统计
         self.db_query_counts = deque(maxlen=60)
@@ -51,7 +53,9 @@ class SystemMetrics:
 
         # 缓存统计
         self.cache_hits = 0
+        self.cache_local_hits = 0
         self.cache_misses = 0
+        self.cache_compute_times = deque(maxlen=1000)
 
         # 启动时间
         self.start_time = datetime.now()
@@ -66,17 +70,28 @@ class SystemMetrics:
         idx = int((len(sorted_vals) - 1) * p)
         return sorted_vals[idx]
 
-    def record_request(self, duration_ms, is_error=False, path='/', method='GET', status_code=200, user='anonymous'):
-        """记录请求"""
-        self.request_times.append(duration_ms)
-        key = f'{method} {path}'
-        item = self.endpoint_stats[key]
-        item['durations'].append(duration_ms)
-        item['total'] += 1
-        item['last_seen'] = datetime.now().isoformat()
-
-        if is_error:
-            item['errors'] += 1
+    def record_request(self, duration_ms, is_error=False, path='/', method='GET', status_code=200, user='anonymous',
+                       db_queries=None, db_time_ms=None, n_plus_one=(), route=None):
+        """记录请求
+
+        route 为解析后的路由模板（如 'api/leaves/<int:pk>/approve/'），接口统计按它聚合，未解析时归入 'unmatched'；
+        db_queries / db_time_ms / n_plus_one 来自 QueryRecorder
+        """
+        key = f'{method} /{route}' if route is not None else f'{method} unmatched'
+        self.endpoint_stats.record(key, duration_ms, is_error, db_queries, db_time_ms, bool(n_plus_one))
+        with self._overall_lock:
+            self.overall.latency.record(duration_ms)
+            if db_queries is not None:
+                self.overall.db_queries.record(db_queries)
+                self.overall.db_time.record(db_time_ms or 0)
+
+        if n_plus_one:
+            self.n_plus_one_samples.appendleft({
+                'endpoint': key,
+                'path': path,
+                'patterns': list(n_plus_one)[:5],
+                'timestamp': datetime.now().isoformat(),
+            })
 
         # 记录慢请求样本，便于快速排查
         if duration_ms >= 800:
@@ -93,20 +108,27 @@ class SystemMetrics:
         """记录数据库查询"""
         self.db_query_times.append(duration_ms)
 
-    def record_cache_hit(self):
-        """记录缓存命中"""
+    def record_cache_hit(self, local=False):
+        """记录缓存命中（local: 命中进程内缓存）"""
         self.cache_hits += 1
+        if local:
+            self.cache_local_hits += 1
 
     def record_cache_miss(self):
         """记录缓存未命中"""
         self.cache_misses += 1
 
+    def record_cache_compute(self, duration_ms):
+        """记录缓存未命中时的回源耗时"""
+        self.cache_compute_times.append(duration_ms)
+
     def get_metrics(self):
         """获取当前指标"""
-        # 计算请求统计
-        request_times = list(self.request_times)
-        avg_response_time = sum(request_times) / len(request_times) if request_times else 0
-        max_response_time = max(request_times) if request_times else 0
+        # 计算请求统计（直方图按桶累加，无需排序；最大值、分位数为所在桶的上界）
+        with self._overall_lock:
+            overall = RouteStats()
+            overall.merge(self.overall)
+        latency = overall.latency
 
         # 计算数据库查询统计
         db_times = list(self.db_query_times)
@@ -115,6 +137,8 @@ class SystemMetrics:
         # 缓存命中率
         total_cache = self.cache_hits + self.cache_misses
         cache_hit_rate = (self.cache_hits / total_cache * 100) if total_cache > 0 else 0
+        compute_times = list(self.cache_compute_times)
+        avg_compute_time = sum(compute_times) / len(compute_times) if compute_times else 0
 
         # 系统资源
         try:
@@ -126,28 +150,34 @@ class SystemMetrics:
             memory = type('obj', (object,), {'percent': 0, 'used': 0, 'total': 0})()
             disk = type('obj', (object,), {'percent': 0, 'used': 0, 'total': 0})()
 
-        p95 = self._percentile(request_times, 0.95)
-        p99 = self._percentile(request_times, 0.99)
-
         return {
             'uptime_seconds': (datetime.now() - self.start_time).total_seconds(),
             'requests': {
-                'count': len(request_times),
-                'avg_response_ms': round(avg_response_time, 2),
-                'max_response_ms': round(max_response_time, 2),
-                'p95_response_ms': round(p95, 2),
-                'p99_response_ms': round(p99, 2),
+                'count': latency.count,
+                'avg_response_ms': round(latency.mean(), 2),
+                'max_response_ms': round(latency.max_bound(), 2),
+                'p95_response_ms': round(latency.percentile(0.95), 2),
+                'p99_response_ms': round(latency.percentile(0.99), 2),
                 'slow_sample_count': len(self.slow_requests),
             },
             'database': {
                 'query_count': len(db_times),
                 'avg_query_ms': round(avg_db_time, 2),
+                'requests': overall.db_queries.count,
+                'avg_queries_per_request': round(overall.db_queries.mean(), 2),
+                'p95_queries_per_request': round(overall.db_queries.percentile(0.95), 2),
+                'avg_db_ms_per_request': round(overall.db_time.mean(), 2),
+                'p95_db_ms_per_request': round(overall.db_time.percentile(0.95), 2),
             },
             'cache': {
                 'hits': self.cache_hits,
                 'misses': self.cache_misses,
                 'hit_rate': round(cache_hit_rate, 2),
+                'local_hits': self.cache_local_hits,
+                'avg_compute_ms': round(avg_compute_time, 2),
+                'p95_compute_ms': round(self._percentile(compute_times, 0.95), 2),
             },
+            'audit_log': audit_writer.stats(),
             'system': {
                 'cpu_percent': cpu_percent,
                 'memory_percent': memory.percent,
@@ -161,33 +191,40 @@ class SystemMetrics:
 
 
 def get_apm_snapshot(top_n=10):
-    """获取 APM 快照：慢接口排行 + 近期慢请求样本。"""
+    """获取 APM 快照：慢接口排行（按路由模板，配置 Redis 时为所有进程合计）+ 近期慢请求与 N+1 样本。"""
     ranking = []
-    for endpoint, stats in metrics.endpoint_stats.items():
-        durations = list(stats['durations'])
-        if not durations:
+    for endpoint, stats in metrics.endpoint_stats.snapshot().items():
+        latency = stats.latency
+        total = stats.total
+        if not total:
             continue
-        avg_ms = sum(durations) / len(durations)
-        p95_ms = metrics._percentile(durations, 0.95)
-        max_ms = max(durations)
-        total = stats['total']
-        errors = stats['errors']
+        has_db = stats.db_queries.count > 0
         ranking.append({
             'endpoint': endpoint,
             'count': total,
-            'error_rate': round((errors / total * 100) if total else 0, 2),
-            'avg_ms': round(avg_ms, 2),
-            'p95_ms': round(p95_ms, 2),
-            'max_ms': round(max_ms, 2),
-            'last_seen': stats['last_seen'],
+            'error_rate': round(stats.errors / total * 100, 2),
+            'avg_ms': round(latency.mean(), 2),
+            'p95_ms': round(latency.percentile(0.95), 2),
+            'p99_ms': round(latency.percentile(0.99), 2),
+            'max_ms': round(latency.max_bound(), 2),
+            'avg_db_queries': round(stats.db_queries.mean(), 2) if has_db else None,
+            'p95_db_queries': round(stats.db_queries.percentile(0.95), 2) if has_db else None,
+            'avg_db_ms': round(stats.db_time.mean(), 2) if has_db else None,
+            'p95_db_ms': round(stats.db_time.percentile(0.95), 2) if has_db else None,
+            'n_plus_one_requests': stats.n_plus_one,
+            'last_seen': stats.last_seen,
         })
 
     ranking.sort(key=lambda x: (x['p95_ms'], x['avg_ms'], x['count']), reverse=True)
 
+    from .invalidation import invalidation_bus
+
     return {
         'generated_at': datetime.now().isoformat(),
         'top_slow_endpoints': ranking[:top_n],
         'recent_slow_requests': list(metrics.slow_requests)[:top_n * 2],
+        'recent_n_plus_one': list(metrics.n_plus_one_samples)[:top_n * 2],
+        'cache_invalidation': invalidation_bus.stats(),
     }
 
 
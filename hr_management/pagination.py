@@ -1,5 +1,14 @@
 """自定义分页类"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
@@ -8,3 +17,152 @@ class StandardPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     # 收紧全局上限，避免 page_size=9999 造成慢请求与大响应体。
     max_page_size = 1000
+
+
+class KeysetPagination(StandardPagination):
+    """可选的游标（keyset）分页，用于按时间倒序的大表
+
+    请求带 cursor 参数时启用（首页传空值 `?cursor=`）：按视图的 keyset_ordering
+    （如 ('-date', '-id')）生成 WHERE (date, id) < (…) 条件，不执行 COUNT(*)、不使用 OFFSET，
+    深页与首页代价相同。未带 cursor 参数时仍为页码分页，兼容现有前端。
+
+    游标模式下 count 默认为 null；with_total=1 时返回估算总数（最多统计 total_cap 条，
+    超过时 count_is_estimate 为 true）。
+    """
+    cursor_query_param = 'cursor'
+    total_query_param = 'with_total'
+    keyset_ordering = ('-id',)
+    total_cap = 10000
+    invalid_cursor_message = '无效的分页游标'
+
+    def is_cursor_mode(self, request) -> bool:
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', None) or self.keyset_ordering)
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        ordering = tuple(_flip(field) for field in self.ordering) if reverse else self.ordering
+        qs = queryset.order_by(*ordering)
+        if position is not None:
+            qs = qs.filter(_after(ordering, position))
+        rows = list(qs[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # 向后翻页时，"更多"指的是更前面的数据
+        self.has_next = (position is not None) if reverse else has_more
+        self.has_previous = has_more if reverse else (position is not None)
+        self.first_key = self._key(rows[0]) if rows else None
+        self.last_key = self._key(rows[-1]) if rows else None
+
+        self.total, self.total_is_estimate = None, False
+        if request.query_params.get(self.total_query_param) in ('1', 'true'):
+            self.total = queryset.order_by()[:self.total_cap + 1].count()
+            if self.total > self.total_cap:
+                self.total, self.total_is_estimate = self.total_cap, True
+        return rows
+
+    def _key(self, obj):
+        return [_encode_value(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+
+    def encode_cursor(self, key, reverse=False):
+        payload = json.dumps({'k': key, 'r': 1 if reverse else 0}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            key, reverse = payload['k'], bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(key, list) or len(key) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return key, reverse
+
+    def _cursor_link(self, token):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_next_cursor(self):
+        if not self.has_next or self.last_key is None:
+            return None
+        return self.encode_cursor(self.last_key)
+
+    def get_previous_cursor(self):
+        if not self.has_previous or self.first_key is None:
+            return None
+        return self.encode_cursor(self.first_key, reverse=True)
+
+    def get_paginated_data(self, data):
+        if not self.cursor_mode:
+            return OrderedDict([
+                ('count', self.page.paginator.count),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ])
+        next_cursor, previous_cursor = self.get_next_cursor(), self.get_previous_cursor()
+        return OrderedDict([
+            ('count', self.total),
+            ('count_is_estimate', self.total_is_estimate),
+            ('next', self._cursor_link(next_cursor) if next_cursor else None),
+            ('previous', self._cursor_link(previous_cursor) if previous_cursor else None),
+            ('next_cursor', next_cursor),
+            ('previous_cursor', previous_cursor),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+def _flip(field: str) -> str:
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _after(ordering, position) -> Q:
+    """按排序方向取游标之后的行：(a, b) < (x, y) 展开为 a < x OR (a = x AND b < y)"""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        term = Q(**{f'{name}__{lookup}': position[i]})
+        for prev_field, prev_value in zip(ordering[:i], position[:i]):
+            term &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= term
+    return condition
+
+
+def paginate_rows(request, queryset, ordering, serialize):
+    """函数视图的可选分页
+
+    带 cursor 参数时按 ordering 游标分页，带 page/page_size 时页码分页，
+    返回 {count, next, previous, results, ...}；都没带时返回 None，由调用方沿用原有的全量列表。
+    """
+    paginator = KeysetPagination()
+    paginator.keyset_ordering = tuple(ordering)
+    params = request.query_params
+    if not (paginator.is_cursor_mode(request) or paginator.page_query_param in params
+            or paginator.page_size_query_param in params):
+        return None
+    page = paginator.paginate_queryset(queryset.order_by(*ordering), request)
+    return paginator.get_paginated_data([serialize(item) for item in page])
@@ -1,30 +1,86 @@
 """
 权限缓存模块
 提供高效的权限检查缓存机制，减少数据库查询
+
+两级缓存:
+- L1: 进程内 LRU，按 user_id 保存 (版本号, 权限集合)，命中时只需一次 get_many 校验版本
+- L2: Django cache（Redis），跨进程共享
+
+失效采用版本号而非删除/清空：全局、角色、用户三类计数器由信号递增，
+缓存条目记录构建时的版本号，版本不一致即视为过期，无需 cache.clear()。
+角色列表、管理部门列表的键拼接命名空间代数（perm、perm:user:{id}，管理部门另含 org，见 cache_namespace）。
+同一请求内的多次权限检查复用挂在 user 对象上的结果，不再产生网络往返。
 """
-import hashlib
-import json
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from typing import Optional, Set, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Set, FrozenSet, List, Tuple, Iterable
 from django.core.cache import cache
 from django.conf import settings
 
+from . import cache_namespace
+
 
 # 缓存配置
-PERMISSION_CACHE_TTL = getattr(settings, 'PERMISSION_CACHE_TTL', 300)  # 5分钟
+PERMISSION_CACHE_TTL = getattr(settings, 'PERMISSION_CACHE_TTL', 6 * 3600)  # 6小时，正确性由版本号与信号失效保证
+PERMISSION_LOCAL_CACHE_SIZE = getattr(settings, 'PERMISSION_LOCAL_CACHE_SIZE', 1024)
 PERMISSION_CACHE_PREFIX = 'perm:'
 
+# 挂在 request.user 上的请求级结果属性名
+_REQUEST_ATTR = '_rbac_permissions'
+
+
+class _LocalLRU:
+    """线程安全的进程内 LRU 缓存"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_local_permissions = _LocalLRU(PERMISSION_LOCAL_CACHE_SIZE)
+
+
+def _new_version() -> int:
+    """生成新的版本号（微秒时间戳）"""
+    return time.time_ns() // 1000
+
 
 class PermissionCache:
     """
     用户权限缓存管理器
 
     缓存结构:
-    - perm:user:{user_id}:all - 用户所有权限集合
-    - perm:user:{user_id}:roles - 用户角色列表
-    - perm:user:{user_id}:depts - 用户管理的部门ID列表
-    - perm:role:{role_id}:perms - 角色权限列表
+    - perm:user:{user_id}:all - 用户权限条目 {'perms', 'roles', 'versions'}
+    - perm:user:{user_id}:roles#<代数> - 用户角色列表
+    - perm:user:{user_id}:depts#<代数> - 用户管理的部门ID列表
+    - perm:ver:global / perm:ver:role:{role_id} / perm:ver:user:{user_id} - 版本计数器
     """
 
     @staticmethod
@@ -33,75 +89,187 @@ class PermissionCache:
         parts = [PERMISSION_CACHE_PREFIX, prefix] + [str(a) for a in args]
         return ':'.join(parts)
 
+    # ---------- 版本计数器 ----------
+
     @classmethod
-    def get_user_permissions(cls, user_id: int) -> Optional[Set[str]]:
-        """获取用户权限集合（从缓存）"""
-        key = cls._get_cache_key('user', user_id, 'all')
-        cached = cache.get(key)
-        if cached is not None:
-            return set(cached)
-        return None
+    def _version_keys(cls, user_id: int, role_ids: Iterable[int] = ()) -> List[str]:
+        keys = [cls._get_cache_key('ver', 'global'), cls._get_cache_key('ver', 'user', user_id)]
+        keys.extend(cls._get_cache_key('ver', 'role', rid) for rid in sorted(role_ids))
+        return keys
+
+    @classmethod
+    def get_versions(cls, user_id: int, role_ids: Iterable[int] = ()) -> Tuple[int, ...]:
+        """一次 get_many 读取 全局/用户/角色 版本号，缺失的计数器按当前时间初始化"""
+        keys = cls._version_keys(user_id, role_ids)
+        found = cache.get_many(keys)
+        versions = []
+        for key in keys:
+            value = found.get(key)
+            if value is None:
+                # 以微秒时间戳作为初值：计数器被淘汰后重建也不会与旧条目的版本号相撞
+                cache.add(key, _new_version(), None)
+                value = cache.get(key)
+            versions.append(value)
+        return tuple(versions)
+
+    @classmethod
+    def bump_version(cls, *parts) -> None:
+        """递增版本计数器，使依赖它的权限条目全部过期"""
+        key = cls._get_cache_key('ver', *parts)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
 
     @classmethod
-    def set_user_permissions(cls, user_id: int, permissions: Set[str]) -> None:
-        """设置用户权限缓存"""
+    def _namespaced_key(cls, user_id: int, part: str, *namespaces: str) -> str:
+        return cache_namespace.versioned_key(
+            cls._get_cache_key('user', user_id, part), ('perm', f'perm:user:{user_id}') + namespaces
+        )
+
+    # ---------- 用户权限条目 ----------
+
+    @classmethod
+    def get_user_permissions(cls, user_id: int) -> Optional[FrozenSet[str]]:
+        """获取用户权限集合（L1 -> L2，版本校验通过才返回）"""
+        entry = _local_permissions.get(user_id)
+        from_local = entry is not None
+        if entry is None:
+            entry = cache.get(cls._get_cache_key('user', user_id, 'all'))
+            if not isinstance(entry, dict):
+                return None
+
+        if cls.get_versions(user_id, entry['roles']) != tuple(entry['versions']):
+            _local_permissions.pop(user_id)
+            return None
+
+        perms = entry['perms'] if from_local else frozenset(entry['perms'])
+        if not from_local:
+            _local_permissions.set(user_id, {**entry, 'perms': perms})
+        return perms
+
+    @classmethod
+    def set_user_permissions(cls, user_id: int, permissions: Set[str],
+                             role_ids: Iterable[int] = (), versions: Tuple[int, ...] = ()) -> None:
+        """设置用户权限缓存（同时写入 L1 与 L2）"""
+        role_ids = sorted(set(role_ids))
+        if not versions:
+            versions = cls.get_versions(user_id, role_ids)
+        perms = frozenset(permissions)
+        entry = {'perms': perms, 'roles': role_ids, 'versions': tuple(versions)}
+        _local_permissions.set(user_id, entry)
         key = cls._get_cache_key('user', user_id, 'all')
-        cache.set(key, list(permissions), PERMISSION_CACHE_TTL)
+        cache.set(key, {**entry, 'perms': list(perms)}, PERMISSION_CACHE_TTL)
 
     @classmethod
     def get_user_roles(cls, user_id: int) -> Optional[List[str]]:
         """获取用户角色列表（从缓存）"""
-        key = cls._get_cache_key('user', user_id, 'roles')
-        return cache.get(key)
+        return cache.get(cls._namespaced_key(user_id, 'roles'))
 
     @classmethod
     def set_user_roles(cls, user_id: int, roles: List[str]) -> None:
         """设置用户角色缓存"""
-        key = cls._get_cache_key('user', user_id, 'roles')
-        cache.set(key, roles, PERMISSION_CACHE_TTL)
+        cache.set(cls._namespaced_key(user_id, 'roles'), roles, PERMISSION_CACHE_TTL)
 
     @classmethod
     def get_managed_departments(cls, user_id: int) -> Optional[List[int]]:
         """获取用户管理的部门ID列表（从缓存）"""
-        key = cls._get_cache_key('user', user_id, 'depts')
-        return cache.get(key)
+        return cache.get(cls._namespaced_key(user_id, 'depts', 'org'))
 
     @classmethod
     def set_managed_departments(cls, user_id: int, dept_ids: List[int]) -> None:
         """设置用户管理部门缓存"""
-        key = cls._get_cache_key('user', user_id, 'depts')
-        cache.set(key, dept_ids, PERMISSION_CACHE_TTL)
+        cache.set(cls._namespaced_key(user_id, 'depts', 'org'), dept_ids, PERMISSION_CACHE_TTL)
+
+    # ---------- 失效 ----------
 
     @classmethod
     def invalidate_user(cls, user_id: int) -> None:
         """清除用户的所有权限缓存"""
-        keys = [
-            cls._get_cache_key('user', user_id, 'all'),
-            cls._get_cache_key('user', user_id, 'roles'),
-            cls._get_cache_key('user', user_id, 'depts'),
-        ]
-        cache.delete_many(keys)
+        cls.invalidate_users([user_id])
+
+    @classmethod
+    def invalidate_users(cls, user_ids: Iterable[int]) -> None:
+        """批量失效：一次 delete_many 删除权限条目，一次 set_many 重置用户版本号（使其他进程的 L1 过期），
+        一次 set_many 递增用户命名空间代数（角色、管理部门列表）"""
+        user_ids = {uid for uid in user_ids if uid is not None}
+        if not user_ids:
+            return
+        cache.delete_many([cls._get_cache_key('user', uid, 'all') for uid in user_ids])
+        version = _new_version()
+        cache.set_many({cls._get_cache_key('ver', 'user', uid): version for uid in user_ids}, None)
+        cache_namespace.bump(*(f'perm:user:{uid}' for uid in user_ids))
+        for uid in user_ids:
+            _local_permissions.pop(uid)
 
     @classmethod
     def invalidate_role(cls, role_id: int) -> None:
-        """清除角色相关缓存（会清除所有用户缓存）"""
-        # 角色变更时需要清除所有用户缓存
-        # 在实际生产中，应该只清除受影响用户的缓存
-        key = cls._get_cache_key('role', role_id, 'perms')
-        cache.delete(key)
+        """角色变更：递增角色版本号，仅持有该角色的用户条目过期"""
+        cls.bump_version('role', role_id)
 
     @classmethod
     def invalidate_all(cls) -> None:
-        """清除所有权限缓存（慎用）"""
-        # 使用 pattern 删除所有权限缓存
-        # 注意：这在某些缓存后端可能不支持
-        try:
-            cache.clear()  # 简化处理
-        except Exception:
-            pass
+        """使所有权限缓存过期（递增全局版本号与 perm 命名空间代数，不清空整个缓存库）"""
+        cls.bump_version('global')
+        cache_namespace.bump('perm')
+        _local_permissions.clear()
+
 
+class PermissionIndex:
+    """权限反向索引：角色/职位 -> 受影响的用户
 
-def cached_user_permissions(user) -> Set[str]:
+    直接基于 Role.users 与 Employee.position / Position.default_roles 关系，
+    用一条 UNION 查询算出需要失效的用户集合，供信号批量失效使用。
+    """
+
+    @staticmethod
+    def affected_user_ids(role_ids: Iterable[int] = (), position_ids: Iterable[int] = ()) -> Set[int]:
+        from .models import Role, Employee
+
+        role_ids, position_ids = list(role_ids), list(position_ids)
+        parts = []
+        if role_ids:
+            parts.append(Role.users.through.objects.filter(role_id__in=role_ids).order_by().values_list('user_id'))
+            parts.append(Employee.objects.filter(position__default_roles__in=role_ids).order_by().values_list('user_id'))
+        if position_ids:
+            parts.append(Employee.objects.filter(position_id__in=position_ids).order_by().values_list('user_id'))
+        if not parts:
+            return set()
+        qs = parts[0].union(*parts[1:]) if len(parts) > 1 else parts[0]
+        return {row[0] for row in qs}
+
+    @classmethod
+    def invalidate(cls, role_ids: Iterable[int] = (), position_ids: Iterable[int] = ()) -> None:
+        PermissionCache.invalidate_users(cls.affected_user_ids(role_ids, position_ids))
+
+
+def _load_user_permissions(user) -> FrozenSet[str]:
+    """从数据库加载用户权限（用户直接角色 + 职位默认角色）并写入缓存
+
+    直接角色与职位角色通过一条 UNION 查询取回 (角色ID, 权限键) 对；
+    权限为空的角色以 (角色ID, NULL) 出现，保证其版本号同样被跟踪。
+    """
+    from .models import Role
+
+    # 先读全局/用户版本，再读角色关系：加载期间发生的变更会让写入的条目立即过期
+    base_versions = PermissionCache.get_versions(user.id)
+
+    direct = Role.objects.filter(users=user).order_by().values_list('id', 'permissions__key')
+    via_position = Role.objects.filter(positions__employee__user=user).order_by().values_list('id', 'permissions__key')
+    role_ids, keys = set(), set()
+    for role_id, key in direct.union(via_position):
+        role_ids.add(role_id)
+        if key:
+            keys.add(key)
+    permissions = frozenset(keys)
+
+    # 角色版本只能在查询之后读取；其间的角色变更窗口极短，且仍受 PERMISSION_CACHE_TTL 兜底
+    role_versions = PermissionCache.get_versions(user.id, role_ids)[2:]
+    PermissionCache.set_user_permissions(user.id, permissions, role_ids, base_versions + role_versions)
+    return permissions
+
+
+def cached_user_permissions(user) -> FrozenSet[str]:
     """
     获取用户权限（带缓存）
 
@@ -112,43 +280,22 @@ def cached_user_permissions(user) -> Set[str]:
         用户权限集合
     """
     if not user or not user.is_authenticated:
-        return set()
+        return frozenset()
 
     # 仅超级管理员返回特殊标记
     if user.is_superuser:
-        return {'*'}  # 通配符表示所有权限
-
-    # 尝试从缓存获取
-    cached = PermissionCache.get_user_permissions(user.id)
-    if cached is not None:
-        return cached
+        return frozenset({'*'})  # 通配符表示所有权限
 
-    # 从数据库加载（包含用户直接角色 + 职位默认角色）
-    from .models import Role, Employee
-    permissions = set()
+    # 同一请求内复用已解析的结果
+    permissions = getattr(user, _REQUEST_ATTR, None)
+    if permissions is not None:
+        return permissions
 
-    # 用户直接关联的角色权限
-    roles = Role.objects.filter(users=user).prefetch_related('permissions')
-    for role in roles:
-        for perm in role.permissions.all():
-            permissions.add(perm.key)
-
-    # 用户通过职位继承的角色权限
-    try:
-        employee = Employee.objects.select_related('position').get(user=user)
-        if employee.position:
-            position_roles = Role.objects.filter(
-                positions=employee.position
-            ).prefetch_related('permissions')
-            for role in position_roles:
-                for perm in role.permissions.all():
-                    permissions.add(perm.key)
-    except Employee.DoesNotExist:
-        pass
-
-    # 写入缓存
-    PermissionCache.set_user_permissions(user.id, permissions)
+    permissions = PermissionCache.get_user_permissions(user.id)
+    if permissions is None:
+        permissions = _load_user_permissions(user)
 
+    setattr(user, _REQUEST_ATTR, permissions)
     return permissions
 
 
@@ -250,39 +397,94 @@ def has_role_cached(user, role_code: str) -> bool:
     return role_code in roles
 
 
-# 信号处理器：当权限相关数据变更时清除缓存
+# 信号处理器：当权限相关数据变更时递增对应版本号
 def setup_permission_cache_signals():
     """设置权限缓存失效信号"""
-    from django.db.models.signals import post_save, post_delete, m2m_changed
-    from .models import Role, RBACPermission
-    from django.contrib.auth import get_user_model
-
-    User = get_user_model()
+    from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+    from .models import Role, RBACPermission, Position, Employee
 
-    def invalidate_role_cache(sender, instance, **kwargs):
-        """角色变更时清除缓存"""
+    def role_saved(sender, instance, created, **kwargs):
+        """角色变更：递增角色版本；非新建时角色代码可能变化，批量失效持有者"""
         PermissionCache.invalidate_role(instance.id)
-
-    def invalidate_user_permissions(sender, instance, **kwargs):
-        """用户角色关联变更时清除缓存"""
-        if kwargs.get('action') in ('post_add', 'post_remove', 'post_clear'):
-            # 清除所有受影响用户的缓存
-            if hasattr(instance, 'users'):
-                for user in instance.users.all():
-                    PermissionCache.invalidate_user(user.id)
-            elif hasattr(instance, 'id'):
-                PermissionCache.invalidate_user(instance.id)
-
-    post_save.connect(invalidate_role_cache, sender=Role)
-    post_delete.connect(invalidate_role_cache, sender=Role)
-
-    # 监听 Role.users 多对多关系变更
-    if hasattr(Role, 'users'):
-        m2m_changed.connect(invalidate_user_permissions, sender=Role.users.through)
-
-    # 监听 Role.permissions 多对多关系变更
-    if hasattr(Role, 'permissions'):
-        m2m_changed.connect(invalidate_user_permissions, sender=Role.permissions.through)
+        if not created:
+            PermissionIndex.invalidate(role_ids=[instance.id])
+
+    def remember_affected_users(sender, instance, **kwargs):
+        """删除前记录受影响用户（删除后关联关系已不存在）"""
+        if sender is Role:
+            instance._perm_affected_users = PermissionIndex.affected_user_ids(role_ids=[instance.id])
+        else:
+            instance._perm_affected_users = PermissionIndex.affected_user_ids(position_ids=[instance.id])
+
+    def invalidate_remembered_users(sender, instance, **kwargs):
+        if sender is Role:
+            PermissionCache.invalidate_role(instance.id)
+        PermissionCache.invalidate_users(getattr(instance, '_perm_affected_users', ()))
+
+    def role_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        """Role.users 变更：新增/移除的用户单独失效，整体清空则递增角色版本"""
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if reverse:
+            # user.roles.add/remove/clear：instance 是 User
+            PermissionCache.invalidate_user(instance.id)
+        elif action == 'post_clear':
+            PermissionCache.invalidate_role(instance.id)
+        else:
+            PermissionCache.invalidate_users(pk_set or ())
+
+    def role_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        """Role.permissions 变更：递增受影响角色的版本"""
+        if not reverse:
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                PermissionCache.invalidate_role(instance.id)
+            return
+        # permission.roles.add/remove/clear：instance 是 RBACPermission
+        if action in ('post_add', 'post_remove'):
+            for role_id in pk_set or ():
+                PermissionCache.invalidate_role(role_id)
+        elif action == 'pre_clear':
+            for role_id in instance.roles.values_list('id', flat=True):
+                PermissionCache.invalidate_role(role_id)
+
+    def position_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        """Position.default_roles 变更：该职位下所有员工的权限失效"""
+        if reverse:
+            # role.positions.add/remove/clear：instance 是 Role
+            if action in ('post_add', 'post_remove'):
+                PermissionIndex.invalidate(position_ids=pk_set or ())
+            elif action == 'pre_clear':
+                PermissionIndex.invalidate(role_ids=[instance.id])
+        elif action in ('post_add', 'post_remove', 'post_clear'):
+            PermissionIndex.invalidate(position_ids=[instance.id])
+
+    def employee_changed(sender, instance, **kwargs):
+        """员工职位（或账号绑定）变化会改变其职位角色"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields and not {'position', 'user'} & set(update_fields):
+            return
+        PermissionCache.invalidate_user(instance.user_id)
+
+    # 部门经理变化：部门信号递增 org 命名空间，新旧经理的管理部门缓存一并过期（见 signals.py）
+    def permission_changed(sender, instance, **kwargs):
+        """权限键被修改/删除属于低频操作，直接递增全局版本"""
+        PermissionCache.invalidate_all()
+
+    uid = 'permission_cache'
+    post_save.connect(role_saved, sender=Role, dispatch_uid=f'{uid}.role_save')
+    pre_delete.connect(remember_affected_users, sender=Role, dispatch_uid=f'{uid}.role_pre_delete')
+    post_delete.connect(invalidate_remembered_users, sender=Role, dispatch_uid=f'{uid}.role_delete')
+    pre_delete.connect(remember_affected_users, sender=Position, dispatch_uid=f'{uid}.position_pre_delete')
+    post_delete.connect(invalidate_remembered_users, sender=Position, dispatch_uid=f'{uid}.position_delete')
+    post_save.connect(employee_changed, sender=Employee, dispatch_uid=f'{uid}.employee_save')
+    post_delete.connect(employee_changed, sender=Employee, dispatch_uid=f'{uid}.employee_delete')
+    post_save.connect(permission_changed, sender=RBACPermission, dispatch_uid=f'{uid}.perm_save')
+    post_delete.connect(permission_changed, sender=RBACPermission, dispatch_uid=f'{uid}.perm_delete')
+    m2m_changed.connect(role_users_changed, sender=Role.users.through, dispatch_uid=f'{uid}.role_users')
+    m2m_changed.connect(role_permissions_changed, sender=Role.permissions.through,
+                        dispatch_uid=f'{uid}.role_permissions')
+    m2m_changed.connect(position_roles_changed, sender=Position.default_roles.through,
+                        dispatch_uid=f'{uid}.position_roles')
 
 
 # 装饰器：自动缓存权限检查结果
@@ -5,6 +5,7 @@ from .permission_cache import (
     cached_managed_departments,
     has_permission_cached,
 )
+from .rbac import get_request_rbac
 
 
 def get_managed_department_ids(user):
@@ -72,15 +73,13 @@ class HasRBACPermission(BasePermission):
             return True
 
         method = request.method
+        rbac = get_request_rbac(request)
 
         # 优先使用 get_rbac_permissions 方法获取权限
         if hasattr(view, 'get_rbac_permissions') and callable(view.get_rbac_permissions):
             required_perms = view.get_rbac_permissions()
             if required_perms:
-                for perm in required_perms:
-                    if not user_has_rbac_permission(request.user, perm):
-                        return False
-                return True
+                return rbac.has_all(required_perms)
 
         # 获取视图上配置的权限
         rbac_perms = getattr(view, 'rbac_perms', {})
@@ -93,10 +92,8 @@ class HasRBACPermission(BasePermission):
             # 列表形式，所有方法使用相同权限
             required_perms = rbac_perms if isinstance(rbac_perms, list) else []
 
-        if required_perms:
-            for perm in required_perms:
-                if not user_has_rbac_permission(request.user, perm):
-                    return False
+        if required_perms and not rbac.has_all(required_perms):
+            return False
 
         # 处理 rbac_perms_any (只需任一权限)
         if isinstance(rbac_perms_any, dict):
@@ -105,9 +102,8 @@ class HasRBACPermission(BasePermission):
             # 列表形式，所有方法使用相同权限
             any_perms = rbac_perms_any if isinstance(rbac_perms_any, list) else []
 
-        if any_perms:
-            if not any(user_has_rbac_permission(request.user, perm) for perm in any_perms):
-                return False
+        if any_perms and not rbac.has_any(any_perms):
+            return False
 
         return True
 
@@ -1,12 +1,12 @@
 """
 数据库查询监控模块
-用于开发环境下检测 N+1 查询问题和慢查询
+用于开发环境下检测 N+1 查询问题和慢查询；QueryRecorder 基于 execute_wrapper，生产环境同样可用
 """
 import time
 import logging
 import functools
 from collections import defaultdict
-from typing import Optional, Callable, Any
+from typing import Optional, Callable, Any, Dict, List
 from contextlib import contextmanager
 from django.db import connection, reset_queries
 from django.conf import settings
@@ -103,7 +103,8 @@ class QueryMonitor:
         # 记录日志
         self._log_stats(stats)
     
-    def _normalize_sql(self, sql: str) -> str:
+    @staticmethod
+    def _normalize_sql(sql: str) -> str:
         """
         标准化 SQL 用于比较
         移除具体的值，只保留模式
@@ -149,6 +150,63 @@ class QueryMonitor:
                 )
 
 
+@functools.lru_cache(maxsize=2048)
+def sql_fingerprint(sql: str) -> str:
+    """参数化 SQL 的指纹：%s 占位符先转为 ?，再按 QueryMonitor._normalize_sql 标准化"""
+    return QueryMonitor._normalize_sql(sql.replace('%s', '?'))
+
+
+class QueryRecorder:
+    """
+    查询记录器 - 作为 connection.execute_wrapper 使用，不依赖 DEBUG 与 connection.queries
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            ...
+        recorder.count, recorder.total_ms, recorder.n_plus_one()
+
+    执行时只累加计数、耗时和原始 SQL（参数为占位符，同一语句文本相同），
+    指纹在读取结果时按不同 SQL 各计算一次。
+    """
+
+    N_PLUS_ONE_THRESHOLD = getattr(settings, 'DB_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self._sql_counts: Dict[str, int] = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.total_time += time.perf_counter() - start
+            self.count += 1
+            self._sql_counts[sql] += 1
+
+    @property
+    def total_ms(self) -> float:
+        return self.total_time * 1000
+
+    def fingerprints(self) -> Dict[str, int]:
+        """SQL 指纹 → 执行次数"""
+        counts: Dict[str, int] = defaultdict(int)
+        for sql, count in self._sql_counts.items():
+            counts[sql_fingerprint(sql)] += count
+        return counts
+
+    def n_plus_one(self) -> List[Dict[str, Any]]:
+        """执行次数达到阈值的 SQL 指纹（可能的 N+1 问题），按次数降序"""
+        suspects = [
+            {'pattern': pattern[:200], 'count': count}
+            for pattern, count in self.fingerprints().items()
+            if count >= self.N_PLUS_ONE_THRESHOLD
+        ]
+        suspects.sort(key=lambda item: item['count'], reverse=True)
+        return suspects
+
+
 class QueryDebugMiddleware:
     """
     数据库查询调试中间件
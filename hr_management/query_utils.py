@@ -124,9 +124,14 @@ class BulkOperations:
     
     @staticmethod
     def bulk_update_attendance_status(attendance_ids, updates):
-        """批量更新考勤状态"""
-        from .models import Attendance
-        return Attendance.objects.filter(id__in=attendance_ids).update(**updates)
+        """批量更新考勤状态（update 不触发信号，只重算涉及的各个日期的考勤日汇总）"""
+        from .models import Attendance, AttendanceDailyStat
+        qs = Attendance.objects.filter(id__in=attendance_ids)
+        dates = sorted(set(qs.values_list('date', flat=True)))
+        updated = qs.update(**updates)
+        if dates:
+            AttendanceDailyStat.rebuild(dates=dates)
+        return updated
     
     @staticmethod
     def bulk_approve_leaves(leave_ids, approved_by, comments=''):
@@ -158,22 +163,28 @@ class BulkOperations:
     
     @staticmethod
     def bulk_create_salary_records(records_data):
-        """批量创建薪资记录"""
-        from .models import SalaryRecord
+        """批量创建薪资记录（bulk_create 不触发信号，重算涉及月份的薪资汇总）"""
+        from .models import PayrollMonthlyStat, SalaryRecord
         records = [SalaryRecord(**data) for data in records_data]
-        return SalaryRecord.objects.bulk_create(records, ignore_conflicts=True)
+        created = SalaryRecord.objects.bulk_create(records, ignore_conflicts=True)
+        PayrollMonthlyStat.rebuild({(record.year, record.month) for record in records})
+        return created
     
     @staticmethod
     def bulk_mark_salaries_paid(salary_ids):
-        """批量标记薪资已发放"""
-        from .models import SalaryRecord
-        return SalaryRecord.objects.filter(
+        """批量标记薪资已发放（update 不触发信号，重算涉及月份的薪资汇总）"""
+        from .models import PayrollMonthlyStat, SalaryRecord
+        qs = SalaryRecord.objects.filter(
             id__in=salary_ids,
             paid=False
-        ).update(
+        )
+        periods = set(qs.values_list('year', 'month').distinct())
+        updated = qs.update(
             paid=True,
             paid_at=timezone.now()
         )
+        PayrollMonthlyStat.rebuild(periods)
+        return updated
 
 
 class ReportQueries:
@@ -4,6 +4,7 @@ RBAC 权限系统核心模块
 定义系统所有权限常量，以及权限检查工具函数
 """
 from functools import wraps
+from typing import FrozenSet, Iterable
 from rest_framework.response import Response
 
 
@@ -322,6 +323,59 @@ DEFAULT_ROLES = {
 }
 
 
+class RBACContext:
+    """请求级权限上下文，由 RBACMiddleware 挂载为 request.rbac
+
+    权限集合在首次检查时编译一次（缓存未命中时为单条查询），之后同一请求内的
+    所有检查都是 frozenset 成员判断。用户惰性读取：DRF 完成认证后会回写
+    request.user，届时自动按新用户重新解析。
+    """
+
+    __slots__ = ('_request', '_user', '_permissions')
+
+    def __init__(self, request):
+        self._request = request
+        self._user = None
+        self._permissions = None
+
+    @property
+    def user(self):
+        return getattr(self._request, 'user', None)
+
+    @property
+    def permissions(self) -> FrozenSet[str]:
+        """用户的权限键集合，超级管理员为 {'*'}"""
+        user = self.user
+        if self._permissions is None or user is not self._user:
+            from .permission_cache import cached_user_permissions
+            self._user = user
+            self._permissions = cached_user_permissions(user)
+        return self._permissions
+
+    def has(self, permission_key: str) -> bool:
+        permissions = self.permissions
+        return '*' in permissions or permission_key in permissions
+
+    def has_all(self, permission_keys: Iterable[str]) -> bool:
+        permissions = self.permissions
+        return '*' in permissions or permissions.issuperset(permission_keys)
+
+    def has_any(self, permission_keys: Iterable[str]) -> bool:
+        permissions = self.permissions
+        return '*' in permissions or not permissions.isdisjoint(permission_keys)
+
+    __contains__ = has
+
+
+def get_request_rbac(request) -> RBACContext:
+    """获取 request.rbac；未经过中间件（如测试、内部调用）时就地创建并挂载"""
+    rbac = getattr(request, 'rbac', None)
+    if rbac is None:
+        rbac = RBACContext(request)
+        request.rbac = rbac
+    return rbac
+
+
 def user_has_permission(user, permission_key):
     """检查用户是否拥有指定权限（委托给统一的缓存版本）
 
@@ -365,10 +419,11 @@ def require_permission(*permission_keys, any_of=False):
                 return view_func(self, request, *args, **kwargs)
 
             # 检查权限
+            rbac = get_request_rbac(request)
             if any_of:
-                has_perm = any(user_has_permission(user, key) for key in permission_keys)
+                has_perm = rbac.has_any(permission_keys)
             else:
-                has_perm = all(user_has_permission(user, key) for key in permission_keys)
+                has_perm = rbac.has_all(permission_keys)
 
             if not has_perm:
                 return Response({
@@ -406,15 +461,17 @@ class RBACPermissionMixin:
         if user.is_superuser:
             return True, None
 
+        rbac = get_request_rbac(request)
+
         # 检查所有必需权限
         if self.required_permissions:
             for key in self.required_permissions:
-                if not user_has_permission(user, key):
+                if not rbac.has(key):
                     return False, f'缺少权限: {key}'
 
         # 检查任一权限
         if self.required_any_permission:
-            if not any(user_has_permission(user, key) for key in self.required_any_permission):
+            if not rbac.has_any(self.required_any_permission):
                 return False, '权限不足'
 
         return True, None
@@ -0,0 +1,97 @@
+"""
+部门汇总（rollup）- 一次分组查询 + 内存中沿部门树向上累加
+
+    tree = DepartmentRollup()
+    salary = tree.aggregate(
+        SalaryRecord.objects.filter(year=2025, month=6),
+        'employee__department_id',
+        total=Sum('net_salary'), cnt=Count('id'),
+    )
+    for dept_id, name in tree.top_level():
+        salary.total(dept_id)   # {'total': Decimal, 'cnt': int}，含全部下级部门
+
+- 部门结构：一次查询加载 (id, name, parent_id)，按"子部门在前"的顺序排好
+- 每个指标源：queryset.values(部门字段).annotate(...) 一次 GROUP BY 查询，得到各部门自身的数值
+- 汇总：按子部门在前的顺序把每个部门的合计加到上级，O(部门数 × 指标数)
+
+只适用于可加的聚合（Sum、Count）；平均值请汇总 Sum 与 Count 后再相除。
+部门字段为空的行计入 unassigned（未分配部门）。
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .models import Department
+
+
+class RollupResult:
+    def __init__(self, metrics: Tuple[str, ...], own: Dict[int, Dict[str, Any]],
+                 totals: Dict[int, Dict[str, Any]], unassigned: Dict[str, Any]):
+        self.metrics = metrics
+        self.own = own
+        self.totals = totals
+        self.unassigned = unassigned
+
+    def _zero(self) -> Dict[str, Any]:
+        return dict.fromkeys(self.metrics, 0)
+
+    def total(self, dept_id: int) -> Dict[str, Any]:
+        """部门及全部下级部门的合计"""
+        return self.totals.get(dept_id) or self._zero()
+
+    def self_total(self, dept_id: int) -> Dict[str, Any]:
+        """仅部门自身（不含下级）"""
+        return self.own.get(dept_id) or self._zero()
+
+
+class DepartmentRollup:
+    def __init__(self):
+        self.names: Dict[int, str] = {}
+        self.parents: Dict[int, Optional[int]] = {}
+        self.children: Dict[int, List[int]] = {}
+        rows = list(Department.objects.values_list('id', 'name', 'parent_id'))
+        for dept_id, name, _ in rows:
+            self.names[dept_id] = name
+        self.roots: List[int] = []
+        for dept_id, _, parent_id in rows:
+            parent_id = parent_id if parent_id in self.names else None
+            self.parents[dept_id] = parent_id
+            if parent_id is None:
+                self.roots.append(dept_id)
+            else:
+                self.children.setdefault(parent_id, []).append(dept_id)
+
+        # 自根向下逐层展开，再倒序：任一部门都排在其上级之前（成环的数据不可达，自然被忽略）
+        order = list(self.roots)
+        i = 0
+        while i < len(order):
+            order.extend(self.children.get(order[i], ()))
+            i += 1
+        self.bottom_up = order[::-1]
+
+    def top_level(self) -> Iterator[Tuple[int, str]]:
+        for dept_id in self.roots:
+            yield dept_id, self.names[dept_id]
+
+    def aggregate(self, queryset, field: str = 'department_id', **metrics) -> RollupResult:
+        """按 field 分组聚合 queryset，并把各部门数值累加到所有上级"""
+        names = tuple(metrics)
+        own: Dict[int, Dict[str, Any]] = {}
+        unassigned = dict.fromkeys(names, 0)
+        for row in queryset.order_by().values(field).annotate(**metrics):
+            dept_id = row[field]
+            values = {name: row[name] or 0 for name in names}
+            if dept_id is None or dept_id not in self.names:
+                for name in names:
+                    unassigned[name] += values[name]
+            else:
+                own[dept_id] = values
+
+        totals = {dept_id: dict(values) for dept_id, values in own.items()}
+        for dept_id in self.bottom_up:
+            parent_id = self.parents[dept_id]
+            values = totals.get(dept_id)
+            if parent_id is None or values is None:
+                continue
+            parent = totals.setdefault(parent_id, dict.fromkeys(names, 0))
+            for name in names:
+                parent[name] += values[name]
+        return RollupResult(names, own, totals, unassigned)
@@ -6,20 +6,22 @@
 2. 提供统一的缓存策略
 3. 优化数据库查询，减少 N+1 问题
 """
-from typing import Optional, List, Dict, Any, Callable, TypeVar
-from functools import lru_cache, wraps
-import hashlib
+from typing import Optional, List, Dict, Callable, TypeVar
+from functools import lru_cache
+from fnmatch import fnmatchcase
 import json
-from django.core.cache import cache
 from django.db.models import Count, Sum, Q, Prefetch
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date, timedelta
 
 from .models import (
-    Employee, Department, Position, Attendance, AttendanceSupplement,
-    LeaveRequest, SalaryRecord, BusinessTrip, TravelExpense, Role
+    Employee, Department, DepartmentClosure, Position, Attendance, SalaryRecord, TravelExpense
 )
+from .permission_cache import PermissionCache, cached_user_permissions, has_any_permission_cached
+from . import cache_namespace
+from .invalidation import invalidation_bus
+from .memoize import get_or_compute, memoize
 
 
 T = TypeVar('T')
@@ -32,6 +34,7 @@ class CacheKeys:
     DEPARTMENT_TREE = 'dept_tree'
     DEPARTMENT_LIST = 'dept_list'
     DEPARTMENT_CHILDREN = 'dept_children_{dept_id}'
+    DEPARTMENT_PATHS = 'dept_paths'
     POSITION_LIST = 'position_list'
 
     # 员工
@@ -41,9 +44,9 @@ class CacheKeys:
     # 考勤
     ATTENDANCE_TODAY = 'att_today_{employee_id}'
     ATTENDANCE_MONTH = 'att_month_{employee_id}_{year}_{month}'
+    CHECKIN_EMPLOYEE = 'checkin_emp_{user_id}'
 
     # 权限
-    USER_PERMISSIONS = 'user_perms_{user_id}'
     USER_ROLES = 'user_roles_{user_id}'
 
     # 仪表盘
@@ -61,121 +64,101 @@ class CacheKeys:
     TIMEOUT_LONG = 3600       # 1小时
     TIMEOUT_DAY = 86400       # 1天
 
+    # 键模板所属的命名空间（由粗到细），实际键拼接各命名空间的代数，见 key() 与 cache_namespace。
+    # 失效时递增命名空间代数：'org' 使全部组织结构缓存过期，'attendance:{employee_id}' 只影响该员工。
+    # 未列出的键按原样使用：看板/报表快照走 snapshot_cache；签到热缓存为减少往返单独删除（见 checkin.py）
+    NAMESPACES = {
+        DEPARTMENT_TREE: ('org',),
+        DEPARTMENT_LIST: ('org',),
+        DEPARTMENT_CHILDREN: ('org',),
+        DEPARTMENT_PATHS: ('org',),
+        POSITION_LIST: ('org',),
+        EMPLOYEE_COUNT: ('employees',),
+        EMPLOYEE_BY_USER: ('employees', 'user:{user_id}'),
+        ATTENDANCE_TODAY: ('attendance', 'attendance:{employee_id}'),
+        ATTENDANCE_MONTH: ('attendance', 'attendance:{employee_id}', 'attendance:{year}-{month}'),
+        USER_ROLES: ('users', 'user:{user_id}'),
+        DASHBOARD_CHARTS: ('analytics',),
+    }
+
+    @classmethod
+    def key(cls, template: str, **params) -> str:
+        """按模板生成实际缓存键（含命名空间代数）"""
+        namespaces = [ns.format(**params) for ns in cls.NAMESPACES.get(template, ())]
+        return cache_namespace.versioned_key(template.format(**params), namespaces)
+
+    @classmethod
+    def templates(cls) -> List[str]:
+        """全部键模板"""
+        return [
+            value for name, value in vars(cls).items()
+            if name.isupper() and not name.startswith('TIMEOUT_') and isinstance(value, str)
+        ]
+
 
 # ============ 缓存装饰器 ============
-def cached(key_template: str, timeout: int = CacheKeys.TIMEOUT_MEDIUM):
+def cached(key_template: str, timeout: int = CacheKeys.TIMEOUT_MEDIUM, l1_ttl: float = 0):
     """
-缓存装饰器 - 自动缓存函数返回值
+缓存装饰器 - 自动缓存函数返回值（实现见 memoize）
 
-使用哨兵值区分"缓存未命中"和"函数返回 None"，避免缓存穿透。
+键模板在 CacheKeys.NAMESPACES 中登记了命名空间的，实际键自动拼接命名空间代数；
+None 等假值同样缓存，避免缓存穿透；未命中时只有一个请求回源。
 
 Args:
     key_template: 缓存键模板，支持 {arg_name} 格式
     timeout: 缓存超时时间
+    l1_ttl: 进程内缓存的 TTL（秒），0 表示不启用
 
 Example:
     @cached('user_{user_id}', timeout=300)
     def get_user(user_id):
         ...
 """
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        _SENTINEL = object()  # 哨兵值，区分缓存未命中与 None 返回值
-
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # 构建缓存键
-            # 将位置参数转换为关键字参数
-            import inspect
-            sig = inspect.signature(func)
-            bound = sig.bind(*args, **kwargs)
-            bound.apply_defaults()
-
-            try:
-                cache_key = key_template.format(**bound.arguments)
-            except KeyError:
-                # 如果模板参数不匹配，使用哈希
-                cache_key = f"{func.__name__}_{hashlib.md5(str(bound.arguments).encode()).hexdigest()[:8]}"
-
-            # 使用哨兵值区分缓存未命中与函数返回 None
-            result = cache.get(cache_key, _SENTINEL)
-            if result is not _SENTINEL:
-                return result
-
-            # 执行函数
-            result = func(*args, **kwargs)
-
-            # 无论结果是否为 None 都写入缓存，防止缓存穿透
-            cache.set(cache_key, result, timeout)
-
-            return result
-
-        # 添加缓存失效方法
-        def invalidate(*args, **kwargs):
-            import inspect
-            sig = inspect.signature(func)
-            bound = sig.bind(*args, **kwargs)
-            bound.apply_defaults()
-            cache_key = key_template.format(**bound.arguments)
-            cache.delete(cache_key)
-
-        wrapper.invalidate = invalidate
-        wrapper.cache_key_template = key_template
-        return wrapper
-
-    return decorator
+    return memoize(key_template, timeout, namespaces=CacheKeys.NAMESPACES.get(key_template, ()), l1_ttl=l1_ttl)
 
 
 def cache_result(key: str, timeout: int = CacheKeys.TIMEOUT_MEDIUM):
-    """简单的缓存包装器 - 用于缓存任意表达式结果"""
+    """简单的缓存包装器 - 用于缓存任意表达式结果（假值同样缓存）"""
     def get_or_set(func: Callable[[], T]) -> T:
-        result = cache.get(key)
-        if result is not None:
-            return result
-        result = func()
-        cache.set(key, result, timeout)
-        return result
+        return get_or_compute(key, func, timeout)
     return get_or_set
 
 
 class CacheManager:
-    """缓存管理器 - 提供批量操作和模式匹配"""
+    """缓存管理器 - 按命名空间批量失效（递增代数，不扫描键）"""
+
+    @staticmethod
+    def invalidate_namespace(*namespaces: str):
+        """使命名空间下的所有缓存键失效，如 'org'、'attendance:12'、'attendance:2025-6'"""
+        invalidation_bus.bump(*namespaces)
 
     @staticmethod
     def invalidate_pattern(pattern: str):
-        """清除匹配模式的所有缓存键"""
-        # Django 默认缓存不支持模式匹配，这里使用已知的键列表
-        known_patterns = {
-            'dept_*': [CacheKeys.DEPARTMENT_TREE, CacheKeys.DEPARTMENT_LIST],
-            'emp_*': [CacheKeys.EMPLOYEE_COUNT],
-            'dashboard_*': [CacheKeys.DASHBOARD_SUMMARY],
-        }
-        keys = known_patterns.get(pattern, [])
-        if keys:
-            cache.delete_many(keys)
+        """清除键模板匹配 pattern（如 'dept_*'、'att_*'）的所有缓存键"""
+        from .signals import ANALYTICS_SNAPSHOT_KEYS
+
+        for template in CacheKeys.templates():
+            if not fnmatchcase(template, pattern):
+                continue
+            namespaces = CacheKeys.NAMESPACES.get(template)
+            if namespaces:
+                # 第一个命名空间不带参数，覆盖该模板的全部实例
+                invalidation_bus.bump(namespaces[0])
+            elif template in ANALYTICS_SNAPSHOT_KEYS:
+                invalidation_bus.mark_dirty(template)
+            elif '{' not in template:
+                invalidation_bus.delete(template)
 
     @staticmethod
     def invalidate_user_related(user_id: int):
         """清除用户相关的所有缓存"""
-        keys = [
-            CacheKeys.USER_PERMISSIONS.format(user_id=user_id),
-            CacheKeys.USER_ROLES.format(user_id=user_id),
-            CacheKeys.EMPLOYEE_BY_USER.format(user_id=user_id),
-        ]
-        cache.delete_many(keys)
+        PermissionCache.invalidate_user(user_id)
+        invalidation_bus.bump(f'user:{user_id}')
 
     @staticmethod
     def invalidate_employee_related(employee_id: int):
-        """清除员工相关的所有缓存"""
-        today = timezone.localdate()
-        keys = [
-            CacheKeys.ATTENDANCE_TODAY.format(employee_id=employee_id),
-            CacheKeys.ATTENDANCE_MONTH.format(
-                employee_id=employee_id,
-                year=today.year,
-                month=today.month
-            ),
-        ]
-        cache.delete_many(keys)
+        """清除员工相关的所有缓存（全部月份）"""
+        invalidation_bus.bump(f'attendance:{employee_id}')
 
     @staticmethod
     def warm_cache():
@@ -189,12 +172,9 @@ class DepartmentService:
     """部门相关业务逻辑"""
 
     @staticmethod
+    @cached(CacheKeys.DEPARTMENT_TREE, CacheKeys.TIMEOUT_MEDIUM, l1_ttl=5)
     def get_department_tree() -> List[Dict]:
         """获取部门树形结构（带缓存）"""
-        cached = cache.get(CacheKeys.DEPARTMENT_TREE)
-        if cached:
-            return cached
-
         # 一次性加载所有部门，避免递归查询
         departments = Department.objects.select_related('manager', 'parent').prefetch_related('supervisors').all()
 
@@ -221,35 +201,30 @@ class DepartmentService:
             else:
                 tree.append(node)
 
-        cache.set(CacheKeys.DEPARTMENT_TREE, tree, CacheKeys.TIMEOUT_MEDIUM)
         return tree
 
     @staticmethod
     def get_all_child_ids(department_id: int) -> List[int]:
-        """获取部门及所有子部门的ID列表（一次性加载，避免递归查询）"""
-        # 一次查询加载所有部门的 id -> parent_id 关系
-        all_depts = dict(Department.objects.values_list('id', 'parent_id'))
-
-        # 构建 parent -> children 映射
-        children_map: Dict[int, List[int]] = {}
-        for dept_id, parent_id in all_depts.items():
-            if parent_id is not None:
-                children_map.setdefault(parent_id, []).append(dept_id)
-
-        # BFS 收集所有子部门
-        result = [department_id]
-        queue = [department_id]
-        while queue:
-            current = queue.pop(0)
-            for child_id in children_map.get(current, []):
-                result.append(child_id)
-                queue.append(child_id)
-        return result
+        """获取部门及所有子部门的ID列表（闭包表单次索引查询）"""
+        return list(
+            DepartmentClosure.subtree_ids(department_id).values_list('descendant_id', flat=True)
+        )
+
+    @staticmethod
+    @cached(CacheKeys.DEPARTMENT_PATHS, CacheKeys.TIMEOUT_LONG, l1_ttl=5)
+    def get_path_map() -> Dict[int, str]:
+        """所有部门的完整路径 {部门ID: '总公司 > 技术部 > 前端组'}（闭包表单次查询，带缓存）"""
+        names: Dict[int, List[str]] = {}
+        for dept_id, name in DepartmentClosure.objects.order_by('descendant_id', '-depth').values_list(
+            'descendant_id', 'ancestor__name'
+        ):
+            names.setdefault(dept_id, []).append(name)
+        return {dept_id: ' > '.join(parts) for dept_id, parts in names.items()}
 
     @staticmethod
     def invalidate_cache():
         """清除部门相关缓存"""
-        cache.delete_many([CacheKeys.DEPARTMENT_TREE, CacheKeys.DEPARTMENT_LIST])
+        invalidation_bus.bump('org')
 
 
 # ============ 员工服务 ============
@@ -275,26 +250,21 @@ class EmployeeService:
     def get_department_employees(department_id: int, include_children: bool = False) -> List[Employee]:
         """获取部门员工列表"""
         if include_children:
-            dept_ids = DepartmentService.get_all_child_ids(department_id)
+            # 子查询直接下推到数据库，部门层级再深也只有一次查询
+            dept_ids = DepartmentClosure.subtree_ids(department_id)
             return EmployeeService.get_optimized_queryset().filter(department_id__in=dept_ids, is_active=True)
         return EmployeeService.get_optimized_queryset().filter(department_id=department_id, is_active=True)
 
     @staticmethod
+    @cached(CacheKeys.EMPLOYEE_COUNT, CacheKeys.TIMEOUT_MEDIUM)
     def get_summary_stats() -> Dict[str, int]:
         """获取员工统计摘要（带缓存）"""
-        cached = cache.get(CacheKeys.EMPLOYEE_COUNT)
-        if cached:
-            return cached
-
-        stats = Employee.objects.aggregate(
+        return Employee.objects.aggregate(
             total=Count('id'),
             active=Count('id', filter=Q(is_active=True)),
             inactive=Count('id', filter=Q(is_active=False))
         )
 
-        cache.set(CacheKeys.EMPLOYEE_COUNT, stats, CacheKeys.TIMEOUT_MEDIUM)
-        return stats
-
 
 # ============ 考勤服务 ============
 class AttendanceService:
@@ -308,24 +278,16 @@ class AttendanceService:
         )
 
     @staticmethod
+    @cached(CacheKeys.ATTENDANCE_TODAY, CacheKeys.TIMEOUT_SHORT)
     def get_today_record(employee_id: int) -> Optional[Attendance]:
-        """获取员工今日考勤记录"""
-        cache_key = CacheKeys.ATTENDANCE_TODAY.format(employee_id=employee_id)
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-
+        """获取员工今日考勤记录（无记录也缓存，签到写入后由信号递增 attendance:{employee_id}）"""
         today = timezone.localdate()
-        record = Attendance.objects.filter(employee_id=employee_id, date=today).first()
-
-        if record:
-            cache.set(cache_key, record, CacheKeys.TIMEOUT_SHORT)
-        return record
+        return Attendance.objects.filter(employee_id=employee_id, date=today).first()
 
     @staticmethod
     def invalidate_today_cache(employee_id: int):
         """清除员工今日考勤缓存"""
-        cache.delete(CacheKeys.ATTENDANCE_TODAY.format(employee_id=employee_id))
+        invalidation_bus.bump(f'attendance:{employee_id}')
 
     @staticmethod
     def get_attendance_stats(employee_id: int, year: int, month: int) -> Dict[str, int]:
@@ -372,70 +334,24 @@ class PermissionService:
 
     @staticmethod
     def get_user_permissions(user: User) -> List[str]:
-        """获取用户所有权限（带缓存）"""
+        """获取用户所有权限（个人角色 + 职位角色，复用 permission_cache 的编译结果）"""
         if not user or not user.is_authenticated:
             return []
 
-        cache_key = CacheKeys.USER_PERMISSIONS.format(user_id=user.id)
-        cached = cache.get(cache_key)
-        if cached is not None:
-            return cached
-
         # 仅超级管理员拥有所有权限
         if user.is_superuser:
             from .rbac import Permissions
-            permissions = [getattr(Permissions, attr) for attr in dir(Permissions)
-                         if not attr.startswith('_') and isinstance(getattr(Permissions, attr), str)]
-            cache.set(cache_key, permissions, CacheKeys.TIMEOUT_MEDIUM)
-            return permissions
-
-        # 获取用户角色的所有权限
-        permissions = list(Role.objects.filter(users=user).values_list(
-            'permissions__key', flat=True
-        ).distinct())
-        permissions = [p for p in permissions if p]  # 过滤 None
+            return [getattr(Permissions, attr) for attr in dir(Permissions)
+                    if not attr.startswith('_') and isinstance(getattr(Permissions, attr), str)]
 
-        cache.set(cache_key, permissions, CacheKeys.TIMEOUT_MEDIUM)
-        return permissions
+        return list(cached_user_permissions(user))
 
     @staticmethod
     def user_has_any_permission(user: User, permission_keys: List[str]) -> bool:
         """检查用户是否拥有任一权限"""
-        user_perms = PermissionService.get_user_permissions(user)
-        return any(p in user_perms for p in permission_keys)
+        return has_any_permission_cached(user, permission_keys)
 
     @staticmethod
     def invalidate_user_cache(user_id: int):
         """清除用户权限缓存"""
-        cache.delete(CacheKeys.USER_PERMISSIONS.format(user_id=user_id))
-
-
-# ============ 仪表盘服务 ============
-class DashboardService:
-    """仪表盘相关业务逻辑"""
-
-    @staticmethod
-    def get_summary(user: User) -> Dict[str, Any]:
-        """获取系统概览数据（带缓存）"""
-        cached = cache.get(CacheKeys.DASHBOARD_SUMMARY)
-        if cached:
-            return cached
-
-        today = timezone.localdate()
-
-        summary = {
-            'employee_count': Employee.objects.filter(is_active=True).count(),
-            'department_count': Department.objects.count(),
-            'today_attendance': Attendance.objects.filter(date=today).count(),
-            'pending_leaves': LeaveRequest.objects.filter(status='pending').count(),
-            'pending_supplements': AttendanceSupplement.objects.filter(status='pending').count(),
-            'pending_trips': BusinessTrip.objects.filter(status='pending').count(),
-        }
-
-        cache.set(CacheKeys.DASHBOARD_SUMMARY, summary, CacheKeys.TIMEOUT_SHORT)
-        return summary
-
-    @staticmethod
-    def invalidate_cache():
-        """清除仪表盘缓存"""
-        cache.delete(CacheKeys.DASHBOARD_SUMMARY)
+        PermissionCache.invalidate_user(user_id)
@@ -3,63 +3,181 @@ Django 信号处理器 - 自动清除缓存和触发相关操作
 
 当数据发生变化时，自动清除相关缓存，保证数据一致性
 """
-from django.db.models.signals import post_save, post_delete, m2m_changed
+import threading
+
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.core.cache import cache
+from django.db import connection, transaction
 
 from .models import (
-    Department, Employee, Position, Attendance, AttendanceSupplement,
-    LeaveRequest, SalaryRecord, Role, RBACPermission, CheckInLocation
+    Department, DepartmentClosure, Employee, EmploymentEvent, HeadcountSnapshot, Position, Attendance, AttendanceDailyStat, AttendanceSupplement,
+    LeaveRequest, SalaryRecord, PayrollMonthlyStat, CheckInLocation, HolidayCalendar
 )
 from .services import CacheKeys
+from .geofence import geofence_index
+from .invalidation import invalidation_bus
+
 
+# 看板/报表快照：失效时只标记为脏，读取方先返回旧快照并后台重算（见 snapshot_cache）
+# 所有失效都经 invalidation_bus 登记：同一请求/任务内去重，事务提交后一次性下发
+ANALYTICS_SNAPSHOT_KEYS = (
+    CacheKeys.DASHBOARD_SUMMARY,
+    CacheKeys.REPORT_OVERVIEW,
+    CacheKeys.REPORT_SNAPSHOT,
+)
 
-def invalidate_analytics_caches(extra_keys=None):
-    keys = [
-        CacheKeys.DASHBOARD_SUMMARY,
-        CacheKeys.REPORT_OVERVIEW,
-        CacheKeys.REPORT_SNAPSHOT,
-    ]
+
+def invalidate_analytics_caches(extra_keys=None, namespaces=None):
+    """快照标记为脏；extra_keys 为需删除的缓存键，namespaces 为需递增代数的命名空间（见 CacheKeys.NAMESPACES）"""
+    invalidation_bus.mark_dirty(*ANALYTICS_SNAPSHOT_KEYS)
     if extra_keys:
-        keys.extend(extra_keys)
-    cache.delete_many(list(dict.fromkeys(keys)))
+        invalidation_bus.delete(*extra_keys)
+    if namespaces:
+        invalidation_bus.bump(*namespaces)
 
 
 # ============ 部门相关信号 ============
+@receiver(post_save, sender=Department)
+def sync_department_closure(sender, instance, created, raw=False, **kwargs):
+    """部门新建或上级变更时维护闭包表"""
+    if raw:
+        return
+    if created or DepartmentClosure.parent_id_of(instance.pk) != instance.parent_id:
+        DepartmentClosure.attach(instance)
+
+
+@receiver(pre_delete, sender=Department)
+def remember_department_children(sender, instance, **kwargs):
+    """删除前记录直接子部门（删除后 parent 会被置空）"""
+    instance._closure_child_ids = list(instance.children.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Department)
+def detach_orphan_subtrees(sender, instance, **kwargs):
+    """部门删除后，其子部门成为根节点，断开与原祖先的关系"""
+    for child_id in getattr(instance, '_closure_child_ids', []):
+        DepartmentClosure.detach(child_id)
+
+
 @receiver([post_save, post_delete], sender=Department)
 def invalidate_department_cache(sender, instance, **kwargs):
     """部门变更时清除缓存"""
-    invalidate_analytics_caches([
-        CacheKeys.DEPARTMENT_TREE,
-        CacheKeys.DEPARTMENT_LIST,
-    ])
+    invalidate_analytics_caches(namespaces=['org'])
 
 
 # ============ 员工相关信号 ============
 @receiver([post_save, post_delete], sender=Employee)
 def invalidate_employee_cache(sender, instance, **kwargs):
     """员工变更时清除缓存"""
-    cache.delete_many([
-        CacheKeys.EMPLOYEE_COUNT,
-    ])
-    invalidate_analytics_caches()
-    # 清除该员工的考勤缓存
-    cache.delete(CacheKeys.ATTENDANCE_TODAY.format(employee_id=instance.id))
+    # 同时清除该员工的考勤缓存与签到热缓存
+    invalidate_analytics_caches(
+        [CacheKeys.CHECKIN_EMPLOYEE.format(user_id=instance.user_id)],
+        namespaces=['employees', f'user:{instance.user_id}', f'attendance:{instance.id}'],
+    )
+
+
+@receiver(post_save, sender=Employee)
+def record_employment_event(sender, instance, created, raw=False, **kwargs):
+    """在职状态或部门变化时写入任职事件（入职/复职/离职/调岗）"""
+    if raw:
+        return
+    old_key = getattr(instance, '_employment_key', None)
+    if not created and old_key is None:
+        return
+    instance._employment_key = tuple(getattr(instance, field) for field in Employee.EMPLOYMENT_FIELDS)
+    was_employed = bool(old_key) and old_key[0] and old_key[1] == 'onboarded'
+    if instance.is_employed and not was_employed:
+        if not EmploymentEvent.record(instance, EmploymentEvent.TYPE_HIRE, instance.hire_date):
+            EmploymentEvent.record(instance, EmploymentEvent.TYPE_REACTIVATE)
+    elif was_employed and not instance.is_employed:
+        EmploymentEvent.record(instance, EmploymentEvent.TYPE_RESIGN)
+    elif was_employed and old_key[2] != instance.department_id:
+        EmploymentEvent.record(instance, EmploymentEvent.TYPE_TRANSFER, from_department_id=old_key[2] or 0)
+
+
+@receiver(post_delete, sender=EmploymentEvent)
+def rebuild_headcount_after_event_delete(sender, instance, **kwargs):
+    """删除员工（级联删除任职事件）后重算人数快照"""
+    since = (instance.event_date.year, instance.event_date.month)
+    transaction.on_commit(lambda: HeadcountSnapshot.rebuild(since))
 
 
 @receiver(m2m_changed, sender=Employee.checkin_locations.through)
 def employee_locations_changed(sender, instance, action, **kwargs):
     """员工考勤地点变更"""
     if action in ('post_add', 'post_remove', 'post_clear'):
-        cache.delete(CacheKeys.ATTENDANCE_TODAY.format(employee_id=instance.id))
+        invalidation_bus.bump(f'attendance:{instance.id}')
+        transaction.on_commit(geofence_index.invalidate)
 
 
 # ============ 考勤相关信号 ============
 @receiver([post_save, post_delete], sender=Attendance)
 def invalidate_attendance_cache(sender, instance, **kwargs):
     """考勤变更时清除缓存"""
-    cache.delete(CacheKeys.ATTENDANCE_TODAY.format(employee_id=instance.employee_id))
-    invalidate_analytics_caches()
+    invalidate_analytics_caches(namespaces=[f'attendance:{instance.employee_id}'])
+
+
+def _department_of(instance):
+    if type(instance).employee.is_cached(instance):
+        return instance.employee.department_id
+    return Employee.objects.filter(pk=instance.employee_id).values_list('department_id', flat=True).first()
+
+
+# 汇总表的重算函数：kind -> rebuild(keys)
+_STAT_REBUILDERS = {
+    'attendance': lambda dates: AttendanceDailyStat.rebuild(dates=dates),
+    'payroll': PayrollMonthlyStat.rebuild,
+}
+_stat_rebuilds = threading.local()
+
+
+def _rebuild_stats_on_commit(kind, *keys):
+    """
+    编辑/删除后按当前部门重算受影响的日期（考勤）或月份（薪资）
+
+    新增记录按当前部门 +1；编辑、删除时员工可能已调部门，原记录计在写入时的部门，
+    按当前部门 -1 会记错格子，因此改为重算。同一事务内（如删除员工级联删除考勤）合并，提交后每类只重算一次。
+    """
+    if not connection.in_atomic_block:
+        _STAT_REBUILDERS[kind](sorted(set(keys)))
+        return
+    bound = getattr(_stat_rebuilds, 'bound', None)
+    # 事务回滚时 Django 会清空 run_on_commit，回调不在其中即说明已是新事务
+    if bound is None or not any(entry[1] is bound[0] for entry in connection.run_on_commit):
+        pending = {}
+
+        def callback():
+            if getattr(_stat_rebuilds, 'bound', (None,))[0] is callback:
+                _stat_rebuilds.bound = None
+            for name, pending_keys in pending.items():
+                _STAT_REBUILDERS[name](sorted(pending_keys))
+
+        transaction.on_commit(callback)
+        bound = _stat_rebuilds.bound = (callback, pending)
+    bound[1].setdefault(kind, set()).update(keys)
+
+
+@receiver(post_save, sender=Attendance)
+def update_attendance_daily_stat(sender, instance, created, raw=False, **kwargs):
+    """考勤新增时增量维护考勤日汇总，日期/类型变化时重算涉及的日期"""
+    if raw:
+        return
+    new_key = (instance.date, instance.employee_id, instance.attendance_type)
+    old_key = getattr(instance, '_stat_key', None)
+    if created:
+        AttendanceDailyStat.bump(instance.date, _department_of(instance), instance.attendance_type, 1)
+    elif old_key is None or old_key == new_key:
+        # 未从数据库读出的实例无法得知原值，交给定时重算
+        return
+    else:
+        _rebuild_stats_on_commit('attendance', old_key[0], instance.date)
+    instance._stat_key = new_key
+
+
+@receiver(post_delete, sender=Attendance)
+def remove_attendance_daily_stat(sender, instance, **kwargs):
+    key = getattr(instance, '_stat_key', None)
+    _rebuild_stats_on_commit('attendance', key[0] if key else instance.date)
 
 
 @receiver([post_save, post_delete], sender=AttendanceSupplement)
@@ -78,8 +196,7 @@ def invalidate_leave_cache(sender, instance, **kwargs):
 @receiver([post_save, post_delete], sender=Position)
 def invalidate_position_cache(sender, instance, **kwargs):
     """职位变更时清除相关缓存"""
-    cache.delete(CacheKeys.POSITION_LIST)
-    invalidate_analytics_caches()
+    invalidate_analytics_caches(namespaces=['org'])
 
 
 @receiver([post_save, post_delete], sender=SalaryRecord)
@@ -88,40 +205,50 @@ def invalidate_salary_cache(sender, instance, **kwargs):
     invalidate_analytics_caches()
 
 
+@receiver(post_save, sender=SalaryRecord)
+def update_payroll_monthly_stat(sender, instance, created, raw=False, **kwargs):
+    """薪资新增时增量维护薪资月度汇总，月份/金额/发放状态变化时重算涉及的月份"""
+    if raw:
+        return
+    new_key = (instance.year, instance.month, instance.employee_id, instance.net_salary, instance.paid)
+    old_key = getattr(instance, '_stat_key', None)
+    if created:
+        PayrollMonthlyStat.bump(
+            instance.year, instance.month, _department_of(instance),
+            record_count=1, total_net=instance.net_salary,
+            paid_count=1 if instance.paid else 0, paid_net=instance.net_salary if instance.paid else 0,
+        )
+    elif old_key is None or old_key == new_key:
+        return
+    else:
+        _rebuild_stats_on_commit('payroll', old_key[:2], (instance.year, instance.month))
+    instance._stat_key = new_key
+
+
+@receiver(post_delete, sender=SalaryRecord)
+def remove_payroll_monthly_stat(sender, instance, **kwargs):
+    key = getattr(instance, '_stat_key', None)
+    _rebuild_stats_on_commit('payroll', key[:2] if key else (instance.year, instance.month))
+
+
 # ============ 权限相关信号 ============
-@receiver([post_save, post_delete], sender=Role)
-def invalidate_role_cache(sender, instance, **kwargs):
-    """角色变更时清除相关用户的权限缓存"""
-    for user in instance.users.all():
-        cache.delete(CacheKeys.USER_PERMISSIONS.format(user_id=user.id))
-
-
-@receiver(m2m_changed, sender=Role.users.through)
-def role_users_changed(sender, instance, action, pk_set, **kwargs):
-    """角色-用户关系变更时清除权限缓存"""
-    if action in ('post_add', 'post_remove'):
-        # 添加/移除操作，直接通过 pk_set 清除
-        if pk_set:
-            for user_id in pk_set:
-                cache.delete(CacheKeys.USER_PERMISSIONS.format(user_id=user_id))
-    elif action == 'pre_clear':
-        # clear 操作前提前获取用户列表（post_clear 时关系已清空，查不到）
-        for user in instance.users.all():
-            cache.delete(CacheKeys.USER_PERMISSIONS.format(user_id=user.id))
-
-
-@receiver(m2m_changed, sender=Role.permissions.through)
-def role_permissions_changed(sender, instance, action, **kwargs):
-    """角色-权限关系变更时清除所有用户的权限缓存"""
-    if action in ('post_add', 'post_remove', 'post_clear'):
-        for user in instance.users.all():
-            cache.delete(CacheKeys.USER_PERMISSIONS.format(user_id=user.id))
+# 权限缓存的失效由 permission_cache.setup_permission_cache_signals() 统一注册（版本号 + 反向索引）
+
+
+# ============ 节假日日历信号 ============
+@receiver([post_save, post_delete], sender=HolidayCalendar)
+def invalidate_holiday_calendar(sender, instance, **kwargs):
+    """节假日日历被单条修改（如后台维护）时通知各进程重新载入"""
+    from .holidays import holiday_calendar
+    holiday_calendar.invalidate()
 
 
 # ============ 位置相关信号 ============
 @receiver([post_save, post_delete], sender=CheckInLocation)
 def invalidate_location_cache(sender, instance, **kwargs):
-    """签到地点变更时清除相关缓存"""
+    """签到地点变更时清除相关缓存并重建地理围栏索引"""
+    transaction.on_commit(geofence_index.invalidate)
     # 清除所有关联员工的考勤缓存
-    for emp in instance.employees.all():
-        cache.delete(CacheKeys.ATTENDANCE_TODAY.format(employee_id=emp.id))
+    invalidation_bus.bump(*(
+        f'attendance:{emp_id}' for emp_id in instance.employees.values_list('id', flat=True)
+    ))
@@ -0,0 +1,108 @@
+"""
+看板/报表快照缓存 - stale-while-revalidate + single-flight
+
+    data = snapshot_cache.get_or_build(CacheKeys.REPORT_SNAPSHOT, build_report_snapshot_data)
+
+缓存条目为 (构建开始时间, 数据)，条目本身按 hard TTL 过期：
+- 新鲜（未超过 soft TTL，且构建后未被标记为脏）：直接返回
+- 陈旧（超过 soft TTL 或已被 mark_dirty）：立即返回旧数据，同时提交一个后台重算；
+  重算前用 cache.add 抢锁，所有进程同一时刻只有一个重算在跑
+- 缺失（冷启动、超过 hard TTL 或格式不符的旧条目）：抢到锁的请求同步构建，其余请求短暂等待其结果，超时后自行构建
+
+失效不删除条目，只写入"脏"时间戳：签到高峰期大量写入只会让看板读到最近一次快照，
+数据库只承受后台的单路重算。
+"""
+import logging
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+SOFT_TTL = getattr(settings, 'SNAPSHOT_CACHE_SOFT_TTL', 60)
+HARD_TTL = getattr(settings, 'SNAPSHOT_CACHE_HARD_TTL', 1800)
+LOCK_TTL = getattr(settings, 'SNAPSHOT_CACHE_LOCK_TTL', 120)  # 重算锁最长持有时间，防止进程崩溃后死锁
+WAIT_SECONDS = 5  # 冷启动时等待其他请求构建的最长时间
+_POLL_INTERVAL = 0.05
+
+
+def _dirty_key(key: str) -> str:
+    return f'{key}:dirty'
+
+
+def _lock_key(key: str) -> str:
+    return f'{key}:lock'
+
+
+def _entry(value) -> Optional[Tuple[float, Any]]:
+    """校验缓存条目格式；旧版本写入的裸数据等视为未命中"""
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], (int, float)):
+        return value
+    return None
+
+
+def mark_dirty(*keys: str) -> None:
+    """标记快照需要重算：下一次读取返回旧数据并触发后台重算"""
+    if keys:
+        now = time.time()
+        cache.set_many({_dirty_key(key): now for key in keys}, HARD_TTL)
+
+
+def _build(key: str, builder: Callable[[], Any], hard_ttl: int) -> Any:
+    # 记录构建开始时间：构建期间发生的写入会晚于它，下次读取仍判为脏
+    started = time.time()
+    data = builder()
+    cache.set(key, (started, data), hard_ttl)
+    return data
+
+
+def _build_locked(key: str, builder: Callable[[], Any], hard_ttl: int) -> Any:
+    try:
+        return _build(key, builder, hard_ttl)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _refresh_in_background(key: str, builder: Callable[[], Any], hard_ttl: int) -> None:
+    if not cache.add(_lock_key(key), 1, LOCK_TTL):
+        return  # 已有重算在进行
+    from django.db import connection
+    from .tasks import get_executor
+
+    def job():
+        try:
+            _build_locked(key, builder, hard_ttl)
+        except Exception:
+            logger.exception('Snapshot refresh failed: %s', key)
+        finally:
+            connection.close()
+
+    try:
+        get_executor().submit(job)
+    except RuntimeError:
+        # 线程池已关闭（进程退出中）：继续提供旧数据
+        cache.delete(_lock_key(key))
+
+
+def get_or_build(key: str, builder: Callable[[], Any], soft_ttl: int = SOFT_TTL, hard_ttl: int = HARD_TTL) -> Any:
+    values = cache.get_many([key, _dirty_key(key)])
+    entry = _entry(values.get(key))
+    if entry is not None:
+        built_at, data = entry
+        if time.time() - built_at >= soft_ttl or values.get(_dirty_key(key), 0) > built_at:
+            _refresh_in_background(key, builder, hard_ttl)
+        return data
+
+    if cache.add(_lock_key(key), 1, LOCK_TTL):
+        return _build_locked(key, builder, hard_ttl)
+
+    # 其他请求正在构建：等待其结果，避免并发请求同时压到数据库
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(_POLL_INTERVAL)
+        entry = _entry(cache.get(key))
+        if entry is not None:
+            return entry[1]
+    return _build(key, builder, hard_ttl)
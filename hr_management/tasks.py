@@ -39,6 +39,10 @@ def get_executor() -> ThreadPoolExecutor:
 def shutdown_executor():
     """关闭线程池（应用关闭时调用）"""
     global _executor
+    from .audit_log import audit_writer
+    from .export_jobs import shutdown_job_executor
+    audit_writer.flush()
+    shutdown_job_executor()
     if _executor:
         _executor.shutdown(wait=True)
         _executor = None
@@ -101,10 +105,12 @@ def async_task(func: Callable) -> Callable:
         task_id = f"{func.__name__}_{int(time.time() * 1000)}"
 
         def task_wrapper():
-            # 确保数据库连接在任务完成后关闭
+            # 确保数据库连接在任务完成后关闭；任务内的缓存失效合并到任务结束时下发
+            from .invalidation import invalidation_bus
             try:
                 logger.info(f"Task {task_id} started")
-                result = func(*args, **kwargs)
+                with invalidation_bus.batch():
+                    result = func(*args, **kwargs)
                 logger.info(f"Task {task_id} completed successfully")
                 return result
             except Exception as e:
@@ -177,26 +183,17 @@ def send_email_async(
         raise
 
 
-@async_task
 def log_user_action(
     user_id: int,
     action: str,
     detail: str = None,
     ip_address: str = None
 ):
-    """异步记录用户操作日志"""
-    from .models import SystemLog
-    from django.contrib.auth.models import User
+    """记录用户操作日志（由 audit_log.audit_writer 后台批量写入）"""
+    from .audit_log import audit_writer
 
     try:
-        user = User.objects.get(id=user_id) if user_id else None
-        SystemLog.objects.create(
-            user=user,
-            action=action,
-            detail=detail or '',
-            ip_address=ip_address or '',
-            level='INFO'
-        )
+        audit_writer.submit(action, user_id=user_id, detail=detail or '', ip=ip_address)
     except Exception as e:
         logger.error(f"Failed to log user action: {e}")
 
@@ -208,33 +205,31 @@ def generate_report_async(
     user_id: int
 ):
     """
-    异步生成报表
+    异步生成报表，结果保存为导出任务的 JSON 产物（可通过 export/jobs/<id>/download/ 下载）
 
     Args:
-        report_type: 报表类型
+        report_type: 报表类型（见 export_jobs.REPORTS）
         params: 报表参数
         user_id: 请求用户ID
+
+    Returns:
+        导出任务ID；缓存窗口内相同规格的报表直接复用，超过并发上限时返回 None
     """
-    from .query_utils import ReportQueries
+    from django.contrib.auth import get_user_model
+    from . import export_jobs
 
     logger.info(f"Generating report: {report_type} for user {user_id}")
 
-    report_generators = {
-        'attendance': ReportQueries.get_attendance_summary,
-        'salary': ReportQueries.get_salary_statistics,
-        'department': ReportQueries.get_department_statistics,
-    }
-
-    generator = report_generators.get(report_type)
-    if not generator:
-        raise ValueError(f"Unknown report type: {report_type}")
-
-    # 生成报表数据
-    data = generator(**params)
-
-    # 这里可以保存到文件或发送通知
-    logger.info(f"Report {report_type} generated successfully")
-    return data
+    spec = export_jobs.normalize_spec('report', report_type, params, None)
+    user = get_user_model().objects.get(pk=user_id)
+    job, reused = export_jobs.submit_job(user, spec, run=False)
+    if job is None:
+        logger.warning(f"Report {report_type} rejected: too many running jobs for user {user_id}")
+        return None
+    if not reused:
+        export_jobs.run_job(job.pk)
+    logger.info(f"Report {report_type} generated successfully (job {job.pk})")
+    return str(job.pk)
 
 
 @async_task
@@ -250,6 +245,39 @@ def cleanup_old_logs(days: int = 90):
     return count
 
 
+@async_task
+def cleanup_export_jobs():
+    """清理过期的导出任务及产物"""
+    from .export_jobs import cleanup_expired
+    return cleanup_expired()
+
+
+@async_task
+def rebuild_attendance_stats(days: int = 7):
+    """重算最近 N 天的考勤日汇总，纠正信号增量维护可能产生的偏差"""
+    from .models import AttendanceDailyStat
+    end = timezone.localdate()
+    return AttendanceDailyStat.rebuild(end - timedelta(days=days - 1), end)
+
+
+@async_task
+def rebuild_payroll_stats(months: int = 3):
+    """重算最近 N 个月（含本月）的薪资月度汇总，纠正信号增量维护可能产生的偏差"""
+    from .models import PayrollMonthlyStat
+    today = timezone.localdate()
+    index = today.year * 12 + today.month - 1
+    return PayrollMonthlyStat.rebuild([((index - i) // 12, (index - i) % 12 + 1) for i in range(months)])
+
+
+@async_task
+def rebuild_headcount_snapshots():
+    """重算上月与本月的人数快照（跨月、以及离职日期在未来的事件到期后生效）"""
+    from .models import HeadcountSnapshot
+    today = timezone.localdate()
+    last_month = today.replace(day=1) - timedelta(days=1)
+    return HeadcountSnapshot.rebuild((last_month.year, last_month.month))
+
+
 @async_task
 def backup_database_async():
     """异步数据库备份"""
@@ -285,6 +313,9 @@ def sync_employee_data(employee_id: int):
         logger.warning(f"Employee {employee_id} not found")
 
 
+ABSENT_BATCH_SIZE = 1000
+
+
 @async_task
 def mark_absent_for_date(target_date=None):
     """为未签到的员工生成缺勤记录
@@ -295,10 +326,9 @@ def mark_absent_for_date(target_date=None):
     - 节假日/周末跳过
     - 已请假/出差的员工跳过
     """
-    from django.db.models import Q
-    from .models import Attendance, Employee, LeaveRequest, BusinessTrip
+    from django.db.models import Exists, OuterRef, Q
+    from .models import Attendance, AttendanceDailyStat, Employee, LeaveRequest, BusinessTrip
     from .utils import is_workday, get_attendance_cutoff_times, AUTO_ABSENT_NOTE
-    import datetime
 
     today = timezone.localdate()
     now_time = timezone.localtime().time()
@@ -326,6 +356,8 @@ def mark_absent_for_date(target_date=None):
             return {'date': str(target_date), 'created': 0, 'skipped': 0, 'reason': 'before_cutoff'}
     # 过去日期直接处理
 
+    started = time.perf_counter()
+
     # 仅处理已入职且在职的员工（排除待入职员工）
     active_employees = Employee.objects.filter(
         is_active=True,
@@ -334,38 +366,54 @@ def mark_absent_for_date(target_date=None):
         Q(hire_date__lte=target_date) | Q(hire_date__isnull=True)
     )
 
-    existing_ids = set(
-        Attendance.objects.filter(date=target_date).values_list('employee_id', flat=True)
-    )
-    leave_ids = set(
-        LeaveRequest.objects.filter(
-            status='approved', start_date__lte=target_date, end_date__gte=target_date
-        ).values_list('employee_id', flat=True)
-    )
-    trip_ids = set(
-        BusinessTrip.objects.filter(
-            status='approved', start_date__lte=target_date, end_date__gte=target_date
-        ).values_list('employee_id', flat=True)
+    # 反连接：一条查询取出当天无考勤记录、且不在已批准请假/出差期间的员工
+    covering = {'status': 'approved', 'start_date__lte': target_date, 'end_date__gte': target_date}
+    has_attendance = Exists(Attendance.objects.filter(employee_id=OuterRef('pk'), date=target_date))
+    on_leave = Exists(LeaveRequest.objects.filter(employee_id=OuterRef('pk'), **covering))
+    on_trip = Exists(BusinessTrip.objects.filter(employee_id=OuterRef('pk'), **covering))
+    missing_ids = list(
+        active_employees.filter(~has_attendance, ~on_leave, ~on_trip).order_by().values_list('id', flat=True)
     )
-
-    skip_ids = existing_ids | leave_ids | trip_ids
-    to_create = active_employees.exclude(id__in=skip_ids)
+    # skipped：当天已有考勤记录或处于已批准请假/出差期间的员工数
+    skipped = Employee.objects.filter(has_attendance | on_leave | on_trip).count()
+    query_ms = (time.perf_counter() - started) * 1000
 
     created = 0
-    for emp in to_create:
-        _, created_flag = Attendance.objects.get_or_create(
-            employee=emp,
-            date=target_date,
-            defaults={
-                'attendance_type': 'absent',
-                'notes': AUTO_ABSENT_NOTE if target_date == today else '全天未签到，自动标记缺勤',
-            }
-        )
-        if created_flag:
-            created += 1
-
-    logger.info("Marked %s employees absent for %s", created, target_date)
-    return {'date': str(target_date), 'created': created, 'skipped': len(skip_ids)}
+    if missing_ids:
+        notes = AUTO_ABSENT_NOTE if target_date == today else '全天未签到，自动标记缺勤'
+        # ignore_conflicts：与并发签到撞上 (employee, date) 唯一约束时以已有记录为准；
+        # 不返回实际插入行数，按本批员工中由本任务写入的缺勤记录计数（并发签到写入的记录不计）
+        for i in range(0, len(missing_ids), ABSENT_BATCH_SIZE):
+            chunk = missing_ids[i:i + ABSENT_BATCH_SIZE]
+            Attendance.objects.bulk_create(
+                [
+                    Attendance(employee_id=emp_id, date=target_date, attendance_type='absent', notes=notes)
+                    for emp_id in chunk
+                ],
+                ignore_conflicts=True,
+            )
+            created += Attendance.objects.filter(
+                employee_id__in=chunk, date=target_date, attendance_type='absent', notes=notes,
+            ).count()
+
+        # bulk_create 不触发 post_save，这里统一重算当天考勤日汇总并清理考勤相关缓存
+        AttendanceDailyStat.rebuild(target_date, target_date)
+        from .signals import invalidate_analytics_caches
+        invalidate_analytics_caches(namespaces=[f'attendance:{emp_id}' for emp_id in missing_ids])
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        "Marked %s employees absent for %s (%s candidates, %.1f ms)",
+        created, target_date, len(missing_ids), elapsed_ms,
+    )
+    return {
+        'date': str(target_date),
+        'created': created,
+        'candidates': len(missing_ids),
+        'skipped': skipped,
+        'query_ms': round(query_ms, 2),
+        'elapsed_ms': round(elapsed_ms, 2),
+    }
 
 
 @async_task
@@ -384,7 +432,7 @@ def auto_disburse_salary(year: int = None, month: int = None):
 
     默认发放上个月的薪资（每月5号执行）
     """
-    from .models import SalaryRecord, SystemLog
+    from .models import PayrollMonthlyStat, SalaryRecord, SystemLog
     from .notifications import notify_salary_issued
     from django.contrib.auth import get_user_model
 
@@ -413,8 +461,9 @@ def auto_disburse_salary(year: int = None, month: int = None):
     # 获取发放记录的ID列表（在update前获取）
     record_ids = list(records.values_list('id', flat=True))
 
-    # 批量更新为已发放
+    # 批量更新为已发放（update 不触发信号，重算当月薪资汇总）
     records.update(paid=True, paid_at=now)
+    PayrollMonthlyStat.rebuild([(year, month)])
 
     # 发送通知给每位员工
     notified = 0
@@ -621,6 +670,8 @@ class SimpleScheduler:
 
     def _run_loop(self):
         """调度循环"""
+        from .invalidation import invalidation_bus
+
         # 首次启动延迟 60 秒，避免应用启动时立即执行所有任务
         start_time = time.time()
         for task in self._tasks.values():
@@ -633,7 +684,7 @@ class SimpleScheduler:
                 if current_time - task['last_run'] >= task['interval']:
                     try:
                         logger.debug(f"Running scheduled task: {name}")
-                        get_executor().submit(task['func'])
+                        get_executor().submit(invalidation_bus.batched(task['func']))
                         task['last_run'] = current_time
                     except Exception as e:
                         logger.error(f"Scheduled task {name} failed: {e}")
@@ -656,15 +707,42 @@ def setup_scheduled_tasks():
     # 每10分钟检查当天缺勤（上班后未签到先标记缺勤，后续签到可自动转迟到）
     scheduler.register('mark_absent_today', lambda: mark_absent_today.sync(), 600)
 
+    # 每天重算最近 7 天的考勤日汇总（兜底）
+    scheduler.register('rebuild_attendance_stats', lambda: rebuild_attendance_stats.sync(7), 86400)
+
+    # 每天重算最近 3 个月的薪资月度汇总（兜底）
+    scheduler.register('rebuild_payroll_stats', lambda: rebuild_payroll_stats.sync(3), 86400)
+
+    # 每天重算上月与本月的人数快照
+    scheduler.register('rebuild_headcount_snapshots', lambda: rebuild_headcount_snapshots.sync(), 86400)
+
     # 每小时刷新缓存
     scheduler.register('refresh_cache', _refresh_cache, 3600)
 
+    # 每小时清理过期的导出文件
+    scheduler.register('cleanup_export_jobs', lambda: cleanup_export_jobs.sync(), 3600)
+
     # 每天检查是否为生成薪资条日（每天执行一次，1号时自动生成）
     scheduler.register('auto_generate_salary', check_and_generate_salary, 86400)
 
     # 每天检查是否为发薪日（每天执行一次，5号时自动发薪）
     scheduler.register('auto_disburse_salary', check_and_disburse_salary, 86400)
 
+    # 每周从节假日API同步日历（离线任务，签到等请求只查本地日历）
+    if getattr(settings, 'HOLIDAY_API_ENABLED', True):
+        scheduler.register('sync_holidays', _sync_holidays, 7 * 86400)
+
+
+def _sync_holidays():
+    """从节假日API同步当年与次年日历（可选，HOLIDAY_API_ENABLED 控制）"""
+    from django.utils import timezone
+    from .holidays import sync_from_api
+
+    year = timezone.localdate().year
+    synced = sync_from_api([year, year + 1])
+    if synced:
+        logger.info(f"Holiday calendar synced: {synced}")
+
 
 def _refresh_cache():
     """刷新常用缓存"""
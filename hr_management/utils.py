@@ -3,12 +3,13 @@ from datetime import time as dt_time
 from typing import Optional, Any, Dict, List
 from functools import wraps
 from django.contrib.auth.models import User
-from .models import SystemLog
 
 
-def log_event(action: str, level: str = 'INFO', user: Optional[User] = None, detail: Optional[str] = None, ip: Optional[str] = None):
+def log_event(action: str, level: str = 'INFO', user: Optional[User] = None, detail: Optional[str] = None,
+              ip: Optional[str] = None, sync: bool = False):
     """写系统日志的轻量辅助函数。
 
+    日志交给 audit_log.audit_writer 批量写入；安全相关操作与 WARNING/ERROR 级别同步写入。
     使用 try/except 防御，避免日志写入阻断主业务流程。
     参数:
         action: 操作名称（必填）
@@ -16,11 +17,14 @@ def log_event(action: str, level: str = 'INFO', user: Optional[User] = None, det
         user: 关联用户，可为空
         detail: 详情文本
         ip: 来源 IP
+        sync: 强制同步写入
     """
     if not action:
         return
     try:
-        SystemLog.objects.create(action=action, level=level or 'INFO', user=user, detail=detail or '', ip_address=ip)
+        from .audit_log import audit_writer
+        audit_writer.submit(action, level=level or 'INFO', user_id=getattr(user, 'pk', None),
+                            detail=detail or '', ip=ip, sync=sync)
     except Exception:
         # 静默失败，不影响主流程
         pass
@@ -155,13 +159,13 @@ def strip_auto_absent_note(notes: Optional[str]) -> str:
     return '\n'.join(kept).strip()
 
 
-# ============ 节假日API工具 ============
+# ============ 节假日工具 ============
 
 def is_workday(date) -> bool:
     """
     判断指定日期是否为工作日（需要签到）
 
-    使用 timor.tech 节假日API，支持：
+    基于本地节假日日历（HolidayCalendar，进程内字典查询），支持：
     - 国家法定节假日（不需签到）
     - 调休补班日（需要签到）
     - 普通周末（不需签到）
@@ -172,54 +176,8 @@ def is_workday(date) -> bool:
     返回:
         bool: True=工作日需签到, False=休息日不需签到
     """
-    import requests
-    import logging
-    from django.core.cache import cache
-    from django.conf import settings
-
-    logger = logging.getLogger('hr_management.utils')
-
-    # 检查是否启用节假日API
-    if not getattr(settings, 'HOLIDAY_API_ENABLED', True):
-        # 未启用API，回退到简单周末判断
-        return date.weekday() < 5
-
-    # 缓存key，避免重复调用API
-    cache_key = f'holiday_type_{date.isoformat()}'
-    cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-
-    try:
-        url = f'http://timor.tech/api/holiday/info/{date.isoformat()}'
-        headers = {'User-Agent': 'Mozilla/5.0 HR-System/1.0'}
-        resp = requests.get(url, timeout=5, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if data.get('code') == 0:
-            holiday_type = data.get('type', {}).get('type', 0)
-            # type: 0=工作日, 1=周末, 2=节假日, 3=调休补班
-            is_work = holiday_type in (0, 3)  # 工作日或调休补班需要签到
-
-            # 缓存结果24小时
-            cache.set(cache_key, is_work, 86400)
-
-            type_names = {0: '工作日', 1: '周末', 2: '节假日', 3: '调休补班'}
-            logger.info(f"Holiday API: {date} -> {type_names.get(holiday_type, '未知')} (is_workday={is_work})")
-            return is_work
-        else:
-            logger.warning(f"Holiday API returned error: {data}")
-
-    except requests.RequestException as e:
-        logger.warning(f"Holiday API request failed: {e}")
-    except Exception as e:
-        logger.error(f"Holiday API unexpected error: {e}")
-
-    # API失败时回退到周末判断
-    fallback = date.weekday() < 5
-    cache.set(cache_key, fallback, 3600)  # 失败时缓存1小时后重试
-    return fallback
+    from .holidays import holiday_calendar
+    return holiday_calendar.is_workday(date)
 
 
 def get_holiday_info(date) -> Dict[str, Any]:
@@ -232,55 +190,20 @@ def get_holiday_info(date) -> Dict[str, Any]:
             'type': int,             # 0=工作日, 1=周末, 2=节假日, 3=调休
             'type_name': str,        # 类型中文名
             'holiday_name': str,     # 节假日名称（如"春节"）
-            'from_api': bool         # 是否来自API
+            'from_calendar': bool    # 是否在节假日日历中有记录
         }
     """
-    import requests
-    import logging
-    from django.core.cache import cache
-    from django.conf import settings
-
-    logger = logging.getLogger('hr_management.utils')
-
-    result = {
-        'is_workday': date.weekday() < 5,
-        'type': 0 if date.weekday() < 5 else 1,
-        'type_name': '工作日' if date.weekday() < 5 else '周末',
-        'holiday_name': None,
-        'from_api': False
-    }
+    from .holidays import holiday_calendar
+    return holiday_calendar.get_info(date)
 
-    if not getattr(settings, 'HOLIDAY_API_ENABLED', True):
-        return result
 
-    cache_key = f'holiday_info_{date.isoformat()}'
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-
-    try:
-        url = f'http://timor.tech/api/holiday/info/{date.isoformat()}'
-        headers = {'User-Agent': 'Mozilla/5.0 HR-System/1.0'}
-        resp = requests.get(url, timeout=5, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if data.get('code') == 0:
-            type_data = data.get('type', {})
-            holiday_type = type_data.get('type', 0)
-
-            type_names = {0: '工作日', 1: '周末', 2: '节假日', 3: '调休补班'}
-            result = {
-                'is_workday': holiday_type in (0, 3),
-                'type': holiday_type,
-                'type_name': type_names.get(holiday_type, '未知'),
-                'holiday_name': type_data.get('name'),
-                'from_api': True
-            }
-            cache.set(cache_key, result, 86400)
-
-    except Exception as e:
-        logger.warning(f"get_holiday_info failed: {e}")
+def workdays_between(start, end) -> int:
+    """[start, end] 区间（含两端）的工作日天数，基于按年预计算的工作日位图"""
+    from .holidays import workdays_between as _workdays_between
+    return _workdays_between(start, end)
 
-    return result
 
+def workday_mask(start, end):
+    """[start, end] 区间逐日工作日标记（array('B')，1=工作日）"""
+    from .holidays import workday_mask as _workday_mask
+    return _workday_mask(start, end)
@@ -36,9 +36,11 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # 自定义中间件
+    'hr_management.middleware.RBACMiddleware',
     'hr_management.middleware.SecurityHeadersMiddleware',
     'hr_management.middleware.GZipAPIMiddleware',
     'hr_management.middleware.APIPerformanceMiddleware',
+    'hr_management.middleware.CacheInvalidationMiddleware',
 ]
 
 ROOT_URLCONF = 'hr_system.urls'
@@ -117,6 +119,38 @@ else:
         }
     }
 
+# 权限缓存：L2 条目有效期（秒）与进程内 L1 LRU 容量
+PERMISSION_CACHE_TTL = config('PERMISSION_CACHE_TTL', default=6 * 3600, cast=int)
+PERMISSION_LOCAL_CACHE_SIZE = config('PERMISSION_LOCAL_CACHE_SIZE', default=1024, cast=int)
+
+# 看板/报表快照缓存：超过 soft TTL 或被标记为脏时先返回旧数据并后台重算，超过 hard TTL 才同步重建
+SNAPSHOT_CACHE_SOFT_TTL = config('SNAPSHOT_CACHE_SOFT_TTL', default=60, cast=int)
+SNAPSHOT_CACHE_HARD_TTL = config('SNAPSHOT_CACHE_HARD_TTL', default=1800, cast=int)
+SNAPSHOT_CACHE_LOCK_TTL = config('SNAPSHOT_CACHE_LOCK_TTL', default=120, cast=int)
+
+# SQL 统计：每个 API 请求记录查询数与数据库耗时（execute_wrapper，不依赖 DEBUG），
+# 同一 SQL 指纹执行次数达到阈值即视为 N+1
+DB_INSTRUMENTATION = config('DB_INSTRUMENTATION', default=True, cast=bool)
+DB_N_PLUS_ONE_THRESHOLD = config('DB_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+
+# 接口延迟直方图：配置 Redis 时各进程每 APM_HISTOGRAM_FLUSH_SECONDS 秒把增量合并到 Redis
+APM_HISTOGRAM_FLUSH_SECONDS = config('APM_HISTOGRAM_FLUSH_SECONDS', default=5, cast=int)
+
+# 审计日志批量写入：每 AUDIT_LOG_BATCH_SIZE 条或 AUDIT_LOG_FLUSH_MS 毫秒写一次，队列满时同步写入
+AUDIT_LOG_ASYNC = config('AUDIT_LOG_ASYNC', default=True, cast=bool)
+AUDIT_LOG_BATCH_SIZE = config('AUDIT_LOG_BATCH_SIZE', default=100, cast=int)
+AUDIT_LOG_FLUSH_MS = config('AUDIT_LOG_FLUSH_MS', default=500, cast=int)
+AUDIT_LOG_QUEUE_SIZE = config('AUDIT_LOG_QUEUE_SIZE', default=10000, cast=int)
+
+# 后台导出任务：独立线程池；相同规格在 EXPORT_JOB_CACHE_SECONDS 内复用产物，产物保留 EXPORT_JOB_RETENTION_HOURS 小时
+EXPORT_JOB_WORKERS = config('EXPORT_JOB_WORKERS', default=2, cast=int)
+EXPORT_JOB_MAX_PER_USER = config('EXPORT_JOB_MAX_PER_USER', default=2, cast=int)
+EXPORT_JOB_CACHE_SECONDS = config('EXPORT_JOB_CACHE_SECONDS', default=600, cast=int)
+EXPORT_JOB_RETENTION_HOURS = config('EXPORT_JOB_RETENTION_HOURS', default=24, cast=int)
+EXPORT_JOB_TIMEOUT_SECONDS = config('EXPORT_JOB_TIMEOUT_SECONDS', default=7200, cast=int)
+# 导出产物目录：不在 MEDIA_ROOT 下（/media/ 不做权限校验），只能经 export/jobs/<id>/download/ 下载
+EXPORT_ROOT = Path(config('EXPORT_ROOT', default=str(BASE_DIR / 'exports')))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -414,5 +448,5 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')  # QQ邮箱授权码
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
 
-# 节假日API配置（用于判断工作日/调休）
+# 节假日API配置：仅用于后台定期同步 HolidayCalendar，工作日判断始终查询本地日历
 HOLIDAY_API_ENABLED = config('HOLIDAY_API_ENABLED', default=True, cast=bool)